@@ -4,12 +4,48 @@ from functii import (
     listare_director,
     delete_request,
     move_request,
+    metrici_request,
+    raspuns_suprasarcina,
+    cod_raspuns,
+    seteaza_observare,
+    seteaza_token,
+)
+from threading_manager import submit_request, submit_response, RETRY_MAX_AGE
+import deduplicare
+import jurnal
+import metrici
+import observare
+import sharding
+import transmisie
+from coap_codec import (
+    decode_block,
+    decode_fragment,
+    decode_uint,
+    get_option,
+    parse_mesaj,
+    uri_path,
+    FORMAT_BINAR,
+    OPT_ACCEPT,
+    OPT_BLOCK1,
+    OPT_BLOCK2,
+    OPT_COMPRESIE,
+    OPT_CONTENT_FORMAT,
+    OPT_CRC32,
+    OPT_FRAGMENT,
+    OPT_OBSERVE,
+    OPT_SHA256,
+    OPT_SIZE1,
 )
-from threading_manager import handle_request_in_thread
 import json
+import logging
+import os
 import struct
+import time
+
+log = logging.getLogger(__name__)
 
-PAYLOAD_MARKER = 0xFF
+#decodorul implicit folosit direct (fara verificarile din json.loads, per pachet)
+_decodeaza_json = json.JSONDecoder().decode
 
 
 def parse_coap_header(data):
@@ -17,7 +53,7 @@ def parse_coap_header(data):
     if len(data) < 4:
         raise ValueError("Pachet prea scurt")
 
-    first_byte, code, msg_id = struct.unpack("!BBH", data[:4])
+    first_byte, code, msg_id = struct.unpack_from("!BBH", data)
 
     return {
         "version": (first_byte >> 6) & 0x03,
@@ -29,34 +65,133 @@ def parse_coap_header(data):
 
 
 def parse_packet(data):
-    #Parsează pachet CoAP complet
-    if PAYLOAD_MARKER in data:
-        header_part, payload_part = data.split(bytes([PAYLOAD_MARKER]), 1)
-    else:
-        header_part, payload_part = data, b""
+    #Parsează pachet CoAP complet: header, token, opțiuni, payload (coap_codec.parse_mesaj)
+    header, payload_part = parse_mesaj(data)
+    options = header["options"]
+
+    #client JSON clasic, fara optiuni
+    if not options:
+        payload = {}
+        if payload_part:
+            try:
+                payload = _decodeaza_json(str(payload_part, 'utf-8'))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                log.debug("Eroare parsare JSON")
+        return header, payload
+
+    content_format = get_option(options, OPT_CONTENT_FORMAT)
+    accept = get_option(options, OPT_ACCEPT)
+    block1 = get_option(options, OPT_BLOCK1)
 
-    header = parse_coap_header(header_part)
     payload = {}
-
-    if payload_part:
+    if block1 is not None:
+        #Block1 (RFC 7959): payload-ul e un bloc brut din fisier, oricare ar fi Content-Format
+        payload = {"content": payload_part, "binary": True, "block1": decode_block(block1)}
+        size1 = get_option(options, OPT_SIZE1)
+        if size1 is not None:
+            payload["size1"] = decode_uint(size1)
+    elif content_format is not None and decode_uint(content_format) == FORMAT_BINAR:
+        #mod binar: payload = octeții fișierului, metadatele vin din opțiuni
+        payload = {"content": payload_part, "binary": True}
+        fragment = get_option(options, OPT_FRAGMENT)
+        if fragment is not None:
+            index, total = decode_fragment(fragment)
+            payload["fragment"] = {"index": index, "total": total, "size": len(payload_part)}
+    elif payload_part:
         try:
-            payload = json.loads(payload_part.decode('utf-8'))
-        except json.JSONDecodeError:
-            print("Eroare parsare JSON")
+            payload = _decodeaza_json(str(payload_part, 'utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            log.debug("Eroare parsare JSON")
+
+    if accept is not None and decode_uint(accept) == FORMAT_BINAR and isinstance(payload, dict):
+        #clientul cere raspunsul cu continutul fisierului in mod binar
+        payload["binary"] = True
+
+    #Block2 (RFC 7959): clientul cere un anumit bloc din fisier
+    block2 = get_option(options, OPT_BLOCK2)
+    if block2 is not None and isinstance(payload, dict):
+        payload["block2"] = decode_block(block2)
+
+    #compresie deflate: payload comprimat (upload) sau acceptata in raspuns (download)
+    compresie = get_option(options, OPT_COMPRESIE)
+    if compresie is not None and isinstance(payload, dict):
+        if "content" in payload:
+            payload["encoding"] = "deflate"
+            payload["raw_size"] = decode_uint(compresie)
+        else:
+            payload["compress"] = "deflate"
+
+    #integritate: CRC32 al blocului trimis si SHA-256 al intregului fisier (upload binar/Block1)
+    crc = get_option(options, OPT_CRC32)
+    if crc is not None and isinstance(payload, dict):
+        payload["crc32"] = decode_uint(crc)
+    sha = get_option(options, OPT_SHA256)
+    if sha is not None and isinstance(payload, dict):
+        payload["sha256"] = bytes(sha).hex()
+
+    #Observe (RFC 7641): 0 = inregistrare, 1 = anulare
+    observe = get_option(options, OPT_OBSERVE)
+    if observe is not None and isinstance(payload, dict):
+        payload["observe"] = decode_uint(observe)
+
+    #calea poate veni si din Uri-Path (obligatoriu in mod binar)
+    path = uri_path(options)
+    if path and isinstance(payload, dict) and "path" not in payload:
+        payload["path"] = path
 
     return header, payload
 
 
+def primeste_pachet(data, client_addr, sock):
+    #punct comun de intrare pentru un datagram primit (mod thread si mod async)
+    metrici.primit(len(data))
+    header, payload = parse_packet(data)
+
+    # ACK/RST goale: confirmari pentru fragmentele trimise de transmisie.py
+    if header['type'] >= 2 and header['code'] == 0 and not payload:
+        if not transmisie.confirmare(client_addr, header['message_id'], header['type'] == 3):
+            observare.confirmare(client_addr, header['message_id'], header['type'] == 3)
+        return
+
+    #in modul multi-proces fragmentele unui upload merg la workerul care detine path-ul
+    if sharding.trebuie_redirectionat(header, payload):
+        sharding.redirectioneaza(data, client_addr, payload["path"])
+        return
+
+    if este_duplicat(header, client_addr, sock):
+        return
+
+    handle_request(header, payload, client_addr, sock)
+
+
+def este_duplicat(header, client_addr, sock):
+    #retransmisie a unei cereri deja primite: se retrimite raspunsul memorat, fara re-executie
+    if header["type"] > 1 or not 1 <= header["code"] <= 31:
+        return False
+    raspuns = deduplicare.inceput_cerere(client_addr, header["message_id"], header["token"])
+    if raspuns is None:
+        return False
+    #daca cererea originala e inca in lucru, raspunsul ei va pleca oricum
+    if raspuns is not deduplicare.IN_LUCRU:
+        submit_response(sock, client_addr, raspuns)
+    return True
+
+
 def handle_request(header, payload, client_addr, sock):
-    #Procesează cerere în thread separat
+    #Procesează cerere în pool-ul de workeri
     code = header.get("code")
     msg_type = header.get("type")
     msg_id = header.get("message_id")
 
-    print(f"\nCerere de la {client_addr}: Code={code}, Type={msg_type}, MsgID={msg_id}")
+    log.debug("Cerere de la %s: Code=%s, Type=%s, MsgID=%s", client_addr, code, msg_type, msg_id)
 
-    # Thread nou pentru procesare, functii in threading_manager.py
-    handle_request_in_thread(process_request, header, payload, client_addr, sock)
+    # Coada pool-ului de workeri, functii in threading_manager.py
+    if not submit_request(process_request, header, payload, client_addr, sock):
+        #coada plina - CON primeste imediat 5.03, NON se ignora
+        jurnal.esantionat(log, logging.WARNING, "suprasarcina", "Suprasarcină: cerere respinsă de la %s", client_addr)
+        deduplicare.uita(client_addr, msg_id, header.get("token", b""))
+        if msg_type == 0:
+            raspuns_suprasarcina(sock, client_addr, msg_id, RETRY_MAX_AGE, header.get("token", b""))
 
 
 def process_request(header, payload, client_addr, sock):
@@ -65,13 +200,24 @@ def process_request(header, payload, client_addr, sock):
     msg_type = header.get("type")
     msg_id = header.get("message_id")
 
+    #token-ul cererii este copiat in toate raspunsurile trimise de handler
+    seteaza_token(header.get("token", b""))
+    inceput = time.monotonic()
     try:
-        if code == 1:  # GET
+        if code == 1 and payload.get("path", "").strip("/") == metrici.PATH_METRICI:
+            #GET /.well-known/metrics: instantaneul metricilor, fara acces la storage
+            metrici_request(payload, msg_type, msg_id, client_addr, sock)
+
+        elif code == 1:  # GET
             path = payload.get("path", "")
+            observa = inregistrare_observare(payload, path, client_addr, sock, header.get("token", b""))
             if path.endswith("/"):
                 listare_director(payload, msg_type, msg_id, client_addr, sock)
             else:
                 download_request(payload, msg_type, msg_id, client_addr, sock)
+            #resursa inexistenta (raspuns de eroare): observarea nu ramane activa
+            if observa and not os.path.exists(path):
+                observare.anuleaza(client_addr, header.get("token", b""))
 
         elif code == 2:  # POST
             upload_request(payload, msg_type, msg_id, client_addr, sock)
@@ -83,9 +229,26 @@ def process_request(header, payload, client_addr, sock):
             move_request(payload, msg_type, msg_id, client_addr, sock)
 
         else:
-            print(f"Cod necunoscut: {code}")
+            log.warning("Cod necunoscut: %s", code)
 
     except Exception as e:
-        print(f"Eroare procesare: {e}")
-        import traceback
-        traceback.print_exc()
\ No newline at end of file
+        log.exception("Eroare procesare: %s", e)
+        deduplicare.uita(client_addr, msg_id, header.get("token", b""))
+    finally:
+        metrici.cerere(code, cod_raspuns(), time.monotonic() - inceput)
+        seteaza_token(b"")
+        seteaza_observare(None)
+
+
+def inregistrare_observare(payload, path, client_addr, sock, token):
+    #Observe 0: inregistrare (raspunsurile 2.xx primesc optiunea Observe);
+    #Observe 1 sau un GET simplu cu acelasi token: anulare (RFC 7641 3.6)
+    if payload.get("observe") == 0 and path:
+        seq = observare.inregistreaza(sock, client_addr, token, path)
+        if seq is None:
+            log.warning("Registru Observe plin, %s primește răspuns fără Observe", client_addr)
+            return False
+        seteaza_observare(seq)
+        return True
+    observare.anuleaza(client_addr, token)
+    return False
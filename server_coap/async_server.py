@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import deduplicare
+import jurnal
+import metrici
+import observare
+import sharding
+import threading_manager
+import transmisie
+from functii import raspuns_suprasarcina
+from Pachet import este_duplicat, parse_packet, process_request
+
+log = logging.getLogger(__name__)
+
+#numar maxim de threaduri pentru operatiile blocante pe disc (functii.py)
+MAX_IO_WORKERS = 8
+
+
+#adaptor cu aceeasi interfata ca socketul UDP (sendto), dat handlerelor din functii.py;
+#trimiterea efectiva are loc mereu pe event loop
+class SocketAsync:
+    def __init__(self, loop, transport):
+        self.loop = loop
+        self.transport = transport
+
+    def sendto(self, packet, client_addr):
+        self.loop.call_soon_threadsafe(self.transport.sendto, packet, client_addr)
+
+
+class ProtocolCoap(asyncio.DatagramProtocol):
+    def __init__(self, executor):
+        self.executor = executor
+        self.loop = None
+        self.transport = None
+        self.sock = None
+        #cereri trimise executorului si inca neterminate
+        self.in_lucru = 0
+
+    def connection_made(self, transport):
+        self.loop = asyncio.get_running_loop()
+        self.transport = transport
+        self.sock = SocketAsync(self.loop, transport)
+
+    def datagram_received(self, data, client_addr):
+        #parsare si dispatch direct pe event loop
+        self.proceseaza(data, client_addr)
+
+    def proceseaza(self, data, client_addr):
+        metrici.primit(len(data))
+        try:
+            header, payload = parse_packet(data)
+        except Exception as e:
+            log.debug("Eroare parsare: %s", e)
+            return
+
+        # ACK/RST goale: confirmari pentru fragmentele trimise de transmisie.py
+        if header['type'] >= 2 and header['code'] == 0 and not payload:
+            if not transmisie.confirmare(client_addr, header['message_id'], header['type'] == 3):
+                observare.confirmare(client_addr, header['message_id'], header['type'] == 3)
+            return
+
+        if sharding.trebuie_redirectionat(header, payload):
+            sharding.redirectioneaza(data, client_addr, payload["path"])
+            return
+
+        if este_duplicat(header, client_addr, self.sock):
+            return
+
+        log.debug("Cerere de la %s: Code=%s, Type=%s, MsgID=%s",
+                  client_addr, header['code'], header['type'], header['message_id'])
+
+        #aceeasi limita de admitere ca pool-ul din modul thread
+        if self.in_lucru >= threading_manager.REQUEST_QUEUE_SIZE:
+            jurnal.esantionat(log, logging.WARNING, "suprasarcina", "Suprasarcină: cerere respinsă de la %s",
+                              client_addr)
+            deduplicare.uita(client_addr, header['message_id'], header['token'])
+            if header['type'] == 0:
+                raspuns_suprasarcina(self.sock, client_addr, header['message_id'],
+                                     threading_manager.RETRY_MAX_AGE, header['token'])
+            return
+
+        #handlerele fac I/O pe disc, deci ruleaza in executorul limitat
+        self.in_lucru += 1
+        future = self.loop.run_in_executor(self.executor, process_request, header, payload, client_addr, self.sock)
+        future.add_done_callback(self._cerere_terminata)
+
+    def _cerere_terminata(self, future):
+        self.in_lucru -= 1
+        _verifica_eroare(future)
+
+    def error_received(self, exc):
+        log.warning("Eroare socket: %s", exc)
+
+
+#primeste datagramele redirectionate de ceilalti workeri (mod multi-proces)
+class ProtocolIntern(asyncio.DatagramProtocol):
+    def __init__(self, protocol_public):
+        self.protocol_public = protocol_public
+
+    def datagram_received(self, data, addr):
+        try:
+            original, client_addr = sharding.decodeaza_redirectionat(data)
+        except Exception as e:
+            log.warning("Eroare redirectionare: %s", e)
+            return
+        if original is not None:
+            self.protocol_public.proceseaza(original, client_addr)
+
+
+def _verifica_eroare(future):
+    if not future.cancelled() and future.exception() is not None:
+        log.error("Eroare procesare cerere: %s", future.exception(), exc_info=future.exception())
+
+
+async def _serveste(server_sock, sock_intern, executor):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(lambda: ProtocolCoap(executor), sock=server_sock)
+    transport_intern = None
+    if sock_intern is not None:
+        transport_intern, _ = await loop.create_datagram_endpoint(lambda: ProtocolIntern(protocol), sock=sock_intern)
+    try:
+        #asteptam pana la oprire (KeyboardInterrupt anuleaza taskul)
+        await loop.create_future()
+    finally:
+        transport.close()
+        if transport_intern is not None:
+            transport_intern.close()
+
+
+#porneste serverul in mod async pe un socket deja legat la port
+def ruleaza(server_sock, sock_intern=None):
+    executor = ThreadPoolExecutor(max_workers=MAX_IO_WORKERS, thread_name_prefix="coap-io")
+    threading_manager.set_trimitere_directa(True)
+    try:
+        log.info("Mod async - așteaptă cereri")
+        asyncio.run(_serveste(server_sock, sock_intern, executor))
+    except KeyboardInterrupt:
+        log.info("Oprire server")
+    finally:
+        executor.shutdown(wait=True)
+        threading_manager.set_trimitere_directa(False)
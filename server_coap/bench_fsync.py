@@ -0,0 +1,50 @@
+#throughput-ul upload-urilor pentru fiecare politica de durabilitate (main.py --fsync always|group|async):
+#aceeasi incarcare (bench_incarcare.py, implicit doar upload-uri mici) pe cate un server nou per politica
+#rulare: python bench_fsync.py [--politici always,group,async] [--rezultat fsync.json] [argumente bench_incarcare]
+#serverul ruleaza implicit sub directorul curent: pe tmpfs fsync-ul nu costa nimic si politicile nu difera
+import argparse
+import json
+import os
+
+import bench_incarcare
+import durabilitate
+
+IMPLICIT = ["--mix", "upload=100", "--durata", "10", "--concurenta", "16"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput per politica fsync",
+                                     epilog="restul argumentelor sunt trimise la bench_incarcare.py")
+    parser.add_argument("--politici", default=",".join(durabilitate.POLITICI))
+    parser.add_argument("--rezultat", default=None, help="fisierul JSON cu rezultatele tuturor politicilor")
+    args, rest = parser.parse_known_args()
+
+    rezultate = {}
+    for politica in args.politici.split(","):
+        if politica not in durabilitate.POLITICI:
+            parser.error(f"politica necunoscuta: {politica}")
+        bench = bench_incarcare.parser_argumente().parse_args(IMPLICIT + ["--director", os.getcwd()] + rest)
+        if bench.extern:
+            parser.error("--extern nu are sens aici: fiecare politica are serverul ei")
+        bench.server_arg = bench.server_arg + [f"--fsync={politica}"]
+        print(f"== {politica}")
+        rezultate[politica] = bench_incarcare.ruleaza(bench)
+        bench_incarcare.afiseaza(rezultate[politica])
+
+    print(f"\n{'politica':<10}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'p999 ms':>10}{'erori':>8}{'fsync':>10}{'lot mediu':>11}")
+    for politica, rezultat in rezultate.items():
+        total = rezultat["total"]
+        stats = rezultat["metrici_server"].get("durabilitate", {})
+        lot = stats["fisiere_in_loturi"] / stats["loturi"] if stats.get("loturi") else None
+        print(f"{politica:<10}{total['ops_pe_s']:>10.1f}{bench_incarcare._ms(total['p50_ms'])}"
+              f"{bench_incarcare._ms(total['p99_ms'])}{bench_incarcare._ms(total['p999_ms'])}"
+              f"{total['erori']:>8}{stats.get('sincronizari', 0):>10}{f'{lot:.1f}' if lot else '-':>11}")
+
+    if args.rezultat:
+        with open(args.rezultat, "w") as f:
+            json.dump(rezultate, f, indent=1)
+        print(f"Rezultate salvate in {args.rezultat}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+#generator de incarcare end-to-end: porneste serverul local (sau foloseste unul existent) si il
+#incarca peste loopback cu un amestec de operatii, de la mai multi clienti in paralel
+#rulare: python bench_incarcare.py [--durata 20] [--concurenta 8] [--mix upload=30,download=40,...]
+#                                  [--pierderi 0.01] [--marime-max 1048576] [--rezultat fisier.json]
+#        python bench_incarcare.py --compara vechi.json nou.json
+#rezultatele (throughput, p50/p99/p999, RSS server) sunt salvate in JSON, cu revizia git, ca doua
+#revizii sa poata fi comparate cu --compara
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from coap_codec import construieste_pachet, parse_mesaj
+import fragmentare_pachet as frag
+import metrici
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+#retransmisia CON a clientului (RFC 7252 4.2), cu timeout scurt pentru loopback
+ACK_TIMEOUT = 0.5
+MAX_RETRANSMIT = 4
+#download fragmentat: dupa aceasta pauza fara fragmente noi se cer cele lipsa
+PAUZA_FRAGMENTE = 1.0
+RUNDE_RETRANSMISIE = 5
+
+MIX_IMPLICIT = "upload=25,fragmentat=10,download=40,listare=10,delete=8,move=7"
+MARIME_MICA_MAX = 8000
+PERCENTILE = (("p50", 0.5), ("p99", 0.99), ("p999", 0.999))
+
+
+#un client CoAP minimal: un socket, cereri CON cu retransmisie, pierderi simulate la trimitere
+#si la primire (pachetul e pur si simplu ignorat)
+class Client:
+    def __init__(self, adresa, pierderi, seed):
+        self.adresa = adresa
+        self.pierderi = pierderi
+        self.rng = random.Random(seed)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.msg_id = self.rng.randrange(0x10000)
+        #fragmente sosite inaintea raspunsului cererii (raspunsul trece prin coada serverului)
+        self.devreme = []
+
+    def _trimite(self, packet):
+        if self.rng.random() >= self.pierderi:
+            self.sock.sendto(packet, self.adresa)
+
+    def _primeste(self, deadline):
+        while True:
+            ramas = deadline - time.monotonic()
+            if ramas <= 0:
+                return None, None
+            self.sock.settimeout(ramas)
+            try:
+                data, _ = self.sock.recvfrom(65535)
+            except socket.timeout:
+                return None, None
+            if self.rng.random() < self.pierderi:
+                continue
+            header, payload = parse_mesaj(data)
+            #fragmentele CON (download) sunt confirmate cu un ACK gol
+            if header["type"] == 0 and header["code"] != 0:
+                self._trimite(construieste_pachet(2, 0, header["message_id"]))
+            return header, bytes(payload)
+
+    def cerere(self, code, payload):
+        #(cod raspuns, corp JSON sau None, token); None daca nu a venit niciun raspuns
+        self.msg_id = (self.msg_id + 1) & 0xFFFF
+        token = os.urandom(4)
+        self.devreme = []
+        packet = construieste_pachet(0, code, self.msg_id, json.dumps(payload).encode("utf-8"), token)
+        timeout = ACK_TIMEOUT * self.rng.uniform(1.0, 1.5)
+        for _ in range(MAX_RETRANSMIT + 1):
+            self._trimite(packet)
+            deadline = time.monotonic() + timeout
+            while True:
+                header, corp = self._primeste(deadline)
+                if header is None:
+                    break
+                #raspunsul cererii curente; fragmentele ei sunt pastrate, restul (fragmente
+                #intarziate ale altor cereri) e ignorat
+                if bytes(header["token"]) != token:
+                    continue
+                if header["type"] >= 2 and header["message_id"] == self.msg_id:
+                    return header["code"], _json(corp), token
+                if header["type"] == 0:
+                    self.devreme.append(corp)
+            timeout *= 2
+        return None, None, token
+
+    def fragmente(self, token, total, primite):
+        #colecteaza fragmentele unui download pana sunt toate sau pana la o pauza
+        for corp in self.devreme:
+            self._fragment(corp, primite)
+        self.devreme = []
+        deadline = time.monotonic() + PAUZA_FRAGMENTE
+        while len(primite) < total:
+            header, corp = self._primeste(deadline)
+            if header is None:
+                return
+            if bytes(header["token"]) != token:
+                continue
+            self._fragment(corp, primite)
+            deadline = time.monotonic() + PAUZA_FRAGMENTE
+
+    def _fragment(self, corp, primite):
+        fragment = _json(corp)
+        if fragment and "fragment" in fragment:
+            primite[fragment["fragment"]["index"]] = len(fragment.get("content", ""))
+
+    def close(self):
+        self.sock.close()
+
+
+def _json(corp):
+    try:
+        return json.loads(corp) if corp else None
+    except ValueError:
+        return None
+
+
+def _ok(cod):
+    return cod is not None and 64 <= cod < 128
+
+
+#operatiile; fiecare intoarce (succes, octeti de continut transferati)
+def op_upload(client, stare, marime):
+    path = f"{stare['dir']}/f{stare['contor']}.bin"
+    stare["contor"] += 1
+    data = client.rng.randbytes(marime)
+    content = base64.b64encode(data).decode("ascii")
+    if len(content) <= frag.MAX_PAYLOAD_SIZE:
+        cod, _, _ = client.cerere(2, {"path": path, "content": content})
+    else:
+        #fragmentat, stop-and-wait: fiecare fragment e o cerere CON
+        total = frag.fragmente_necesare(content)
+        for i in range(total):
+            bucata = content[i * frag.MAX_PAYLOAD_SIZE:(i + 1) * frag.MAX_PAYLOAD_SIZE]
+            cod, _, _ = client.cerere(2, {"path": path, "content": bucata,
+                                          "fragment": {"index": i, "total": total, "size": len(bucata)}})
+            if not _ok(cod):
+                break
+    if _ok(cod):
+        stare["fisiere"].append(path)
+    return _ok(cod), marime
+
+
+def op_download(client, stare):
+    path = client.rng.choice(stare["fisiere"])
+    cod, info, token = client.cerere(1, {"path": path})
+    if not _ok(cod) or info is None:
+        return False, 0
+    if not info.get("fragmented"):
+        return True, info.get("size", 0)
+
+    total = info["total_fragments"]
+    primite = {}
+    client.fragmente(token, total, primite)
+    for _ in range(RUNDE_RETRANSMISIE):
+        if len(primite) == total:
+            break
+        #retransmisie selectiva pentru fragmentele pierdute
+        lipsa = [i for i in range(total) if i not in primite]
+        cod, _, token = client.cerere(1, {"path": path, "missing": lipsa, "etag": info.get("etag")})
+        if not _ok(cod):
+            return False, 0
+        client.fragmente(token, total, primite)
+    return len(primite) == total, info.get("size", 0)
+
+
+def op_listare(client, stare):
+    cod, corp, _ = client.cerere(1, {"path": stare["dir"] + "/", "limit": 100})
+    return _ok(cod), len(json.dumps(corp)) if corp else 0
+
+
+def op_delete(client, stare):
+    path = stare["fisiere"].pop(client.rng.randrange(len(stare["fisiere"])))
+    cod, _, _ = client.cerere(4, {"path": path})
+    return _ok(cod), 0
+
+
+def op_move(client, stare):
+    i = client.rng.randrange(len(stare["fisiere"]))
+    destinatie = f"{stare['dir']}/m{stare['contor']}.bin"
+    stare["contor"] += 1
+    cod, _, _ = client.cerere(5, {"source": stare["fisiere"][i], "destination": destinatie})
+    if _ok(cod):
+        stare["fisiere"][i] = destinatie
+    return _ok(cod), 0
+
+
+def marime_fragmentata(rng, marime_min, marime_max):
+    #distributie log-uniforma: multe fisiere mici, cateva mari
+    return int(math.exp(rng.uniform(math.log(marime_min), math.log(marime_max))))
+
+
+def executa(client, stare, op, args):
+    #operatiile care au nevoie de un fisier existent devin upload cat timp clientul nu are fisiere
+    if op in ("download", "delete", "move") and not stare["fisiere"]:
+        op = "upload"
+    if op == "upload":
+        return op, op_upload(client, stare, client.rng.randint(16, MARIME_MICA_MAX))
+    if op == "fragmentat":
+        return op, op_upload(client, stare, marime_fragmentata(client.rng, args.marime_min, args.marime_max))
+    if op == "download":
+        return op, op_download(client, stare)
+    if op == "listare":
+        return op, op_listare(client, stare)
+    if op == "delete":
+        return op, op_delete(client, stare)
+    return op, op_move(client, stare)
+
+
+def worker(index, args, mix, sfarsit, rezultate, lock):
+    client = Client(("127.0.0.1", args.port), args.pierderi, args.seed + index)
+    stare = {"dir": f"storage/bench/w{index}", "fisiere": [], "contor": 0}
+    operatii, ponderi = zip(*mix.items())
+    local = {}
+    try:
+        while time.monotonic() < sfarsit:
+            op = client.rng.choices(operatii, ponderi)[0]
+            inceput = time.monotonic()
+            op, (succes, octeti) = executa(client, stare, op, args)
+            durata = time.monotonic() - inceput
+            r = local.setdefault(op, {"latente": [], "erori": 0, "octeti": 0})
+            if succes:
+                r["latente"].append(durata)
+                r["octeti"] += octeti
+            else:
+                r["erori"] += 1
+    finally:
+        client.close()
+        with lock:
+            for op, r in local.items():
+                total = rezultate.setdefault(op, {"latente": [], "erori": 0, "octeti": 0})
+                total["latente"].extend(r["latente"])
+                total["erori"] += r["erori"]
+                total["octeti"] += r["octeti"]
+
+
+def percentila(valori_sortate, p):
+    if not valori_sortate:
+        return None
+    i = min(len(valori_sortate) - 1, max(0, math.ceil(p * len(valori_sortate)) - 1))
+    return valori_sortate[i]
+
+
+def rezumat(latente, erori, octeti, durata):
+    latente = sorted(latente)
+    r = {
+        "operatii": len(latente),
+        "erori": erori,
+        "ops_pe_s": round(len(latente) / durata, 2),
+        "octeti_pe_s": round(octeti / durata),
+        "medie_ms": round(sum(latente) / len(latente) * 1000, 3) if latente else None,
+    }
+    for nume, p in PERCENTILE:
+        v = percentila(latente, p)
+        r[nume + "_ms"] = round(v * 1000, 3) if v is not None else None
+    return r
+
+
+#RSS-ul procesului server, esantionat periodic din /proc (Linux)
+class MonitorRSS:
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.valori = []
+        self.oprit = threading.Event()
+        self.thread = threading.Thread(target=self._bucla, daemon=True)
+
+    def citeste(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for linie in f:
+                    if linie.startswith("VmRSS:"):
+                        return int(linie.split()[1])
+        except OSError:
+            return None
+        return None
+
+    def _bucla(self):
+        while not self.oprit.wait(self.interval):
+            v = self.citeste()
+            if v is not None:
+                self.valori.append(v)
+
+    def porneste(self):
+        self.thread.start()
+
+    def opreste(self):
+        self.oprit.set()
+        self.thread.join()
+        if not self.valori:
+            return None
+        return {"max_kb": max(self.valori), "final_kb": self.valori[-1],
+                "medie_kb": round(sum(self.valori) / len(self.valori))}
+
+
+def porneste_server(args):
+    #serverul ruleaza intr-un director temporar (storage/ propriu), cu jurnal doar pentru erori
+    director = tempfile.mkdtemp(prefix="coap-bench-", dir=args.director)
+    comanda = [sys.executable, os.path.join(DIR, "main.py"), "--port", str(args.port),
+               "--mod", args.mod, "--log-nivel", "WARNING"] + args.server_arg
+    proc = subprocess.Popen(comanda, cwd=director)
+    return proc, director
+
+
+def asteapta_server(port, timeout=10.0):
+    client = Client(("127.0.0.1", port), 0.0, 0)
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            cod, corp, _ = client.cerere(1, {"path": metrici.PATH_METRICI})
+            if _ok(cod):
+                return corp
+        raise RuntimeError("Serverul nu raspunde")
+    finally:
+        client.close()
+
+
+def revizie_git():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parseaza_mix(text):
+    mix = {}
+    for parte in text.split(","):
+        nume, _, pondere = parte.partition("=")
+        if nume not in ("upload", "fragmentat", "download", "listare", "delete", "move"):
+            raise ValueError(f"Operatie necunoscuta in mix: {nume}")
+        if float(pondere) > 0:
+            mix[nume] = float(pondere)
+    return mix
+
+
+def ruleaza(args):
+    mix = parseaza_mix(args.mix)
+    proc = director = monitor = None
+    if args.pid is None and not args.extern:
+        proc, director = porneste_server(args)
+        args.pid = proc.pid
+    try:
+        asteapta_server(args.port)
+        if args.pid is not None:
+            monitor = MonitorRSS(args.pid)
+            monitor.porneste()
+
+        rezultate = {}
+        lock = threading.Lock()
+        inceput = time.monotonic()
+        sfarsit = inceput + args.durata
+        threaduri = [threading.Thread(target=worker, args=(i, args, mix, sfarsit, rezultate, lock))
+                     for i in range(args.concurenta)]
+        for t in threaduri:
+            t.start()
+        for t in threaduri:
+            t.join()
+        durata = time.monotonic() - inceput
+
+        rss = monitor.opreste() if monitor else None
+        metrici_server = asteapta_server(args.port)
+    finally:
+        if proc is not None:
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            shutil.rmtree(director, ignore_errors=True)
+
+    operatii = {op: rezumat(r["latente"], r["erori"], r["octeti"], durata) for op, r in sorted(rezultate.items())}
+    toate = [l for r in rezultate.values() for l in r["latente"]]
+    total = rezumat(toate, sum(r["erori"] for r in rezultate.values()),
+                    sum(r["octeti"] for r in rezultate.values()), durata)
+    return {
+        "revizie": revizie_git(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "argumente": {k: v for k, v in vars(args).items() if k not in ("compara", "rezultat", "pid")},
+        "durata_s": round(durata, 3),
+        "operatii": operatii,
+        "total": total,
+        "rss_server": rss,
+        "metrici_server": metrici_server,
+    }
+
+
+def afiseaza(rezultat):
+    print(f"{'operatie':<12}{'ops':>8}{'erori':>7}{'ops/s':>10}{'MB/s':>8}"
+          f"{'p50 ms':>10}{'p99 ms':>10}{'p999 ms':>10}")
+    randuri = list(rezultat["operatii"].items()) + [("TOTAL", rezultat["total"])]
+    for op, r in randuri:
+        print(f"{op:<12}{r['operatii']:>8}{r['erori']:>7}{r['ops_pe_s']:>10.1f}"
+              f"{r['octeti_pe_s'] / 1e6:>8.2f}{_ms(r['p50_ms'])}{_ms(r['p99_ms'])}{_ms(r['p999_ms'])}")
+    rss = rezultat["rss_server"]
+    if rss:
+        print(f"RSS server: max {rss['max_kb'] / 1024:.1f} MB, final {rss['final_kb'] / 1024:.1f} MB")
+
+
+def _ms(v):
+    return f"{v:>10.2f}" if v is not None else f"{'-':>10}"
+
+
+def compara(vechi_path, nou_path):
+    #diferentele intre doua rulari salvate: throughput si latente per operatie
+    with open(vechi_path) as f:
+        vechi = json.load(f)
+    with open(nou_path) as f:
+        nou = json.load(f)
+    print(f"{vechi.get('revizie')} → {nou.get('revizie')}")
+    print(f"{'operatie':<12}{'metrica':<10}{'vechi':>12}{'nou':>12}{'diferenta':>12}")
+    ops = sorted(set(vechi["operatii"]) & set(nou["operatii"])) + ["TOTAL"]
+    for op in ops:
+        a = vechi["total"] if op == "TOTAL" else vechi["operatii"][op]
+        b = nou["total"] if op == "TOTAL" else nou["operatii"][op]
+        for metrica in ("ops_pe_s", "p50_ms", "p99_ms", "p999_ms"):
+            x, y = a.get(metrica), b.get(metrica)
+            if x is None or y is None:
+                continue
+            dif = f"{(y - x) / x * 100:+.1f}%" if x else "-"
+            print(f"{op:<12}{metrica:<10}{x:>12.2f}{y:>12.2f}{dif:>12}")
+    for cheie in ("max_kb", "final_kb"):
+        x = (vechi.get("rss_server") or {}).get(cheie)
+        y = (nou.get("rss_server") or {}).get(cheie)
+        if x and y:
+            print(f"{'RSS':<12}{cheie:<10}{x:>12}{y:>12}{(y - x) / x * 100:>+11.1f}%")
+
+
+def parser_argumente():
+    parser = argparse.ArgumentParser(description="Generator de incarcare pentru serverul CoAP")
+    parser.add_argument("--port", type=int, default=5799)
+    parser.add_argument("--durata", type=float, default=20.0, help="secunde de incarcare")
+    parser.add_argument("--concurenta", type=int, default=8, help="clienti in paralel")
+    parser.add_argument("--mix", default=MIX_IMPLICIT, help="ponderile operatiilor")
+    parser.add_argument("--marime-min", type=int, default=32 * 1024, help="upload fragmentat: marime minima")
+    parser.add_argument("--marime-max", type=int, default=1024 * 1024, help="upload fragmentat: marime maxima")
+    parser.add_argument("--pierderi", type=float, default=0.0,
+                        help="probabilitatea de pierdere a unui pachet, simulata la client in ambele sensuri")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mod", choices=["thread", "async"], default="thread", help="modul serverului pornit")
+    parser.add_argument("--server-arg", action="append", default=[],
+                        help="argument suplimentar pentru main.py (ex. --server-arg=--stocare=chunk)")
+    parser.add_argument("--director", default=None,
+                        help="unde e creat directorul temporar al serverului (fsync-ul depinde de disc)")
+    parser.add_argument("--extern", action="store_true", help="foloseste un server deja pornit pe --port")
+    parser.add_argument("--pid", type=int, default=None, help="pid-ul serverului extern, pentru RSS")
+    parser.add_argument("--rezultat", default=None, help="fisierul JSON cu rezultatele")
+    parser.add_argument("--compara", nargs=2, metavar=("VECHI", "NOU"), help="compara doua rezultate salvate")
+    return parser
+
+
+def main():
+    args = parser_argumente().parse_args()
+
+    if args.compara:
+        compara(*args.compara)
+        return
+
+    rezultat = ruleaza(args)
+    afiseaza(rezultat)
+
+    path = args.rezultat or os.path.join(
+        "bench_rezultate", f"{rezultat['revizie'] or 'local'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(rezultat, f, indent=1)
+    print(f"Rezultate salvate in {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#microbenchmark pentru functiile apelate per pachet: parsare, construirea raspunsurilor,
+#fragmentare si asamblarea fragmentelor; timp (us) si alocari (tracemalloc) per operatie
+#rulare: python bench_micro.py [--repetari N] [--filtru text] [--rezultat baza.json]
+#        python bench_micro.py --referinta baza.json [--prag 10]   (iese cu 1 la regresie)
+#        python bench_micro.py --vechi [--rulari 15]   (parserul/constructorul dinaintea RFC 7252, ca referinta)
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from coap_codec import (
+    construieste_pachet,
+    encode_block,
+    encode_uint,
+    FORMAT_BINAR,
+    OPT_BLOCK1,
+    OPT_CONTENT_FORMAT,
+    OPT_URI_PATH,
+)
+import fragmentare_pachet as frag
+import functii
+import threading_manager
+from bench_incarcare import revizie_git
+from Pachet import parse_coap_header, parse_packet
+
+PAYLOAD_MARKER = 0xFF
+
+
+#implementarile dinaintea parserului RFC 7252, pastrate ca referinta
+def parse_packet_vechi(data):
+    if PAYLOAD_MARKER in data:
+        header_part, payload_part = data.split(bytes([PAYLOAD_MARKER]), 1)
+    else:
+        header_part, payload_part = data, b""
+
+    first_byte, code, msg_id = struct.unpack("!BBH", header_part[:4])
+    header = {
+        "version": (first_byte >> 6) & 0x03,
+        "type": (first_byte >> 4) & 0x03,
+        "tkl": first_byte & 0x0F,
+        "code": code,
+        "message_id": msg_id
+    }
+    payload = {}
+    if payload_part:
+        payload = json.loads(payload_part.decode('utf-8'))
+    return header, payload
+
+
+def build_response_vechi(msg_id, payload, code=69, msg_type=2):
+    first_byte = (1 << 6) | (msg_type << 4)
+    header = struct.pack("!BBH", first_byte, code, msg_id)
+    return header + bytes([PAYLOAD_MARKER]) + payload
+
+
+def _pachete():
+    get_mic = struct.pack("!BBH", 0x40, 1, 1) + b"\xff" + json.dumps({"path": "storage/a/b.txt"}).encode()
+
+    content = base64.b64encode(bytes(range(256)) * 40)[:frag.MAX_PAYLOAD_SIZE].decode()
+    fragment = {"path": "storage/big.bin", "content": content,
+                "fragment": {"index": 3, "total": 10, "size": len(content)}}
+    post_fragment = struct.pack("!BBH", 0x40, 2, 7) + b"\xff" + json.dumps(fragment).encode()
+
+    options = [(OPT_URI_PATH, b"storage"), (OPT_URI_PATH, b"big.bin"),
+               (OPT_CONTENT_FORMAT, encode_uint(FORMAT_BINAR))]
+    post_binar = construieste_pachet(0, 2, 9, bytes(range(256)) * 53, b"\x01\x02\x03\x04", options)
+
+    return {
+        "GET json mic": get_mic,
+        "POST fragment json": post_fragment,
+        "POST binar + token + optiuni": post_binar,
+    }
+
+
+class _SocketNul:
+    #build_response trimite direct pe socket (fara coada de raspunsuri); aici se masoara
+    #doar construirea pachetului, fara apelul de sistem
+    def sendto(self, data, addr):
+        return len(data)
+
+
+def _fragment_json(index, total):
+    #un fragment plin: RAW_CHUNK octeti = MAX_PAYLOAD_SIZE caractere base64
+    content = base64.b64encode(os.urandom(frag.RAW_CHUNK)).decode()
+    return {"path": "storage/big.bin", "content": content,
+            "fragment": {"index": index, "total": total, "size": len(content)}}
+
+
+def _bench_asamblare(binar):
+    #fragmente consecutive ale unui upload care nu se incheie (fara fsync-ul final),
+    #deci se masoara costul per fragment in regim stationar; fiecare rulare are upload-ul ei
+    asamblare = _bench_asamblare.instanta
+    if binar:
+        content = bytes(range(256)) * (frag.MAX_BINARY_PAYLOAD // 256)
+    else:
+        content = _fragment_json(0, 2)["content"]
+    stare = {"path": None, "index": 0, "total": 2, "rulare": 0}
+
+    def pregateste(numar):
+        if stare["path"] is not None:
+            asamblare.clear_path(stare["path"])
+        stare["rulare"] += 1
+        stare["path"] = f"bench/{binar}/{stare['rulare']}"
+        stare["index"] = 0
+        stare["total"] = numar + 2
+
+    def op():
+        asamblare.add_fragment(stare["path"], stare["index"], stare["total"], content)
+        stare["index"] += 1
+
+    return op, pregateste
+
+
+def benchmarks():
+    #nume -> (op fara argumente, pregateste(numar) sau None); marimile acopera un pachet mic,
+    #un fragment plin si upload-uri mari pentru split_payload
+    sock = _SocketNul()
+    addr = ("127.0.0.1", 5683)
+    token = b"\x01\x02\x03\x04"
+    rezultat = {}
+
+    pachete = _pachete()
+    bloc = bytes(range(256)) * 4
+    pachete["POST Block1 1024 B"] = construieste_pachet(
+        0, 2, 11, bloc, token, [(OPT_URI_PATH, b"storage"), (OPT_URI_PATH, b"big.bin"),
+                                (OPT_BLOCK1, encode_block(5, True, 6))])
+    for nume, data in pachete.items():
+        rezultat["parse_coap_header " + nume] = ((lambda d=data: parse_coap_header(d)), None)
+        rezultat["parse_packet " + nume] = ((lambda d=data: parse_packet(d)), None)
+
+    for marime in (64, 1024, frag.MAX_PAYLOAD_SIZE):
+        payload = b"x" * marime
+        rezultat[f"build_response {marime} B"] = (
+            (lambda p=payload: functii.build_response(sock, addr, 1, p, token=token)), None)
+
+    for marime in (16 * 1024, 256 * 1024, 4 * 1024 * 1024):
+        content = base64.b64encode(os.urandom(marime)).decode()
+        rezultat[f"split_payload {marime // 1024} KiB"] = (
+            (lambda c=content: frag.split_payload(c, "storage/big.bin")), None)
+
+    fragment = _fragment_json(3, 10)
+    rezultat["build_fragment_pachet fragment plin"] = (
+        (lambda: frag.build_fragment_pachet(69, fragment, 7, token=token)), None)
+
+    rezultat["add_fragment json"] = _bench_asamblare(False)
+    rezultat["add_fragment binar"] = _bench_asamblare(True)
+    return rezultat
+
+
+def _masoara_pereche(vechi, nou, arg, repetari, rulari):
+    #rulari alternate vechi/nou cu acelasi numar fix de apeluri, deci zgomotul masinii (frecventa,
+    #alte procese) loveste ambele variante la fel; timpii in us per operatie, pe rulari
+    timpi_vechi, timpi_nou = [], []
+    for _ in range(rulari):
+        timpi_vechi.append(timeit.timeit(lambda: vechi(arg), number=repetari) / repetari * 1e6)
+        timpi_nou.append(timeit.timeit(lambda: nou(arg), number=repetari) / repetari * 1e6)
+    return timpi_vechi, timpi_nou
+
+
+def _raport_pereche(nume, timpi_vechi, timpi_nou):
+    #cel mai bun timp al fiecarei variante, imprastierea (median fata de minim) si castigul:
+    #cel dintre minime si intervalul castigurilor pe rulari; "zgomot" daca intervalul contine 1x
+    vechi, nou = min(timpi_vechi), min(timpi_nou)
+    castiguri = sorted(v / n for v, n in zip(timpi_vechi, timpi_nou))
+    imprastiere = max(statistics.median(timpi_vechi) / vechi, statistics.median(timpi_nou) / nou) - 1
+    verdict = "zgomot" if castiguri[0] <= 1 <= castiguri[-1] else ("mai rapid" if castiguri[0] > 1 else "mai lent")
+    print(f"{nume:<36}{vechi:>10.2f}{nou:>10.2f}{vechi / nou:>8.2f}x"
+          f"{castiguri[0]:>8.2f}-{castiguri[-1]:<6.2f}{imprastiere * 100:>7.1f}%  {verdict}")
+
+
+def _numar(op, pregateste, repetari):
+    #cate apeluri per rulare: cel putin ~20 ms masurati, dar nu peste --repetari
+    if pregateste:
+        pregateste(1)
+    inceput = time.perf_counter()
+    op()
+    durata = max(time.perf_counter() - inceput, 1e-7)
+    return max(1, min(repetari, int(0.02 / durata)))
+
+
+def masoara_timp(op, pregateste, repetari, rulari=9):
+    #cel mai bun din rulari, in microsecunde per operatie (minimul e cel mai putin zgomotos)
+    numar = _numar(op, pregateste, repetari)
+    timpi = []
+    for _ in range(rulari):
+        if pregateste:
+            pregateste(numar)
+        timpi.append(timeit.timeit(op, number=numar))
+    return min(timpi) / numar * 1e6
+
+
+def masoara_alocari(op, pregateste, numar=200):
+    #per operatie: varful memoriei alocate temporar si memoria ramasa alocata dupa apel (octeti)
+    if pregateste:
+        pregateste(numar + 1)
+    op()
+    varf = retinut = 0
+    tracemalloc.start()
+    try:
+        for _ in range(numar):
+            inainte = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            op()
+            curent, maxim = tracemalloc.get_traced_memory()
+            varf += maxim - inainte
+            retinut += curent - inainte
+    finally:
+        tracemalloc.stop()
+    return varf / numar, retinut / numar
+
+
+def ruleaza(args):
+    rezultate = {}
+    print(f"{'operatie':<52}{'us/op':>10}{'varf B/op':>12}{'retinut B/op':>14}")
+    for nume, (op, pregateste) in benchmarks().items():
+        if args.filtru and args.filtru not in nume:
+            continue
+        us = masoara_timp(op, pregateste, args.repetari)
+        varf, retinut = masoara_alocari(op, pregateste, min(args.repetari, 200))
+        rezultate[nume] = {"us": round(us, 3), "varf_b": round(varf), "retinut_b": round(retinut)}
+        print(f"{nume:<52}{us:>10.2f}{varf:>12.0f}{retinut:>14.0f}")
+    return rezultate
+
+
+def regresii(rezultate, referinta, prag):
+    #operatiile mai lente (sau care aloca mai mult) decat referinta cu peste prag %;
+    #alocarile au o toleranta absoluta de 64 B (tracemalloc numara si obiecte interne mici)
+    gasite = []
+    print(f"\n{'operatie':<52}{'ref us':>10}{'us':>10}{'dif':>9}{'ref varf':>10}{'varf':>10}")
+    for nume, r in rezultate.items():
+        vechi = referinta.get(nume)
+        if vechi is None:
+            continue
+        dif = (r["us"] - vechi["us"]) / vechi["us"] * 100
+        marcaj = ""
+        if dif > prag:
+            gasite.append(f"{nume}: {vechi['us']:.2f} → {r['us']:.2f} us (+{dif:.1f}%)")
+            marcaj = " !"
+        if r["varf_b"] > vechi["varf_b"] * (1 + prag / 100) + 64:
+            gasite.append(f"{nume}: varf alocari {vechi['varf_b']} → {r['varf_b']} B")
+            marcaj = " !"
+        print(f"{nume:<52}{vechi['us']:>10.2f}{r['us']:>10.2f}{dif:>+8.1f}%"
+              f"{vechi['varf_b']:>10}{r['varf_b']:>10}{marcaj}")
+    return gasite
+
+
+def compara_vechi(repetari, rulari):
+    #numar fix de apeluri per rulare (--repetari) si cel mai bun din --rulari
+    print(f"{repetari} apeluri x {rulari} rulari, alternate vechi/nou")
+    print(f"{'operatie':<36}{'vechi us':>10}{'nou us':>10}{'castig':>9}{'interval':>14}{'impr.':>8}")
+
+    for nume, data in _pachete().items():
+        try:
+            parse_packet_vechi(data)
+        except (ValueError, UnicodeDecodeError):
+            #parserul vechi nu suporta payload binar
+            nou = min(timeit.repeat(lambda: parse_packet(data), number=repetari, repeat=rulari)) / repetari * 1e6
+            print(f"{'parse ' + nume:<36}{'-':>10}{nou:>10.2f}")
+            continue
+        _raport_pereche("parse " + nume, *_masoara_pereche(parse_packet_vechi, parse_packet, data, repetari, rulari))
+
+    for marime in (64, 1024, frag.MAX_PAYLOAD_SIZE):
+        timpi = _masoara_pereche(lambda p: build_response_vechi(1, p), lambda p: construieste_pachet(2, 69, 1, p),
+                                 b"x" * marime, repetari, rulari)
+        _raport_pereche(f"build {marime} B", *timpi)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repetari", type=int, default=5000, help="apeluri maxime per rulare")
+    parser.add_argument("--filtru", default=None, help="doar operatiile care contin textul")
+    parser.add_argument("--rezultat", default=None, help="salveaza rezultatele (referinta pentru --prag)")
+    parser.add_argument("--referinta", default=None, help="rezultate salvate cu care se compara")
+    parser.add_argument("--prag", type=float, default=10.0, help="regresie = mai lent cu peste prag %%")
+    parser.add_argument("--vechi", action="store_true", help="compara cu implementarile vechi")
+    parser.add_argument("--rulari", type=int, default=15, help="--vechi: rulari per varianta (cel mai bun)")
+    args = parser.parse_args()
+
+    if args.vechi:
+        compara_vechi(args.repetari, args.rulari)
+        return
+
+    #upload-urile partiale ale benchmark-ului stau intr-un director temporar
+    director = tempfile.mkdtemp(prefix="coap-micro-")
+    frag.UPLOAD_TMP = director
+    _bench_asamblare.instanta = frag.AsamblareFragment()
+    threading_manager.set_trimitere_directa(True)
+    try:
+        rezultate = ruleaza(args)
+    finally:
+        for nume in os.listdir(director):
+            os.remove(os.path.join(director, nume))
+        os.rmdir(director)
+
+    if args.rezultat:
+        with open(args.rezultat, "w") as f:
+            json.dump({"revizie": revizie_git(), "python": platform.python_version(),
+                       "rezultate": rezultate}, f, indent=1)
+        print(f"Rezultate salvate in {args.rezultat}")
+
+    if args.referinta:
+        with open(args.referinta) as f:
+            referinta = json.load(f)
+        gasite = regresii(rezultate, referinta["rezultate"], args.prag)
+        if gasite:
+            print(f"\nRegresii peste {args.prag:.0f}% fata de {referinta.get('revizie')}:")
+            for linie in gasite:
+                print("  " + linie)
+            sys.exit(1)
+        print(f"\nFara regresii peste {args.prag:.0f}% fata de {referinta.get('revizie')}")
+
+
+if __name__ == "__main__":
+    main()
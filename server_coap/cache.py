@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+#cache LRU thread-safe, limitat ca numar de intrari si optional ca octeti,
+#cu expirare dupa ttl secunde; numara hit/miss pentru statistici
+class CacheLRU:
+    def __init__(self, max_intrari, ttl=None, max_bytes=None):
+        self.max_intrari = max_intrari
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.date = OrderedDict()   # cheie -> (valoare, expira, marime)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictari = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            intrare = self.date.get(key)
+            if intrare is None:
+                self.misses += 1
+                return None
+            if intrare[1] is not None and intrare[1] < time.monotonic():
+                self._scoate(key)
+                self.misses += 1
+                return None
+            self.date.move_to_end(key)
+            self.hits += 1
+            return intrare[0]
+
+    def peek(self, key):
+        #citire fara efect asupra ordinii LRU si a contoarelor
+        with self.lock:
+            intrare = self.date.get(key)
+            return None if intrare is None else intrare[0]
+
+    def put(self, key, value, marime=0):
+        with self.lock:
+            if key in self.date:
+                self._scoate(key)
+            expira = time.monotonic() + self.ttl if self.ttl is not None else None
+            self.date[key] = (value, expira, marime)
+            self.bytes += marime
+            self._evict()
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.date:
+                return self._scoate(key)
+            return None
+
+    def sterge_daca(self, conditie):
+        #invalideaza toate cheile pentru care conditie(cheie) e adevarata
+        with self.lock:
+            chei = [k for k in self.date if conditie(k)]
+            for k in chei:
+                self._scoate(k)
+            return len(chei)
+
+    def _scoate(self, key):
+        value, _, marime = self.date.pop(key)
+        self.bytes -= marime
+        return value
+
+    def _evict(self):
+        now = time.monotonic()
+        #intrarile expirate din capul listei (cele mai vechi) pleaca primele
+        while self.date:
+            key, (_, expira, _) = next(iter(self.date.items()))
+            if expira is None or expira >= now:
+                break
+            self._scoate(key)
+        while len(self.date) > self.max_intrari or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            self._scoate(next(iter(self.date)))
+            self.evictari += 1
+
+    def __len__(self):
+        return len(self.date)
+
+    def statistici(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "intrari": len(self.date),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictari": self.evictari,
+            }
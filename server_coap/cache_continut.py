@@ -0,0 +1,57 @@
+import os
+
+from cache import CacheLRU
+
+#cache de continut pentru download-uri: payload-uri gata de trimis (raspunsuri JSON,
+#fragmente codate, blocuri Block2), cu cheia (path, offset, marime, mtime, tip, index).
+#o rescriere a fisierului schimba marimea/mtime, deci intrarile vechi nu mai sunt gasite;
+#scrierile din acest proces le si sterg imediat (invalideaza)
+CONTENT_CACHE_BYTES = 64 * 1024 * 1024
+CONTENT_CACHE_INTRARI = 16384
+
+_cache = CacheLRU(CONTENT_CACHE_INTRARI, max_bytes=CONTENT_CACHE_BYTES)
+
+
+def configureaza(max_bytes):
+    #limita de memorie; 0 dezactiveaza cache-ul
+    _cache.max_bytes = max_bytes
+    if max_bytes == 0:
+        _cache.sterge_daca(lambda k: True)
+
+
+def activ():
+    return _cache.max_bytes != 0
+
+
+def cale(path):
+    #"storage//a" si "storage/./a" sunt acelasi fisier
+    return os.path.normpath(path)
+
+
+def cheie(path, st, tip, index=0):
+    #pentru un interval (stocare.Interval) offsetul face parte din cheie; os.stat_result nu il are
+    return (cale(path), getattr(st, "st_offset", 0), st.st_size, st.st_mtime_ns, tip, index)
+
+
+def obtine(key, produce):
+    #valoarea din cache sau produce() (citire + codare), memorata pentru urmatoarele cereri
+    if not activ():
+        return produce()
+    corp = _cache.get(key)
+    if corp is None:
+        corp = produce()
+        _cache.put(key, corp, len(corp))
+    return corp
+
+
+def invalideaza(path):
+    #path-ul si tot ce se afla sub el (stergere/mutare de director)
+    p = cale(path)
+    prefix = p + os.sep
+    return _cache.sterge_daca(lambda k: k[0] == p or k[0].startswith(prefix))
+
+
+def statistici():
+    stats = _cache.statistici()
+    stats["max_bytes"] = _cache.max_bytes
+    return stats
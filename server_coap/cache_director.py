@@ -0,0 +1,37 @@
+import os
+
+from cache import CacheLRU
+
+#cache de metadate pentru listari: path director -> (mtime_ns, intrari sortate).
+#mtime-ul directorului e verificat la fiecare listare, deci si modificarile facute de alte
+#procese (sharding) sunt vazute; scrierile din acest proces invalideaza imediat (invalideaza)
+LISTING_CACHE_INTRARI = 1024
+LISTING_CACHE_BYTES = 16 * 1024 * 1024
+
+_cache = CacheLRU(LISTING_CACHE_INTRARI, max_bytes=LISTING_CACHE_BYTES)
+
+
+def intrari(dir_path):
+    #lista sortata de nume, directoarele cu "/" la final; scandir da tipul din d_type, fara stat per fisier
+    p = os.path.normpath(dir_path)
+    #mtime citit inainte de scanare: o modificare in timpul scanarii duce la o rescanare ulterioara
+    mtime = os.stat(p).st_mtime_ns
+    intrare = _cache.get(p)
+    if intrare is not None and intrare[0] == mtime:
+        return intrare[1]
+
+    with os.scandir(p) as it:
+        items = sorted(e.name + "/" if e.is_dir() else e.name for e in it)
+    _cache.put(p, (mtime, items), sum(len(i) for i in items) + 64 * len(items))
+    return items
+
+
+def invalideaza(path):
+    #path-ul, tot ce e sub el si directoarele parinte (a caror listare se schimba)
+    p = os.path.normpath(path)
+    prefix = p + os.sep
+    return _cache.sterge_daca(lambda k: k == p or k.startswith(prefix) or p.startswith(k + os.sep))
+
+
+def statistici():
+    return _cache.statistici()
@@ -0,0 +1,188 @@
+import struct
+
+PAYLOAD_MARKER = 0xFF
+_MARKER = bytes([PAYLOAD_MARKER])
+
+#antetul fix: Ver/T/TKL, Code, Message ID
+_HEADER = struct.Struct("!BBH")
+_U16 = struct.Struct("!H")
+
+# Numere de opțiuni CoAP (RFC 7252, RFC 7959, RFC 7641)
+OPT_ETAG = 4
+OPT_OBSERVE = 6
+OPT_URI_PATH = 11
+OPT_CONTENT_FORMAT = 12
+OPT_MAX_AGE = 14
+OPT_ACCEPT = 17
+OPT_BLOCK2 = 23
+OPT_BLOCK1 = 27
+OPT_SIZE2 = 28
+OPT_SIZE1 = 60
+#optiune experimentala (interval 65000-65535) pentru fragmentele in mod binar:
+#index + total, numar impar = critica (clientul trebuie sa o inteleaga)
+OPT_FRAGMENT = 65001
+#optiune experimentala pentru compresia deflate per bloc (compresie.py): intr-o cerere fara
+#continut anunta ca clientul accepta deflate; pe un payload arata ca e comprimat, valoarea fiind
+#marimea originala a blocului
+OPT_COMPRESIE = 65003
+#optiuni experimentale elective (numar par) pentru integritate: CRC32 al blocului/fragmentului
+#binar (uint) si SHA-256 al intregului fisier (32 de octeti)
+OPT_CRC32 = 65004
+OPT_SHA256 = 65006
+
+# Content-Format
+FORMAT_BINAR = 42  # application/octet-stream
+FORMAT_JSON = 50   # application/json
+
+
+def encode_uint(value):
+    #valoare uint pentru optiuni: numar minim de octeti, 0 -> fara octeti
+    if value == 0:
+        return b""
+    return value.to_bytes((value.bit_length() + 7) // 8, "big")
+
+
+def decode_uint(value):
+    return int.from_bytes(value, "big")
+
+
+def encode_fragment(index, total):
+    return struct.pack("!II", index, total)
+
+
+def decode_fragment(value):
+    return struct.unpack("!II", value)
+
+
+def encode_block(num, more, szx):
+    #Block1/Block2: NUM | M | SZX, marimea blocului = 2 ** (szx + 4)
+    return encode_uint((num << 4) | (0x08 if more else 0) | szx)
+
+
+def decode_block(value):
+    block = decode_uint(value)
+    return block >> 4, bool(block & 0x08), block & 0x07
+
+
+def marime_bloc(szx):
+    return 1 << (szx + 4)
+
+
+def _nibble(value):
+    #delta/lungime optiune: 0-12 direct, 13 si 14 cu octeti extinsi
+    if value < 13:
+        return value, b""
+    if value < 269:
+        return 13, bytes([value - 13])
+    return 14, _U16.pack(value - 269)
+
+
+def encode_options(options):
+    #options: lista de (numar, valoare bytes), codificate delta in ordine crescatoare
+    out = bytearray()
+    last = 0
+    for number, value in sorted(options, key=lambda o: o[0]):
+        delta, delta_ext = _nibble(number - last)
+        length, length_ext = _nibble(len(value))
+        out.append((delta << 4) | length)
+        out += delta_ext
+        out += length_ext
+        out += value
+        last = number
+    return bytes(out)
+
+
+def _extins(nibble, data, pos):
+    if nibble < 13:
+        return nibble, pos
+    if nibble == 13:
+        return data[pos] + 13, pos + 1
+    if nibble == 14:
+        return _U16.unpack_from(data, pos)[0] + 269, pos + 2
+    raise ValueError("Opțiune invalidă (nibble 15)")
+
+
+def parse_options(data, pos):
+    #decodeaza optiunile pana la marcajul de payload; intoarce (optiuni, inceput payload)
+    #pe un memoryview valorile optiunilor sunt tot memoryview (fara copii)
+    options = []
+    number = 0
+    end = len(data)
+    while pos < end:
+        byte = data[pos]
+        if byte == PAYLOAD_MARKER:
+            if pos + 1 == end:
+                raise ValueError("Marcaj de payload fără payload")
+            return options, pos + 1
+        delta, pos = _extins(byte >> 4, data, pos + 1)
+        length, pos = _extins(byte & 0x0F, data, pos)
+        number += delta
+        if pos + length > end:
+            raise ValueError("Opțiune trunchiată")
+        options.append((number, data[pos:pos + length]))
+        pos += length
+    return options, end
+
+
+def get_option(options, number, default=None):
+    for n, value in options:
+        if n == number:
+            return value
+    return default
+
+
+def uri_path(options):
+    #segmentele Uri-Path unite cu "/"
+    return "/".join(str(v, "utf-8") for n, v in options if n == OPT_URI_PATH)
+
+
+def parse_mesaj(data):
+    #parsare RFC 7252: antet, token, optiuni, payload; token-ul, optiunile si
+    #payload-ul sunt memoryview peste datagram, nu copii
+    end = len(data)
+    if end < 4:
+        raise ValueError("Pachet prea scurt")
+
+    first_byte, code, msg_id = _HEADER.unpack_from(data)
+    version = first_byte >> 6
+    if version != 1:
+        raise ValueError(f"Versiune CoAP necunoscută: {version}")
+
+    tkl = first_byte & 0x0F
+    if tkl > 8:
+        raise ValueError(f"TKL invalid: {tkl}")
+    token_end = 4 + tkl
+    if token_end > end:
+        raise ValueError("Token trunchiat")
+
+    view = memoryview(data)
+    #cazul frecvent: fara optiuni, marcajul urmeaza imediat dupa token
+    if token_end < end - 1 and data[token_end] == PAYLOAD_MARKER:
+        options, payload_start = [], token_end + 1
+    else:
+        options, payload_start = parse_options(view, token_end)
+
+    header = {
+        "version": version,
+        "type": (first_byte >> 4) & 0x03,
+        "tkl": tkl,
+        "code": code,
+        "message_id": msg_id,
+        "token": view[4:token_end] if tkl else b"",
+        "options": options,
+    }
+    return header, view[payload_start:]
+
+
+def construieste_pachet(msg_type, code, msg_id, payload=b"", token=b"", options=None):
+    #serializare RFC 7252; un singur join la final (payload poate fi si memoryview)
+    parts = [_HEADER.pack(0x40 | (msg_type << 4) | len(token), code, msg_id & 0xFFFF)]
+    if token:
+        parts.append(token)
+    if options:
+        parts.append(encode_options(options))
+    #payload gol -> fara marcaj
+    if payload:
+        parts.append(_MARKER)
+        parts.append(payload)
+    return b"".join(parts)
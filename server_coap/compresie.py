@@ -0,0 +1,37 @@
+import zlib
+
+#compresie deflate (zlib) negociata per transfer, aplicata pe fiecare fragment/bloc separat,
+#deci fiecare fragment se poate decomprima singur (streaming, retransmisii selective)
+DEFLATE = "deflate"
+NIVEL = 6
+#compresia e folosita doar daca reduce blocul sub acest raport
+PRAG = 0.9
+#din blocurile mari se comprima intai o proba rapida; datele deja comprimate (media, arhive) sunt sarite
+PROBA = 4096
+MIN_BLOC = 128
+#limita la decomprimare (protectie la "zip bomb")
+MAX_DECOMPRIMAT = 1024 * 1024
+
+
+def comprima(raw):
+    #(date, comprimat): blocul comprimat sau blocul original daca nu merita
+    if len(raw) < MIN_BLOC:
+        return raw, False
+    if len(raw) > 2 * PROBA:
+        proba = zlib.compress(raw[:PROBA], 1)
+        if len(proba) > PROBA * PRAG:
+            return raw, False
+    comprimat = zlib.compress(raw, NIVEL)
+    if len(comprimat) >= len(raw) * PRAG:
+        return raw, False
+    return comprimat, True
+
+
+def decomprima(data, limita=MAX_DECOMPRIMAT):
+    d = zlib.decompressobj()
+    raw = d.decompress(data, limita)
+    if d.unconsumed_tail:
+        raise ValueError(f"Date decomprimate prea mari: max {limita} bytes")
+    if not d.eof:
+        raise ValueError("Date deflate incomplete")
+    return raw
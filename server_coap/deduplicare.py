@@ -0,0 +1,54 @@
+import threading
+
+from cache import CacheLRU
+
+#EXCHANGE_LIFETIME (RFC 7252, 4.8.2): cat timp un Message ID poate reaparea ca retransmisie
+EXCHANGE_LIFETIME = 247
+MAX_SCHIMBURI = 4096
+MAX_BYTES_RASPUNSURI = 16 * 1024 * 1024
+
+#cererea a fost primita dar raspunsul nu e gata inca
+IN_LUCRU = object()
+
+#schimburi recente: (client, Message ID, token) -> raspunsul codat
+_schimburi = CacheLRU(MAX_SCHIMBURI, ttl=EXCHANGE_LIFETIME, max_bytes=MAX_BYTES_RASPUNSURI)
+
+_lock = threading.Lock()
+_duplicate_in_lucru = 0
+
+
+def cheie(client_addr, msg_id, token):
+    return (client_addr, msg_id, bytes(token))
+
+
+def inceput_cerere(client_addr, msg_id, token):
+    #None pentru o cerere noua, altfel raspunsul memorat (sau IN_LUCRU) al cererii originale
+    global _duplicate_in_lucru
+    key = cheie(client_addr, msg_id, token)
+    raspuns = _schimburi.get(key)
+    if raspuns is None:
+        _schimburi.put(key, IN_LUCRU)
+        return None
+    if raspuns is IN_LUCRU:
+        with _lock:
+            _duplicate_in_lucru += 1
+    return raspuns
+
+
+def memoreaza(client_addr, msg_id, token, packet):
+    #doar raspunsul piggybacked al unei cereri in curs (acelasi Message ID) e pastrat
+    key = cheie(client_addr, msg_id, token)
+    if _schimburi.peek(key) is IN_LUCRU:
+        _schimburi.put(key, packet, len(packet))
+
+
+def uita(client_addr, msg_id, token):
+    #cererea nu a fost executata (respinsa/eroare), o retransmisie trebuie procesata din nou
+    _schimburi.pop(cheie(client_addr, msg_id, token))
+
+
+def statistici():
+    stats = _schimburi.statistici()
+    with _lock:
+        stats["duplicate_in_lucru"] = _duplicate_in_lucru
+    return stats
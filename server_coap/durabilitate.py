@@ -0,0 +1,217 @@
+import atexit
+import ctypes
+import ctypes.util
+import logging
+import os
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+#politica de durabilitate a upload-urilor: cand e sincronizat pe disc un fisier scris, fata de ACK
+#  always: fsync inainte de ACK, pentru fiecare fisier (comportamentul initial)
+#  group:  fsync-urile upload-urilor concurente sunt adunate cateva ms si facute impreuna
+#          (un syncfs per sistem de fisiere), apoi toate upload-urile din lot primesc ACK
+#  async:  ACK imediat dupa scriere, fsync-ul are loc in fundal; la o cadere se pot pierde
+#          upload-urile confirmate in ultimele momente
+POLITICI = ("always", "group", "async")
+POLITICA = "always"
+#cat asteapta threadul de grup alte upload-uri dupa primul fisier din lot
+FEREASTRA_GRUP = 0.002
+#fisiere nesincronizate in asteptare (async); peste limita, upload-urile asteapta
+MAX_ASYNC = 1024
+
+_lock = threading.Lock()
+_stats = {"sincronizari": 0, "loturi": 0, "fisiere_in_loturi": 0, "erori": 0}
+
+#syncfs(2) (Linux): un singur apel sincronizeaza tot sistemul de fisiere al lotului;
+#fara el, lotul e sincronizat fisier cu fisier
+try:
+    _syncfs = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True).syncfs
+except (OSError, AttributeError, TypeError):
+    _syncfs = None
+
+
+def configureaza(politica=POLITICA, fereastra_ms=FEREASTRA_GRUP * 1000):
+    global POLITICA, FEREASTRA_GRUP
+    if politica not in POLITICI:
+        raise ValueError(f"Politica fsync necunoscuta: {politica}")
+    POLITICA = politica
+    FEREASTRA_GRUP = max(0.0, fereastra_ms / 1000)
+
+
+def _numara(cheie, n=1):
+    with _lock:
+        _stats[cheie] += n
+
+
+def sincronizeaza(fd):
+    #apelat in locul os.fsync(fd) inainte de ACK; fd-ul ramane al apelantului
+    if POLITICA == "group":
+        _sincronizeaza_grup(fd)
+    elif POLITICA == "async":
+        #copia fd-ului e inchisa de threadul din fundal dupa fsync
+        _porneste(_fundal)
+        _coada_async.put(os.dup(fd))
+    else:
+        os.fsync(fd)
+        _numara("sincronizari")
+
+
+def sincronizeaza_director(path):
+    #dupa os.replace: intrarea noua din director ajunge pe disc (dupa aceeasi politica; in async
+    #ramane in grija sistemului de fisiere, ca si continutul confirmat inainte de fsync)
+    if POLITICA == "async":
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        if POLITICA == "group":
+            _sincronizeaza_grup(fd)
+        else:
+            os.fsync(fd)
+            _numara("sincronizari")
+    finally:
+        os.close(fd)
+
+
+def sincronizeaza_cai(paths):
+    #mai multe fisiere scrise fara fsync (ex. chunk-urile noi ale unui upload) facute durabile
+    #o singura data, inainte de publicare: un syncfs pentru tot lotul (continut si directoare) sau,
+    #fara el, cate un fsync pentru fiecare fisier si pentru fiecare director in care a fost creat
+    if not paths:
+        return
+    if POLITICA == "async":
+        _porneste(_fundal)
+        for path in paths:
+            _coada_async.put(os.open(path, os.O_RDONLY))
+        return
+    if len(paths) > 1 and _syncfs is not None:
+        fd = os.open(paths[0], os.O_RDONLY)
+        try:
+            if _syncfs(fd) == 0:
+                _numara("sincronizari")
+                return
+        finally:
+            os.close(fd)
+    directoare = {os.path.dirname(path) or "." for path in paths}
+    for path in list(paths) + sorted(directoare):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            _numara("sincronizari")
+        finally:
+            os.close(fd)
+
+
+# ---- group commit ----
+
+#o cerere din lot: [fd, eveniment, eroare]
+_cond = threading.Condition()
+_lot = []
+_threaduri = {}
+
+
+def _porneste(functie):
+    #threadurile pornesc la prima folosire (si din nou dupa fork, in modul multi-proces)
+    t = _threaduri.get(functie)
+    if t is None or not t.is_alive():
+        with _cond:
+            t = _threaduri.get(functie)
+            if t is None or not t.is_alive():
+                t = threading.Thread(target=functie, name="fsync-" + functie.__name__.strip("_"), daemon=True)
+                _threaduri[functie] = t
+                t.start()
+
+
+def _sincronizeaza_grup(fd):
+    _porneste(_grup)
+    cerere = [fd, threading.Event(), None]
+    with _cond:
+        _lot.append(cerere)
+        _cond.notify()
+    cerere[1].wait()
+    if cerere[2] is not None:
+        raise cerere[2]
+
+
+def _grup():
+    while True:
+        with _cond:
+            while not _lot:
+                _cond.wait()
+        #fereastra in care se aduna si upload-urile concurente
+        if FEREASTRA_GRUP:
+            time.sleep(FEREASTRA_GRUP)
+        with _cond:
+            lot = list(_lot)
+            _lot.clear()
+        _sincronizeaza_lot(lot)
+        _numara("loturi")
+        _numara("fisiere_in_loturi", len(lot))
+        for cerere in lot:
+            cerere[1].set()
+
+
+def _sincronizeaza_lot(lot):
+    #un singur fisier: fsync obisnuit; altfel un syncfs per dispozitiv
+    dispozitive = {}
+    for cerere in lot:
+        try:
+            dispozitive.setdefault(os.fstat(cerere[0]).st_dev, []).append(cerere)
+        except OSError as e:
+            cerere[2] = e
+    for cereri in dispozitive.values():
+        if len(cereri) > 1 and _syncfs is not None and _syncfs(cereri[0][0]) == 0:
+            _numara("sincronizari")
+            continue
+        for cerere in cereri:
+            try:
+                os.fsync(cerere[0])
+                _numara("sincronizari")
+            except OSError as e:
+                cerere[2] = e
+
+
+# ---- async ----
+
+_coada_async = queue.Queue(MAX_ASYNC)
+
+
+def _sincronizeaza_fundal(fd):
+    try:
+        os.fsync(fd)
+        _numara("sincronizari")
+    except OSError as e:
+        _numara("erori")
+        log.warning("fsync in fundal esuat: %s", e)
+    finally:
+        os.close(fd)
+
+
+def _fundal():
+    while True:
+        _sincronizeaza_fundal(_coada_async.get())
+
+
+def goleste():
+    #la oprire: fisierele confirmate dar inca nesincronizate sunt sincronizate acum
+    while True:
+        try:
+            fd = _coada_async.get_nowait()
+        except queue.Empty:
+            return
+        _sincronizeaza_fundal(fd)
+
+
+atexit.register(goleste)
+
+
+def statistici():
+    with _lock:
+        stats = dict(_stats)
+    with _cond:
+        stats["in_lot"] = len(_lot)
+    stats["politica"] = POLITICA
+    stats["async_in_asteptare"] = _coada_async.qsize()
+    return stats
@@ -0,0 +1,166 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+#operatiile pe disc ale handlerelor (functii.py) ruleaza pe patru executoare separate, fiecare cu
+#threadurile si coada lui limitata:
+#  metadate: listari, stergeri de fisiere, mutari, directoare
+#  mic:      upload-urile dintr-un singur pachet (scriere + fsync + rename)
+#  masiv:    asamblarea fragmentelor si blocurilor Block1, rmtree
+#  citire:   download-uri: deschiderea fisierului si blocurile citite pentru raspunsul la cerere
+#un disc lent pentru scrieri nu intarzie citirile si operatiile pe metadate. Cand coada unui executor
+#e plina, cererea asteapta cel mult ASTEPTARE_COADA un loc si apoi e respinsa (5.03), deci nu tine
+#ocupat un worker de cereri cat timp discul e blocat. Capacitatea (threaduri + coada) a fiecarui
+#executor e sub numarul de workeri de cereri, deci un executor blocat nu ocupa toti workerii
+#si metricile raman mereu servite
+NUM_METADATE = 2
+COADA_METADATE = 4
+#upload-urile mici asteapta aproape numai dupa fsync: cate threaduri, atatea fsync-uri pot fi
+#grupate intr-un lot (durabilitate.py, --fsync group), fara sa astepte dupa asamblarile mari
+NUM_MIC = 6
+COADA_MIC = 1
+NUM_MASIV = 4
+COADA_MASIV = 2
+NUM_CITIRE = 4
+COADA_CITIRE = 2
+ASTEPTARE_COADA = 0.5
+
+#threadurile executoarelor: o operatie trimisa din interiorul lor ruleaza direct (fara blocaj)
+_local = threading.local()
+
+
+#coada executorului e plina: operatia nu a fost executata, clientul poate reincerca
+class CoadaPlina(Exception):
+    pass
+
+
+#o operatie trimisa executorului; apelantul asteapta evenimentul
+class Lucrare:
+    def __init__(self, functie, args):
+        self.functie = functie
+        self.args = args
+        self.gata = threading.Event()
+        self.rezultat = None
+        self.eroare = None
+        self.trimisa = time.monotonic()
+
+
+class Executor:
+    def __init__(self, nume, threaduri, coada):
+        self.nume = nume
+        self.num_threaduri = threaduri
+        self.coada = queue.Queue(coada)
+        self.lock = threading.Lock()
+        self.threaduri = []
+        self.stats = {
+            "executate": 0,
+            "respinse": 0,
+            "erori": 0,
+            "in_lucru": 0,
+            "asteptare_total": 0.0,
+            "asteptare_max": 0.0,
+            "durata_total": 0.0,
+        }
+        #dupa fork (mod multi-proces) threadurile nu exista in copil
+        os.register_at_fork(after_in_child=self._reset_dupa_fork)
+
+    def _reset_dupa_fork(self):
+        self.lock = threading.Lock()
+        self.coada = queue.Queue(self.coada.maxsize)
+        self.threaduri = []
+
+    def _porneste(self):
+        with self.lock:
+            if self.threaduri:
+                return
+            for i in range(self.num_threaduri):
+                t = threading.Thread(target=self._worker, name=f"io-{self.nume}-{i}", daemon=True)
+                t.start()
+                self.threaduri.append(t)
+
+    def _worker(self):
+        _local.in_executor = True
+        while True:
+            lucrare = self.coada.get()
+            inceput = time.monotonic()
+            asteptare = inceput - lucrare.trimisa
+            with self.lock:
+                self.stats["in_lucru"] += 1
+            try:
+                lucrare.rezultat = lucrare.functie(*lucrare.args)
+            except BaseException as e:
+                lucrare.eroare = e
+            durata = time.monotonic() - inceput
+            with self.lock:
+                self.stats["in_lucru"] -= 1
+                self.stats["executate"] += 1
+                if lucrare.eroare is not None:
+                    self.stats["erori"] += 1
+                self.stats["asteptare_total"] += asteptare
+                self.stats["durata_total"] += durata
+                if asteptare > self.stats["asteptare_max"]:
+                    self.stats["asteptare_max"] = asteptare
+            lucrare.gata.set()
+
+    def executa(self, functie, *args):
+        #ruleaza functie(*args) pe executor si intoarce rezultatul (exceptiile ajung la apelant);
+        #CoadaPlina daca in ASTEPTARE_COADA nu s-a eliberat niciun loc in coada
+        if getattr(_local, "in_executor", False):
+            return functie(*args)
+        if not self.threaduri:
+            self._porneste()
+        lucrare = Lucrare(functie, args)
+        try:
+            self.coada.put(lucrare, timeout=ASTEPTARE_COADA)
+        except queue.Full:
+            with self.lock:
+                self.stats["respinse"] += 1
+            raise CoadaPlina(f"Coada I/O {self.nume} plină")
+        lucrare.gata.wait()
+        if lucrare.eroare is not None:
+            raise lucrare.eroare
+        return lucrare.rezultat
+
+    def statistici(self):
+        with self.lock:
+            stats = dict(self.stats)
+        executate = stats.pop("executate")
+        asteptare = stats.pop("asteptare_total")
+        durata = stats.pop("durata_total")
+        stats["executate"] = executate
+        stats["in_asteptare"] = self.coada.qsize()
+        stats["asteptare_medie"] = asteptare / executate if executate else 0.0
+        stats["durata_medie"] = durata / executate if executate else 0.0
+        return stats
+
+
+_metadate = Executor("metadate", NUM_METADATE, COADA_METADATE)
+_mic = Executor("mic", NUM_MIC, COADA_MIC)
+_masiv = Executor("masiv", NUM_MASIV, COADA_MASIV)
+_citire = Executor("citire", NUM_CITIRE, COADA_CITIRE)
+
+
+def metadate(functie, *args):
+    return _metadate.executa(functie, *args)
+
+
+def mic(functie, *args):
+    return _mic.executa(functie, *args)
+
+
+def masiv(functie, *args):
+    return _masiv.executa(functie, *args)
+
+
+def citire(functie, *args):
+    return _citire.executa(functie, *args)
+
+
+def statistici():
+    #adancimea cozilor (operatii in asteptare) si operatiile in curs, per executor
+    return {"metadate": _metadate.statistici(), "mic": _mic.statistici(), "masiv": _masiv.statistici(),
+            "citire": _citire.statistici()}
@@ -1,8 +1,30 @@
+import base64
+import hashlib
 import json
-import struct
+import logging
+import os
 import math
+import secrets
+import tempfile
 import time
 import threading
+import transmisie
+import cache_continut
+import compresie
+import durabilitate
+import stocare
+from coap_codec import (
+    construieste_pachet,
+    encode_fragment,
+    encode_uint,
+    FORMAT_BINAR,
+    OPT_COMPRESIE,
+    OPT_CONTENT_FORMAT,
+    OPT_FRAGMENT,
+    OPT_SIZE2,
+)
+
+log = logging.getLogger(__name__)
 
 MAX_SIZE_PACHET = 14000
 HEADER_SIZE = 4
@@ -11,12 +33,26 @@ FRAGMENT_OVERHEAD = 200
 
 RAW_MAX = 14000 - 4 - 1 - 200
 MAX_PAYLOAD_SIZE = RAW_MAX - (RAW_MAX % 4)
+#in mod binar nu exista base64, deci fragmentul poate folosi tot spatiul
+MAX_BINARY_PAYLOAD = RAW_MAX
+#octeti de fisier care, codati base64, dau exact un fragment de MAX_PAYLOAD_SIZE caractere
+RAW_CHUNK = MAX_PAYLOAD_SIZE // 4 * 3
 PAYLOAD_MARKER = 0xFF
 
 # Limite protecție
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100 MB
-#timeout pentru cleanup fragmente incomplete
+#timeout pentru cleanup fragmente incomplete; un client poate relua upload-ul (sesiune) pana atunci,
+#se poate mari din linia de comanda (--upload-timeout)
 FRAGMENT_TIMEOUT = 300  # in secunde
+#fisierele temporare ale upload-urilor in curs; in afara storage/ ca sa nu apara la listare,
+#dar pe acelasi sistem de fisiere ca redenumirea finala sa fie atomica
+UPLOAD_TMP = ".upload_tmp"
+
+
+def director_tmp():
+    #creat la primul upload, nu la import (benchmark-urile importa modulul din orice director)
+    os.makedirs(UPLOAD_TMP, exist_ok=True)
+    return UPLOAD_TMP
 
 
 def fragmente_necesare(content_b64):
@@ -27,6 +63,36 @@ def fragmente_necesare(content_b64):
     return math.ceil(len(content_b64) / MAX_PAYLOAD_SIZE)
 
 
+def fragmente_fisier(file_size, chunk=RAW_CHUNK):
+    #numarul de fragmente calculat din marimea fisierului, fara a-l citi
+    return max(1, math.ceil(file_size / chunk))
+
+
+def citeste_bloc(fisier, offset, size):
+    #fisier: cititor din stocare.deschide (fisier obisnuit sau manifest de chunk-uri)
+    return fisier.pread(size, offset)
+
+
+def fragment_din_fisier(fisier, path, index, total, comprimat=False):
+    #acelasi fragment ca split_payload pe tot fisierul, dar citit la cerere;
+    #cu compresie negociata, blocul e comprimat separat (daca merita)
+    data = citeste_bloc(fisier, index * RAW_CHUNK, RAW_CHUNK)
+    raw_size = len(data)
+    if comprimat:
+        data, comprimat = compresie.comprima(data)
+    content = base64.b64encode(data).decode("utf-8")
+    fragment = {
+        "path": path,
+        "content": content,
+        "fragment": {"index": index, "total": total, "size": len(content)}
+    }
+    if comprimat:
+        fragment["encoding"] = compresie.DEFLATE
+        fragment["raw_size"] = raw_size
+        fragment["compressed_size"] = len(data)
+    return fragment
+
+
 def split_payload(content_b64, path):
     #Împarte base64 pe fragmente
 
@@ -64,13 +130,29 @@ def split_payload(content_b64, path):
     return fragments
 
 
-def build_fragment_pachet(code, fragment_payload, msg_id, msg_type=0):
-    version = 1
-    tkl = 0
-    first_byte = (version << 6) | (msg_type << 4) | tkl
-    header = struct.pack("!BBH", first_byte, code, msg_id)
+def build_fragment_pachet(code, fragment_payload, msg_id, msg_type=0, token=b""):
     payload = json.dumps(fragment_payload).encode("utf-8")
-    return header + bytes([PAYLOAD_MARKER]) + payload
+    return construieste_pachet(msg_type, code, msg_id, payload, token)
+
+
+def optiuni_fragment_binar(index, total, file_size):
+    #metadatele fragmentului binar: Content-Format, Size2 (marime fisier) si Fragment
+    return [
+        (OPT_CONTENT_FORMAT, encode_uint(FORMAT_BINAR)),
+        (OPT_SIZE2, encode_uint(file_size)),
+        (OPT_FRAGMENT, encode_fragment(index, total)),
+    ]
+
+
+def optiuni_compresie(corp, raw_size):
+    #blocul binar e comprimat doar daca a iesit mai mic decat originalul
+    if len(corp) < raw_size:
+        return [(OPT_COMPRESIE, encode_uint(raw_size))]
+    return []
+
+
+def build_fragment_binar(code, chunk, msg_id, options, msg_type=0, token=b""):
+    return construieste_pachet(msg_type, code, msg_id, chunk, token, options)
 
 
 def is_fragment_upload(payload):
@@ -83,108 +165,397 @@ def get_fragment_info(payload):
     info = payload.get("fragment", {})
     return (info.get("index"), info.get("total"), info.get("size"))
 
-#gestioneaza asamblarea fragmentelor primite
+#sesiunea de upload ceruta de client nu (mai) exista: a expirat sau upload-ul a fost reluat de altcineva
+class SesiuneInvalida(ValueError):
+    pass
+
+
+#fisierul asamblat nu are SHA-256-ul anuntat de client
+class IntegritateInvalida(ValueError):
+    pass
+
+
+#index/total/Size1 lipsa sau care nu sunt intregi: fragmentul e respins, upload-ul ramane in curs
+class FragmentInvalid(ValueError):
+    pass
+
+
+#upload-ul anuntat (Size1, total x marime fragment) sau scris depaseste MAX_FILE_SIZE
+class FisierPreaMare(ValueError):
+    pass
+
+
+def _intreg(x):
+    return isinstance(x, int) and not isinstance(x, bool)
+
+
+#starea unui upload in curs: fisier temporar + bitmap cu fragmentele primite
+class UploadPartial:
+    def __init__(self, tmp_path, fd):
+        self.tmp_path = tmp_path
+        self.fd = fd
+        #identificatorul trimis clientului; cu el poate cere starea si relua upload-ul
+        self.sesiune = secrets.token_hex(8)
+        self.total = None       # necunoscut pana la ultimul bloc (Block1)
+        self.chunk = None       # octeti per fragment, aflat din primul fragment ne-final
+        self.primite = bytearray()
+        self.numar = 0
+        self.marime = 0         # sfarsitul celui mai indepartat octet scris
+        self.amanate = {}       # fragmente finale sosite inainte sa stim chunk-ul
+        self.timestamp = time.time()
+        #SHA-256 incremental peste prefixul contiguu de fragmente deja scrise
+        self.sha = hashlib.sha256()
+        self.hash_index = 0     # urmatorul fragment care intra in hash
+        self.lock_hash = threading.Lock()
+        self.sha256_client = None   # digest-ul anuntat de client, verificat la final
+        self.scriitori = 0      # threaduri care scriu/citesc acum fd-ul, in afara lock-ului
+        self.eliberat = False
+
+    def are(self, index):
+        byte = index >> 3
+        return byte < len(self.primite) and bool(self.primite[byte] & (1 << (index & 7)))
+
+    def marcheaza(self, index):
+        byte = index >> 3
+        if byte >= len(self.primite):
+            self.primite.extend(bytes(byte + 1 - len(self.primite)))
+        self.primite[byte] |= 1 << (index & 7)
+
+
+#gestioneaza asamblarea fragmentelor primite: fiecare fragment e scris direct
+#la offsetul lui intr-un fisier temporar, deci memoria nu creste cu marimea upload-ului
 class AsamblareFragment:
     def __init__(self):
-        self.fragments = {}
-        self.expected_total = {}
-        self.timestamps = {}
+        self.uploads = {}
         self.lock = threading.Lock()
 
         # Thread cleanup
+        self._porneste_cleanup()
+        #dupa fork (mod multi-proces) threadul nu exista in copil, il repornim
+        os.register_at_fork(after_in_child=self._reset_dupa_fork)
+
+    def _porneste_cleanup(self):
         cleanup = threading.Thread(target=self._cleanup_loop, daemon=True)
         cleanup.start()
 
+    def _reset_dupa_fork(self):
+        self.lock = threading.Lock()
+        self._porneste_cleanup()
+
     #bucla infinita pentru un cleanup automat
     def _cleanup_loop(self):
         while True:
             time.sleep(60)
             self._cleanup_old()
 
-    #sterge fragmentele incomplete mai vechi
+    #sterge upload-urile incomplete mai vechi
     def _cleanup_old(self):
         with self.lock:
             now = time.time()
-            expired = [p for p, t in self.timestamps.items() if now - t > FRAGMENT_TIMEOUT]
-            for path in expired:
-                print(f"[CLEANUP] Șterg fragmente expirate: {path}")
-                self.clear_path(path)
-
-    def add_fragment(self, path, index, total, content):
+            expired = [p for p, up in self.uploads.items() if now - up.timestamp > FRAGMENT_TIMEOUT]
+            removed = [self.uploads.pop(p) for p in expired]
+        for path, up in zip(expired, removed):
+            log.info("Șterg upload expirat: %s", path)
+            self._elibereaza(up)
+
+    def _elibereaza(self, up):
+        if not self._renunta_la_fd(up):
+            return
+        try:
+            os.unlink(up.tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def _renunta_la_fd(self, up):
+        #fd-ul ramane deschis pana termina threadurile care inca scriu/citesc prin el; altfel numarul
+        #lui ar putea fi refolosit de alt fisier deschis intre timp si pwrite/pread-ul ar ajunge acolo.
+        #e inchis acum sau de ultimul scriitor care iese; False daca s-a renuntat deja la el
         with self.lock:
-            #initializare
-            if path not in self.fragments:
-                self.fragments[path] = {}
-                self.expected_total[path] = total
-                self.timestamps[path] = time.time()
-
-            #salvare fragment si update timestamp
-            self.timestamps[path] = time.time()
-            self.fragments[path][index] = content
-
-            #incercam sa asamblam toate fragmentele
-            if len(self.fragments[path]) == total:
-                assembled = []
-                for i in range(total):
-                    if i not in self.fragments[path]:
-                        return (False, None)
-                    assembled.append(self.fragments[path][i])
-
-                result = "".join(assembled)
-
-                #eliberare memorie
-                del self.fragments[path]
-                del self.expected_total[path]
-                del self.timestamps[path]
+            if up.eliberat:
+                return False
+            up.eliberat = True
+            inchide = up.scriitori == 0
+        if inchide:
+            self._inchide(up)
+        return True
 
-                return (True, result)
+    def _inchide(self, up):
+        try:
+            os.close(up.fd)
+        except OSError:
+            pass
+
+    def _creeaza(self, path):
+        fd, tmp_path = tempfile.mkstemp(dir=director_tmp(), suffix=".part")
+        up = UploadPartial(tmp_path, fd)
+        self.uploads[path] = up
+        return up
+
+    def _prealoca(self, up, size):
+        #spatiul pe disc rezervat de la inceput (fisierul e trunchiat la final)
+        try:
+            os.posix_fallocate(up.fd, 0, size)
+        except (AttributeError, OSError):
+            pass
+
+    def add_fragment(self, path, index, total, content, sesiune=None, sha256=None):
+        #fragment JSON (base64) sau binar; doar ultimul fragment poate fi mai scurt
+        if not _intreg(index) or not _intreg(total) or not 0 <= index < total:
+            raise FragmentInvalid(f"Index fragment invalid: {index}/{total}")
+        data = content if isinstance(content, (bytes, memoryview)) else base64.b64decode(content)
+        chunk = len(data) if index < total - 1 else None
+        return self._adauga(path, index, total, chunk, data, sesiune=sesiune, sha256=sha256)
+
+    def add_block(self, path, num, more, size, data, size1=None, sha256=None):
+        #Block1 (RFC 7959): totalul se afla abia la blocul cu M=0
+        return self._adauga(path, num, None if more else num + 1, size, data, size1, sha256=sha256)
+
+    def _avanseaza_hash(self, up, scrise_acum):
+        #fragmentele contigue de la inceput intra in hash pe masura ce sosesc, deci la final
+        #digest-ul e gata fara o a doua trecere prin fisier; cele sosite inaintea ordinii sunt
+        #recitite o singura data din fisierul temporar (inca in page cache)
+        with up.lock_hash:
+            with self.lock:
+                start = end = up.hash_index
+                while up.are(end):
+                    end += 1
+                up.hash_index = end
+            for i in range(start, end):
+                data = scrise_acum.get(i)
+                if data is None:
+                    offset = i * up.chunk
+                    size = up.marime - offset if up.total is not None and i == up.total - 1 else up.chunk
+                    data = os.pread(up.fd, size, offset)
+                up.sha.update(data)
+
+    def _adauga(self, path, index, total, chunk, data, size_hint=None, sesiune=None, sha256=None):
+        if not _intreg(index) or index < 0 or (total is not None and index >= total):
+            raise FragmentInvalid(f"Index fragment invalid: {index}/{total}")
+        #marimile anuntate de client sunt verificate inainte de a rezerva spatiu pe disc
+        if size_hint is not None and (not _intreg(size_hint) or size_hint < 0):
+            raise FragmentInvalid(f"Size1 invalid: {size_hint}")
+        if size_hint and size_hint > MAX_FILE_SIZE:
+            raise FisierPreaMare(f"Fișier prea mare: max {MAX_FILE_SIZE} bytes")
 
-            return (False, None)
+        with self.lock:
+            up = self.uploads.get(path)
+            #un fragment care reia o sesiune nu porneste un upload nou (nu s-ar mai completa)
+            if sesiune is not None and (up is None or up.sesiune != sesiune):
+                raise SesiuneInvalida("Sesiune de upload expirată sau necunoscută")
+            if up is None:
+                up = self._creeaza(path)
+                if size_hint:
+                    self._prealoca(up, size_hint)
+
+            if total is not None:
+                if up.total is None:
+                    up.total = total
+                elif up.total != total:
+                    raise ValueError("Număr total de fragmente inconsistent")
+
+            chunk_nou = chunk is not None and up.chunk is None
+            if chunk_nou:
+                up.chunk = chunk
+            elif chunk is not None and chunk != up.chunk:
+                raise ValueError("Mărime fragment inconsistentă")
+
+            #doar ultimul fragment poate fi mai scurt, deci fisierul are cel putin (total - 1) x chunk octeti
+            if up.total is not None and up.chunk is not None and (up.total - 1) * up.chunk >= MAX_FILE_SIZE:
+                raise FisierPreaMare(f"Fișier prea mare: max {MAX_FILE_SIZE} bytes")
+            if chunk_nou and up.total is not None and not size_hint:
+                self._prealoca(up, min(up.total * chunk, MAX_FILE_SIZE))
+
+            up.timestamp = time.time()
+            if sha256 is not None:
+                up.sha256_client = sha256.lower()
+
+            if up.are(index) or index in up.amanate:
+                #duplicat (retransmisie), deja scris
+                return (False, None, None, None)
+
+            #offsetul fragmentelor > 0 depinde de chunk; pana atunci fragmentul asteapta
+            if index > 0 and up.chunk is None:
+                up.amanate[index] = bytes(data)
+                return (False, None, None, None)
+
+            de_scris = [(index, data)]
+            if up.chunk is not None and up.amanate:
+                de_scris.extend(up.amanate.items())
+                up.amanate.clear()
+            up.scriitori += 1
+
+        scris = complet = False
+        try:
+            #scrierea pe disc are loc in afara lock-ului (pwrite e sigur intre threaduri)
+            scrise = []
+            for i, d in de_scris:
+                offset = i * up.chunk if i else 0
+                if offset + len(d) > MAX_FILE_SIZE:
+                    self.clear_path(path)
+                    raise FisierPreaMare(f"Fișier prea mare: max {MAX_FILE_SIZE} bytes")
+                os.pwrite(up.fd, d, offset)
+                scrise.append((i, offset + len(d)))
+
+            with self.lock:
+                for i, end in scrise:
+                    if not up.are(i):
+                        up.marcheaza(i)
+                        up.numar += 1
+                        up.marime = max(up.marime, end)
+
+            self._avanseaza_hash(up, dict(de_scris))
+            scris = True
+        finally:
+            with self.lock:
+                up.scriitori -= 1
+                #upload-ul a fost eliberat (expirat, sters) cat timp scriam: ultimul scriitor inchide fd-ul
+                inchide = up.eliberat and up.scriitori == 0
+                #finalizeaza doar ultimul scriitor care iese, cand toate fragmentele sunt si in hash;
+                #un alt thread poate avea inca de adaugat in hash fragmentul pe care l-a marcat
+                if (scris and up.scriitori == 0 and not up.eliberat and up.total is not None
+                        and up.hash_index == up.total and self.uploads.get(path) is up):
+                    del self.uploads[path]
+                    complet = True
+            if inchide:
+                self._inchide(up)
+
+        if not complet:
+            return (False, None, None, None)
+
+        #fisierul temporar e complet: marime exacta + sincronizare inainte de ACK (dupa politica fsync);
+        #in modul chunk temporarul e doar sursa chunk-urilor, sincronizate la publicare (stocare.py)
+        digest = up.sha.hexdigest()
+        if up.sha256_client is not None and up.sha256_client != digest:
+            self._elibereaza(up)
+            raise IntegritateInvalida(f"SHA-256 diferit: primit {digest}")
+        try:
+            os.ftruncate(up.fd, up.marime)
+            if not stocare.activ():
+                durabilitate.sincronizeaza(up.fd)
+        except BaseException:
+            self._elibereaza(up)
+            raise
+        #fisierul temporar ramane, doar fd-ul e inchis (cu aceeasi regula ca la eliberare)
+        self._renunta_la_fd(up)
+        return (True, up.tmp_path, up.marime, digest)
 
     def get_progress(self, path):
         with self.lock:
-            if path not in self.fragments:
+            up = self.uploads.get(path)
+            if up is None:
                 return None
-            received = len(self.fragments[path])
-            total = self.expected_total.get(path, 0)
+            received = up.numar + len(up.amanate)
+            total = up.total or 0
             percentage = (received / total * 100) if total > 0 else 0
-            return {"received": received, "total": total, "percentage": round(percentage, 2)}
+            return {"received": received, "total": total, "percentage": round(percentage, 2),
+                    "session": up.sesiune}
+
+    def get_status(self, path, sesiune=None):
+        #starea pentru reluare: bitmap cu fragmentele lipsa (bitul i, LSB primul = fragmentul i lipseste),
+        #aceeasi conventie ca la retransmisia selectiva din download; None daca nu exista sesiunea
+        with self.lock:
+            up = self.uploads.get(path)
+            if up is None or (sesiune is not None and up.sesiune != sesiune):
+                return None
+            #fara total (Block1 inainte de ultimul bloc) bitmap-ul acopera fragmentele pana la cel mai mare primit
+            total = up.total
+            if total is None:
+                indici = [i for i in range(len(up.primite) * 8) if up.are(i)] + list(up.amanate)
+                total = max(indici) + 1 if indici else 0
+            lipsa = bytearray((total + 7) // 8)
+            for i in range(total):
+                if not up.are(i) and i not in up.amanate:
+                    lipsa[i >> 3] |= 1 << (i & 7)
+            return {
+                "session": up.sesiune,
+                "total": up.total,
+                "received": up.numar + len(up.amanate),
+                "chunk": up.chunk,
+                "bitmap": base64.b64encode(bytes(lipsa)).decode("ascii"),
+                "expires_in": max(0, round(FRAGMENT_TIMEOUT - (time.time() - up.timestamp))),
+            }
+
+    def statistici(self):
+        #upload-uri in curs si memoria tinuta de ele (bitmap-uri + fragmente amanate);
+        #continutul in sine e pe disc, in fisierele temporare
+        with self.lock:
+            memorie = sum(len(up.primite) + sum(len(d) for d in up.amanate.values())
+                          for up in self.uploads.values())
+            return {
+                "in_curs": len(self.uploads),
+                "memorie": memorie,
+                "octeti_temporari": sum(up.marime for up in self.uploads.values()),
+            }
 
     def clear_path(self, path):
         with self.lock:
-            if path in self.fragments:
-                del self.fragments[path]
-            if path in self.expected_total:
-                del self.expected_total[path]
-            if path in self.timestamps:
-                del self.timestamps[path]
+            up = self.uploads.pop(path, None)
+        if up is not None:
+            self._elibereaza(up)
 
 #instanta globala , se foloseste in functii.py
 assembler = AsamblareFragment()
 
 
-def handle_fragmented(file_path, file_content_b64, sock, client_addr, msg_id_base):
-    #trimite un fisier fragmentat catre client
-    try:
-        fragments = split_payload(file_content_b64, file_path)
-    except ValueError as e:
-        print(f"Eroare validare: {e}")
+def corp_fragment(fisier, path, index, total, st, binar, comprimat=False):
+    #payload-ul codat al fragmentului i (JSON+base64 sau octeti bruti), din cache-ul de continut;
+    #download-urile repetate si retransmisiile selective nu mai citesc si codeaza fisierul
+    def produce():
+        if binar:
+            data = citeste_bloc(fisier, index * MAX_BINARY_PAYLOAD, MAX_BINARY_PAYLOAD)
+            return compresie.comprima(data)[0] if comprimat else data
+        return json.dumps(fragment_din_fisier(fisier, path, index, total, comprimat)).encode("utf-8")
+
+    tip = ("binar" if binar else "json") + ("+deflate" if comprimat else "")
+    return cache_continut.obtine(cache_continut.cheie(path, st, tip, index), produce)
+
+
+def marime_bloc_binar(index, file_size):
+    return min(MAX_BINARY_PAYLOAD, file_size - index * MAX_BINARY_PAYLOAD)
+
+
+def trimite_fragmente(file_path, fisier, st, indici, binar, sock, client_addr, token=b"", comprimat=False,
+                      fara_ack=False):
+    #trimite fragmentele din indici prin transmisie.py; MsgID-ul fiecarui fragment e alocat de server
+    #(transmisie.aloca_msg_id), clientul recunoaste fragmentele dupa token si index. Fiecare fragment e citit de pe disc (sau din cache) abia cand e trimis, deci memoria
+    #ramane O(fereastra) indiferent de marimea fisierului, iar threadul curent nu asteapta
+    file_size = st.st_size
+    total = fragmente_fisier(file_size, MAX_BINARY_PAYLOAD if binar else RAW_CHUNK)
+
+    #copia cititorului ramane deschisa cat dureaza transferul
+    fisier_transfer = fisier.dup()
+
+    def construieste(k):
+        i = indici[k]
+        msg_id = transmisie.aloca_msg_id(client_addr)
+        corp = corp_fragment(fisier_transfer, file_path, i, total, st, binar, comprimat)
+        if binar:
+            options = (optiuni_fragment_binar(i, total, file_size)
+                       + optiuni_compresie(corp, marime_bloc_binar(i, file_size)))
+            return msg_id, build_fragment_binar(69, corp, msg_id, options, token=token)
+        return msg_id, construieste_pachet(0, 69, msg_id, corp, token)
+
+    transmisie.porneste(sock, client_addr, len(indici), construieste, fisier_transfer, fara_ack)
+
+
+def handle_fragmented(file_path, fisier, st, sock, client_addr, token=b"", comprimat=False, fara_ack=False):
+    #trimite un fisier fragmentat catre client; ritmul si retransmisiile sunt gestionate de transmisie.py
+    if st.st_size > MAX_FILE_SIZE:
+        log.warning("Eroare validare: Fișier prea mare: max %d bytes", MAX_FILE_SIZE)
         return False
 
-    total = len(fragments)
-    print(f"Download fragmentat: {total} fragmente → {client_addr}")
+    total = fragmente_fisier(st.st_size)
+    log.debug("Download fragmentat: %d fragmente → %s", total, client_addr)
 
-    try:
-        for i in range(total):
-            msg_id = msg_id_base + i + 1
-            packet = build_fragment_pachet(69, fragments[i], msg_id)
-            sock.sendto(packet, client_addr)
+    trimite_fragmente(file_path, fisier, st, range(total), False, sock, client_addr, token, comprimat, fara_ack)
+    return True
 
-            if i < total - 1:
-                time.sleep(0.001)  # Mic delay pentru UDP
 
-        print(f"{total} fragmente trimise")
+def handle_fragmented_binar(file_path, fisier, st, sock, client_addr, token=b"", comprimat=False):
+    #mod binar: fragmentul 0 pleaca in raspunsul la cerere, aici se trimit restul (cu optiunea Fragment)
+    total = fragmente_fisier(st.st_size, MAX_BINARY_PAYLOAD)
+    if total < 2:
         return True
-    except Exception as e:
-        print(f"Eroare download fragmentat: {e}")
-        return False
\ No newline at end of file
+
+    trimite_fragmente(file_path, fisier, st, range(1, total), True, sock, client_addr, token, comprimat)
+    return True
@@ -1,24 +1,66 @@
 import os
-import shutil
-import struct
 import json
 import base64
+import logging
+import struct
+import tempfile
+import threading
+import zlib
+import bisect
+import hashlib
+import cache_continut
+import cache_director
+import compresie
+import deduplicare
+import durabilitate
+import executor_io
 import fragmentare_pachet as frag
-from threading_manager import submit_response
+import jurnal
+import metrici
+import observare
+import sharding
+import stocare
+from coap_codec import (
+    construieste_pachet,
+    encode_block,
+    encode_uint,
+    marime_bloc,
+    FORMAT_BINAR,
+    FORMAT_JSON,
+    OPT_BLOCK1,
+    OPT_BLOCK2,
+    OPT_CONTENT_FORMAT,
+    OPT_ETAG,
+    OPT_MAX_AGE,
+    OPT_OBSERVE,
+    OPT_SHA256,
+    OPT_SIZE2,
+)
+from threading_manager import RETRY_MAX_AGE, submit_response
+
+log = logging.getLogger(__name__)
 
-PAYLOAD_MARKER = 0xFF
 STORAGE = "storage"
 
+#token-ul cererii procesate in threadul curent (ecou in raspunsuri)
+_cerere = threading.local()
+
 # Coduri CoAP
 COAP = {
     "CREATED": 65,  # 2.01
     "DELETED": 66,  # 2.02
     "CHANGED": 68,  # 2.04
     "CONTENT": 69,  # 2.05
+    "CONTINUE": 95,  # 2.31
     "BAD_REQUEST": 128,  # 4.00
+    "BAD_OPTION": 130,  # 4.02
     "NOT_FOUND": 132,  # 4.04
+    "PRECONDITION_FAILED": 140,  # 4.12
+    "REQUEST_ENTITY_TOO_LARGE": 141,  # 4.13
+    "UNSUPPORTED_FORMAT": 143,  # 4.15
     "UNPROCESSABLE": 150,  # 4.22
-    "SERVER_ERROR": 160  # 5.00
+    "SERVER_ERROR": 160,  # 5.00
+    "SERVICE_UNAVAILABLE": 163  # 5.03
 }
 
 
@@ -34,14 +76,62 @@ def valideaza_director(file_path):
     return file_path.split("/")[0] == STORAGE
 
 
-def build_response(sock, client_addr, msg_id, payload, code=69, msg_type=2):
-    #Construiește și trimite răspuns
-    first_byte = (1 << 6) | (msg_type << 4)  # version=1, tkl=0
-    header = struct.pack("!BBH", first_byte, code, msg_id)
-    packet = header + bytes([PAYLOAD_MARKER]) + payload
+def seteaza_token(token):
+    #inceputul (sau sfarsitul) procesarii unei cereri in threadul curent
+    _cerere.token = token
+    _cerere.cod = None
+
+
+def cod_raspuns():
+    #codul primului raspuns trimis pentru cererea curenta (pentru metrici)
+    return getattr(_cerere, "cod", None)
+
+
+def token_curent():
+    return getattr(_cerere, "token", b"")
+
+
+def seteaza_observare(seq):
+    #numarul Observe pus in raspunsurile 2.xx ale cererii curente (None = cerere fara Observe)
+    _cerere.observe = seq
+
+
+def build_response(sock, client_addr, msg_id, payload, code=69, msg_type=2, options=None, token=None):
+    #Construiește și trimite răspuns; implicit cu token-ul cererii curente
+    if token is None:
+        token = token_curent()
+    seq = getattr(_cerere, "observe", None)
+    if seq is not None and 64 <= code < 128:
+        options = (options or []) + [(OPT_OBSERVE, encode_uint(seq))]
+    if getattr(_cerere, "cod", None) is None:
+        _cerere.cod = code
+    packet = construieste_pachet(msg_type, code, msg_id, payload, token, options)
+    #pastrat pentru retransmisiile cererii (acelasi client + Message ID + token)
+    deduplicare.memoreaza(client_addr, msg_id, token, packet)
     submit_response(sock, client_addr, packet)
 
 
+def raspuns_suprasarcina(sock, client_addr, msg_id, max_age, token=b""):
+    #5.03 trimis imediat cand coada de cereri e plina; Max-Age = cand sa reincerce clientul
+    error = json.dumps(
+        {
+            "status": "error",
+            "message": "Server overloaded",
+            "retry_after": max_age
+        }).encode("utf-8")
+    build_response(sock, client_addr, msg_id, error, COAP["SERVICE_UNAVAILABLE"],
+                   options=[(OPT_MAX_AGE, encode_uint(max_age))], token=token)
+
+
+def raspuns_io_ocupat(sock, client_addr, msg_id, msg_type, e):
+    #coada executorului de I/O e plina: cererea nu a fost executata, clientul reincearca dupa
+    #Max-Age; o retransmisie cu acelasi Message ID e procesata din nou, nu primeste 5.03 memorat
+    jurnal.esantionat(log, logging.WARNING, "io_ocupat", "Cerere respinsă: %s", e)
+    if msg_type == 0:
+        raspuns_suprasarcina(sock, client_addr, msg_id, RETRY_MAX_AGE, token_curent())
+    deduplicare.uita(client_addr, msg_id, token_curent())
+
+
 # ============================================================================
 # UPLOAD
 # ============================================================================
@@ -60,6 +150,11 @@ def upload_request(payload, msg_type, msg_id, client_addr, sock):
     file_path = payload.get("path")
     content = payload.get("content")
 
+    #fara continut, cu "session": clientul cere starea unui upload fragmentat ca sa-l reia
+    if file_path and content is None and "session" in payload:
+        handle_stare_upload(payload, msg_type, msg_id, client_addr, sock)
+        return
+
     if not file_path or content is None:
         if msg_type == 0:
             error = json.dumps(
@@ -80,41 +175,125 @@ def upload_request(payload, msg_type, msg_id, client_addr, sock):
             build_response(sock, client_addr, msg_id, error, COAP["NOT_FOUND"])
         return
 
-    if frag.is_fragment_upload(payload):
+    #continut comprimat de client: fiecare fragment/bloc e decomprimat separat, inainte de scriere
+    encoding = payload.get("encoding")
+    if encoding is not None:
+        try:
+            content = decomprima_upload(payload, content)
+        except ValueError as e:
+            if msg_type == 0:
+                unsupported = encoding != compresie.DEFLATE
+                error = json.dumps(
+                    {
+                        "status": "error",
+                        "message": str(e)
+                    }).encode("utf-8")
+                build_response(sock, client_addr, msg_id, error,
+                               COAP["UNSUPPORTED_FORMAT"] if unsupported else COAP["BAD_REQUEST"])
+            return
+
+    #CRC32 al octetilor fragmentului (dupa decodare/decomprimare): un fragment corupt e respins
+    #singur, upload-ul ramane in curs si clientul retrimite doar acel fragment
+    if "crc32" in payload:
+        content = verifica_crc(payload, content)
+        if content is None:
+            if msg_type == 0:
+                resp = {
+                    "status": "error",
+                    "message": "CRC32 mismatch"
+                }
+                if frag.is_fragment_upload(payload):
+                    resp["fragment"] = payload["fragment"]
+                options = None
+                if "block1" in payload:
+                    options = [(OPT_BLOCK1, encode_block(*payload["block1"]))]
+                build_response(sock, client_addr, msg_id, json.dumps(resp).encode("utf-8"),
+                               COAP["BAD_REQUEST"], options=options)
+            return
+
+    if "block1" in payload:
+        handle_block1_upload(payload, msg_type, msg_id, client_addr, sock)
+    elif frag.is_fragment_upload(payload):
         handle_fragmented_upload(payload, msg_type, msg_id, client_addr, sock)
     else:
-        handle_normal_upload(file_path, content, msg_type, msg_id, client_addr, sock)
+        handle_normal_upload(file_path, content, msg_type, msg_id, client_addr, sock,
+                             payload.get("compressed_size"), payload.get("sha256"))
+
+
+def verifica_crc(payload, content):
+    #octetii decodati (pastrati in payload, ca sa nu fie decodati a doua oara) sau None la CRC gresit
+    data = content if isinstance(content, (bytes, memoryview)) else base64.b64decode(content)
+    if zlib.crc32(data) != payload["crc32"]:
+        return None
+    payload["content"] = data
+    return data
+
+
+def decomprima_upload(payload, content):
+    if payload["encoding"] != compresie.DEFLATE:
+        raise ValueError(f"Encoding nesuportat: {payload['encoding']}")
+    data = content if isinstance(content, (bytes, memoryview)) else base64.b64decode(content)
+    #un fragment/bloc e limitat la MAX_DECOMPRIMAT, un upload dintr-un pachet la MAX_FILE_SIZE
+    limita = compresie.MAX_DECOMPRIMAT
+    if "block1" not in payload and not frag.is_fragment_upload(payload):
+        limita = frag.MAX_FILE_SIZE
+    try:
+        raw = compresie.decomprima(data, limita)
+    except zlib.error as e:
+        raise ValueError(f"Continut deflate invalid: {e}")
+    payload["content"] = raw
+    payload["compressed_size"] = len(data)
+    return raw
 
 
-def handle_normal_upload(file_path, content, msg_type, msg_id, client_addr, sock):
+def handle_normal_upload(file_path, content, msg_type, msg_id, client_addr, sock, compressed_size=None,
+                         sha256=None):
     try:
-        file_bytes = base64.b64decode(content)
+        #in mod binar continutul vine deja ca octeti
+        file_bytes = content if isinstance(content, (bytes, memoryview)) else base64.b64decode(content)
 
         if len(file_bytes) > frag.MAX_FILE_SIZE:
-            raise ValueError(f"Fișier prea mare: max {frag.MAX_FILE_SIZE} bytes")
+            raise frag.FisierPreaMare(f"Fișier prea mare: max {frag.MAX_FILE_SIZE} bytes")
 
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        #digest-ul continutului, verificat fata de cel anuntat de client inainte de scriere
+        digest = hashlib.sha256(file_bytes).hexdigest()
+        if sha256 is not None and sha256.lower() != digest:
+            if msg_type == 0:
+                error = json.dumps(
+                    {
+                        "status": "error",
+                        "message": "SHA-256 mismatch",
+                        "sha256": digest
+                    }).encode("utf-8")
+                build_response(sock, client_addr, msg_id, error, COAP["BAD_REQUEST"])
+            return
 
-        with open(file_path, "wb") as f:
-            f.write(file_bytes)
-            f.flush()
-            os.fsync(f.fileno())
+        executor_io.mic(scrie_upload, file_path, file_bytes, digest)
+        path_modificat(file_path)
 
-        file_size = os.path.getsize(file_path)
+        file_size = len(file_bytes)
 
         if msg_type == 0:
-            resp = json.dumps(
-                {
-                    "status": "created",
-                    "path": file_path,
-                    "size": file_size
-                }).encode("utf-8")
-            build_response(sock, client_addr, msg_id, resp, COAP["CREATED"])
+            resp = {
+                "status": "created",
+                "path": file_path,
+                "size": file_size,
+                "sha256": digest
+            }
+            if compressed_size is not None:
+                resp["compressed_size"] = compressed_size
+            build_response(sock, client_addr, msg_id, json.dumps(resp).encode("utf-8"), COAP["CREATED"])
 
-        print(f"Upload: {file_path} ({file_size} bytes)")
+        log.debug("Upload: %s (%d bytes)", file_path, file_size)
+
+    except frag.FisierPreaMare as e:
+        raspuns_upload_respins(sock, client_addr, msg_id, msg_type, e)
+
+    except executor_io.CoadaPlina as e:
+        raspuns_io_ocupat(sock, client_addr, msg_id, msg_type, e)
 
     except Exception as e:
-        print(f"Eroare upload: {e}")
+        log.error("Eroare upload: %s", e)
         if msg_type == 0:
             error = json.dumps(
                 {
@@ -124,6 +303,99 @@ def handle_normal_upload(file_path, content, msg_type, msg_id, client_addr, sock
             build_response(sock, client_addr, msg_id, error, COAP["SERVER_ERROR"])
 
 
+def scrie_upload(file_path, file_bytes, digest):
+    #upload dintr-un pachet: fisier temporar (in UPLOAD_TMP, pe acelasi sistem de fisiere) + fsync
+    #+ os.replace, deci o cadere in timpul scrierii nu lasa un fisier trunchiat in storage/
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    if stocare.activ():
+        stocare.scrie_octeti(file_path, file_bytes, digest)
+        return
+    fd, tmp_path = tempfile.mkstemp(dir=frag.director_tmp(), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(file_bytes)
+            f.flush()
+            stocare.seteaza_digest(f.fileno(), digest)
+            durabilitate.sincronizeaza(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    durabilitate.sincronizeaza_director(os.path.dirname(file_path))
+
+
+def finalizeaza_upload(tmp_path, file_path, digest):
+    #fisierul temporar complet (deja sincronizat in modul fisiere) ia locul destinatiei atomic;
+    #in modul chunk e impartit in chunk-uri si la destinatie ramane manifestul.
+    #digest-ul calculat incremental la asamblare e salvat odata cu fisierul
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    if stocare.activ():
+        stocare.scrie_din_fisier(tmp_path, file_path, digest)
+    else:
+        fd = os.open(tmp_path, os.O_RDONLY)
+        try:
+            stocare.seteaza_digest(fd, digest)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, file_path)
+        durabilitate.sincronizeaza_director(os.path.dirname(file_path))
+    path_modificat(file_path)
+
+
+def asambleaza(adauga, file_path, *args):
+    #fragmentul/blocul si, daca a fost ultimul, mutarea fisierului in storage/ ruleaza in aceeasi
+    #lucrare pe executor: cand sesiunea iese din assembler, fisierul temporar e mutat sau sters,
+    #nu poate ramane orfan din cauza unei cozi pline intre cele doua etape
+    rezultat = adauga(file_path, *args)
+    if rezultat[0]:
+        try:
+            finalizeaza_upload(rezultat[1], file_path, rezultat[3])
+        except BaseException:
+            try:
+                os.remove(rezultat[1])
+            except FileNotFoundError:
+                pass
+            raise
+    return rezultat
+
+
+def raspuns_integritate(sock, client_addr, msg_id, msg_type, e):
+    #fisierul asamblat nu are digest-ul anuntat: upload-ul e abandonat, clientul il reia de la zero
+    log.warning("Upload respins: %s", e)
+    if msg_type == 0:
+        error = json.dumps(
+            {
+                "status": "error",
+                "message": str(e)
+            }).encode("utf-8")
+        build_response(sock, client_addr, msg_id, error, COAP["BAD_REQUEST"])
+
+
+def raspuns_upload_respins(sock, client_addr, msg_id, msg_type, e):
+    #fragment/bloc cu index, total sau Size1 invalid (4.00), sau upload peste MAX_FILE_SIZE (4.13)
+    log.warning("Upload respins: %s", e)
+    if msg_type == 0:
+        error = json.dumps(
+            {
+                "status": "error",
+                "message": str(e)
+            }).encode("utf-8")
+        code = COAP["REQUEST_ENTITY_TOO_LARGE"] if isinstance(e, frag.FisierPreaMare) else COAP["BAD_REQUEST"]
+        build_response(sock, client_addr, msg_id, error, code)
+
+
+def path_modificat(path):
+    #punct comun apelat dupa orice upload/stergere/mutare: intrarile din cache-uri
+    #pentru path (si tot ce e sub el) nu mai sunt valide
+    cache_continut.invalideaza(path)
+    cache_director.invalideaza(path)
+    observare.notifica(path)
+    sharding.anunta_modificare(path)
+
+
 def handle_fragmented_upload(payload, msg_type, msg_id, client_addr, sock):
     #Upload fragmentat
     file_path = payload.get("path")
@@ -131,54 +403,162 @@ def handle_fragmented_upload(payload, msg_type, msg_id, client_addr, sock):
 
     index, total, size = frag.get_fragment_info(payload)
 
-    print(f"[←] Fragment {index + 1}/{total} pentru {file_path}")
 
-    is_complete, assembled = frag.assembler.add_fragment(file_path, index, total, content)
+    try:
+        #fragmentul e decodat si scris direct in fisierul temporar al upload-ului; ultimul fragment
+        #muta si fisierul complet in storage/
+        is_complete, _, file_size, digest = executor_io.masiv(
+            asambleaza, frag.assembler.add_fragment, file_path, index, total, content, payload.get("session"),
+            payload.get("sha256"))
+
+        # ACK pentru fiecare fragment
+        if not is_complete:
+            progress = frag.assembler.get_progress(file_path)
+            if progress:
+                #per fragment: doar un eveniment din jurnal.ESANTION, si doar la nivel DEBUG
+                jurnal.debug_esantionat(log, "fragment_upload", "Fragment %d/%d pentru %s, progres %d/%d",
+                                        index + 1, total, file_path, progress["received"], progress["total"])
+
+            # Trimite ACK intermediar
+            if msg_type == 0:
+                resp = {
+                    "status": "fragment_received",
+                    "fragment": {"index": index, "total": total}
+                }
+                #sesiunea cu care clientul poate relua upload-ul dupa o intrerupere
+                if progress:
+                    resp["session"] = progress["session"]
+                build_response(sock, client_addr, msg_id, json.dumps(resp).encode("utf-8"), COAP["CONTENT"])
+            return
 
-    # ACK pentru fiecare fragment
-    if not is_complete:
-        progress = frag.assembler.get_progress(file_path)
-        if progress:
-            print(f"    Progres: {progress['received']}/{progress['total']} ({progress['percentage']:.1f}%)")
+        # COMPLET - fișierul e deja în storage/, trimitem ACK
+        log.debug("Upload complet: %s (%d bytes, %d fragmente)", file_path, file_size, total)
 
-        # Trimite ACK intermediar
         if msg_type == 0:
             resp = json.dumps({
-                "status": "fragment_received",
-                "fragment": {"index": index, "total": total}
+                "status": "created",
+                "path": file_path,
+                "size": file_size,
+                "fragments": total,
+                "sha256": digest
             }).encode("utf-8")
-            build_response(sock, client_addr, msg_id, resp, COAP["CONTENT"])
+            build_response(sock, client_addr, msg_id, resp, COAP["CREATED"])
+
+    except frag.IntegritateInvalida as e:
+        raspuns_integritate(sock, client_addr, msg_id, msg_type, e)
+
+    except frag.FragmentInvalid as e:
+        raspuns_upload_respins(sock, client_addr, msg_id, msg_type, e)
+
+    except frag.FisierPreaMare as e:
+        frag.assembler.clear_path(file_path)
+        raspuns_upload_respins(sock, client_addr, msg_id, msg_type, e)
+
+    except frag.SesiuneInvalida as e:
+        #sesiunea a expirat: upload-ul altui client pe acelasi path ramane neatins, clientul reincepe
+        if msg_type == 0:
+            error = json.dumps(
+                {
+                    "status": "error",
+                    "message": str(e)
+                }).encode("utf-8")
+            build_response(sock, client_addr, msg_id, error, COAP["PRECONDITION_FAILED"])
+
+    except executor_io.CoadaPlina as e:
+        #fragmentul nu a fost scris; upload-ul ramane in curs si clientul il retrimite
+        raspuns_io_ocupat(sock, client_addr, msg_id, msg_type, e)
+
+    except Exception as e:
+        log.error("Eroare asamblare: %s", e)
+        frag.assembler.clear_path(file_path)
+        if msg_type == 0:
+            error = json.dumps(
+                {
+                    "status": "error",
+                    "message": str(e)
+                }).encode("utf-8")
+            build_response(sock, client_addr, msg_id, error, COAP["SERVER_ERROR"])
+
+
+def handle_stare_upload(payload, msg_type, msg_id, client_addr, sock):
+    #starea unui upload in curs: clientul retrimite doar fragmentele marcate lipsa in bitmap;
+    #"session": null cere starea upload-ului curent pe path (ex. Block1 sau mod binar)
+    file_path = payload.get("path")
+    resp_type = 1 if msg_type == 1 else 2
+    status = frag.assembler.get_status(file_path, payload.get("session"))
+
+    if status is None:
+        error = json.dumps(
+            {
+                "status": "error",
+                "message": "Upload session not found"
+            }).encode("utf-8")
+        build_response(sock, client_addr, msg_id, error, COAP["NOT_FOUND"], resp_type)
         return
 
-    # COMPLET - salvăm și trimitem ACK
-    try:
-        file_bytes = base64.b64decode(assembled)
+    status["status"] = "in_progress"
+    status["path"] = file_path
+    build_response(sock, client_addr, msg_id, json.dumps(status).encode("utf-8"), COAP["CONTENT"], resp_type)
+    log.debug("Stare upload: %s (%d/%s fragmente)", file_path, status["received"], status["total"])
 
-        if len(file_bytes) > frag.MAX_FILE_SIZE:
-            raise ValueError(f"Fișier prea mare: max {frag.MAX_FILE_SIZE} bytes")
 
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+def handle_block1_upload(payload, msg_type, msg_id, client_addr, sock):
+    #Upload pe blocuri (Block1, RFC 7959), fiecare bloc scris la offsetul lui
+    file_path = payload.get("path")
+    data = payload.get("content")
+    num, more, szx = payload["block1"]
+    szx = min(szx, 6)
+    size = marime_bloc(szx)
 
-        with open(file_path, "wb") as f:
-            f.write(file_bytes)
-            f.flush()
-            os.fsync(f.fileno())
+    if more and len(data) != size:
+        if msg_type == 0:
+            error = json.dumps(
+                {
+                    "status": "error",
+                    "message": "Block size mismatch"
+                }).encode("utf-8")
+            build_response(sock, client_addr, msg_id, error, COAP["BAD_REQUEST"])
+        return
+
+    try:
+        is_complete, _, file_size, digest = executor_io.masiv(
+            asambleaza, frag.assembler.add_block, file_path, num, more, size, data, payload.get("size1"),
+            payload.get("sha256"))
 
-        file_size = os.path.getsize(file_path)
+        if not is_complete:
+            #2.31 Continue: blocul a fost scris, clientul trimite urmatorul
+            if msg_type == 0:
+                build_response(sock, client_addr, msg_id, b"", COAP["CONTINUE"],
+                               options=[(OPT_BLOCK1, encode_block(num, more, szx))])
+            return
 
-        print(f"Upload complet: {file_path} ({file_size} bytes, {total} fragmente)")
+        log.debug("Upload complet (Block1): %s (%d bytes)", file_path, file_size)
 
         if msg_type == 0:
             resp = json.dumps({
                 "status": "created",
                 "path": file_path,
                 "size": file_size,
-                "fragments": total
+                "sha256": digest
             }).encode("utf-8")
-            build_response(sock, client_addr, msg_id, resp, COAP["CREATED"])
+            build_response(sock, client_addr, msg_id, resp, COAP["CREATED"],
+                           options=[(OPT_BLOCK1, encode_block(num, False, szx))])
+
+    except frag.IntegritateInvalida as e:
+        raspuns_integritate(sock, client_addr, msg_id, msg_type, e)
+
+    except frag.FragmentInvalid as e:
+        raspuns_upload_respins(sock, client_addr, msg_id, msg_type, e)
+
+    except frag.FisierPreaMare as e:
+        frag.assembler.clear_path(file_path)
+        raspuns_upload_respins(sock, client_addr, msg_id, msg_type, e)
+
+    except executor_io.CoadaPlina as e:
+        raspuns_io_ocupat(sock, client_addr, msg_id, msg_type, e)
 
     except Exception as e:
-        print(f"Eroare asamblare: {e}")
+        log.error("Eroare asamblare: %s", e)
         frag.assembler.clear_path(file_path)
         if msg_type == 0:
             error = json.dumps(
@@ -189,6 +569,17 @@ def handle_fragmented_upload(payload, msg_type, msg_id, client_addr, sock):
             build_response(sock, client_addr, msg_id, error, COAP["SERVER_ERROR"])
 
 
+# ============================================================================
+# METRICI
+# ============================================================================
+
+def metrici_request(payload, msg_type, msg_id, client_addr, sock):
+    #GET /.well-known/metrics: cereri, latente, cozi, threaduri, upload-uri, cache-uri
+    resp_type = 1 if msg_type == 1 else 2
+    build_response(sock, client_addr, msg_id, metrici.serializeaza(), COAP["CONTENT"], resp_type,
+                   [(OPT_CONTENT_FORMAT, encode_uint(FORMAT_JSON))])
+
+
 # ============================================================================
 # DOWNLOAD
 # ============================================================================
@@ -226,23 +617,62 @@ def download_request(payload, msg_type, msg_id, client_addr, sock):
         return
 
     try:
-        with open(file_path, "rb") as f:
-            file_bytes = f.read()
-
-        file_size = len(file_bytes)
-
-        if file_size > frag.MAX_FILE_SIZE:
-            raise ValueError(f"Fișier prea mare: max {frag.MAX_FILE_SIZE} bytes")
-
-        content_b64 = base64.b64encode(file_bytes).decode("utf-8")
-
-        if len(content_b64) > frag.MAX_PAYLOAD_SIZE:
-            handle_fragmented_download(file_path, content_b64, file_size, sock, client_addr, msg_id, msg_type)
-        else:
-            handle_normal_download(file_path, file_size, content_b64, sock, client_addr, msg_id, msg_type)
+        #fisier obisnuit sau manifest de chunk-uri (stocare.py), citit la fel prin pread; deschiderea
+        #si blocurile citite pentru raspuns trec prin executorul de citire. Fragmentele urmatoare
+        #sunt citite de threadul de transmisie (transmisie.py), nu de workerul de cereri
+        with executor_io.citire(stocare.deschide, file_path) as fisier:
+            #GET pe interval: se citeste doar partea ceruta, trimisa la fel ca un fisier intreg
+            if "range" in payload:
+                try:
+                    offset, length = interval_cerut(payload["range"], fisier.st.st_size)
+                except (ValueError, TypeError) as e:
+                    error = json.dumps(
+                        {
+                            "status": "error",
+                            "message": str(e),
+                            "file_size": fisier.st.st_size
+                        }).encode("utf-8")
+                    build_response(sock, client_addr, msg_id, error, COAP["BAD_REQUEST"], 1 if msg_type == 1 else 2)
+                    return
+                fisier = stocare.Interval(fisier, offset, length)
+
+            st = fisier.st
+            file_size = st.st_size
+
+            if file_size > frag.MAX_FILE_SIZE:
+                raise ValueError(f"Fișier prea mare: max {frag.MAX_FILE_SIZE} bytes")
+
+            #compresie deflate per fragment, daca a fost ceruta de client (Block2 ramane necomprimat)
+            comprimat = payload.get("compress") == compresie.DEFLATE
+            #"ack": false - clientul nu confirma fragmentele, primeste fisierul direct in bucla deschisa
+            fara_ack = payload.get("ack") is False
+
+            #retransmisie selectiva: doar fragmentele pierdute dintr-un download anterior
+            if "missing" in payload or "bitmap" in payload:
+                handle_retransmisie(file_path, fisier, st, payload, sock, client_addr, msg_id, msg_type)
+                return
+
+            #Block2 (RFC 7959): se citeste doar blocul cerut
+            if "block2" in payload:
+                handle_block2_download(file_path, fisier, st, payload["block2"], sock, client_addr, msg_id, msg_type)
+                return
+
+            #mod binar negociat (Accept: application/octet-stream) - fara base64/JSON
+            if payload.get("binary"):
+                handle_binary_download(file_path, fisier, st, sock, client_addr, msg_id, msg_type, comprimat)
+                return
+
+            if frag.fragmente_fisier(file_size) > 1:
+                handle_fragmented_download(file_path, fisier, st, sock, client_addr, msg_id, msg_type, comprimat,
+                                           fara_ack)
+            else:
+                handle_normal_download(file_path, fisier, st, sock, client_addr, msg_id, msg_type, comprimat)
+
+    except executor_io.CoadaPlina as e:
+        raspuns_io_ocupat(sock, client_addr, msg_id, msg_type, e)
 
     except Exception as e:
-        print(f"Eroare download: {e}")
+        log.error("Eroare download: %s", e)
         if msg_type == 0:
             error = json.dumps(
                 {
@@ -252,43 +682,313 @@ def download_request(payload, msg_type, msg_id, client_addr, sock):
             build_response(sock, client_addr, msg_id, error, COAP["SERVER_ERROR"])
 
 
-def handle_normal_download(file_path, file_size, content_b64, sock, client_addr, msg_id, msg_type):
-    resp = json.dumps({
-        "name": os.path.basename(file_path),
-        "size": file_size,
-        "content": content_b64
-    }).encode("utf-8")
+def interval_cerut(cerere, file_size):
+    #"range": {"offset": o, "length": n} (fara length: pana la sfarsit) sau {"suffix": n} (ultimii n octeti);
+    #intervalul e limitat la sfarsitul fisierului, iar offset == file_size da un raspuns gol (tail fara date noi)
+    if not isinstance(cerere, dict):
+        raise ValueError("range trebuie sa fie un obiect")
+    if "suffix" in cerere:
+        suffix = cerere["suffix"]
+        if not isinstance(suffix, int) or suffix < 0:
+            raise ValueError("suffix invalid")
+        offset = max(0, file_size - suffix)
+        return offset, file_size - offset
+
+    offset = cerere.get("offset", 0)
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("offset invalid")
+    if offset > file_size:
+        raise ValueError("Range in afara fisierului")
+    length = cerere.get("length", file_size - offset)
+    if not isinstance(length, int) or length < 0:
+        raise ValueError("length invalid")
+    return offset, min(length, file_size - offset)
+
+
+def info_interval(resp, fisier):
+    #raspunsurile la un GET pe interval spun ce parte contin si marimea totala a fisierului
+    if isinstance(fisier, stocare.Interval):
+        resp["range"] = {"offset": fisier.offset, "length": fisier.st.st_size, "file_size": fisier.file_size}
+    return resp
+
+
+def etag_fisier(st):
+    #ETag din mtime si marime: se schimba la orice rescriere a fisierului
+    return struct.pack("!I", zlib.crc32(b"%d:%d" % (st.st_mtime_ns, st.st_size)))
+
+
+def handle_normal_download(file_path, fisier, st, sock, client_addr, msg_id, msg_type, comprimat=False):
+    file_size = st.st_size
+
+    def produce():
+        data = executor_io.citire(frag.citeste_bloc, fisier, 0, file_size)
+        ok = False
+        if comprimat:
+            data, ok = compresie.comprima(data)
+        resp = {
+            "name": os.path.basename(file_path),
+            "size": file_size,
+            "content": base64.b64encode(data).decode("utf-8")
+        }
+        digest = fisier.digest()
+        if digest is not None:
+            resp["sha256"] = digest
+        if ok:
+            resp["encoding"] = compresie.DEFLATE
+            resp["compressed_size"] = len(data)
+        return json.dumps(info_interval(resp, fisier)).encode("utf-8")
+
+    #raspunsul JSON complet, refolosit cat timp fisierul nu se schimba
+    tip = "raspuns+deflate" if comprimat else "raspuns"
+    resp = cache_continut.obtine(cache_continut.cheie(file_path, st, tip), produce)
     if msg_type == 0:
         build_response(sock, client_addr, msg_id, resp, COAP["CONTENT"])
     elif msg_type == 1:
         build_response(sock, client_addr, msg_id, resp, COAP["CONTENT"],1)
 
-    print(f"Download: {file_path} ({file_size} bytes)")
+    log.debug("Download: %s (%d bytes)", file_path, file_size)
+
+
+def handle_block2_download(file_path, fisier, st, block2, sock, client_addr, msg_id, msg_type):
+    #un singur bloc per cerere, citit cu pread; memoria e O(marime bloc)
+    num, _, szx = block2
+    #BERT (szx 7) nu exista peste UDP, folosim blocul maxim
+    szx = min(szx, 6)
+    size = marime_bloc(szx)
+    offset = num * size
+    file_size = st.st_size
+    resp_type = 1 if msg_type == 1 else 2
+
+    if offset >= file_size and not (num == 0 and file_size == 0):
+        error = json.dumps(
+            {
+                "status": "error",
+                "message": "Block out of range"
+            }).encode("utf-8")
+        build_response(sock, client_addr, msg_id, error, COAP["BAD_OPTION"], resp_type)
+        return
+
+    data = cache_continut.obtine(cache_continut.cheie(file_path, st, "block2", (szx, num)),
+                                 lambda: executor_io.citire(frag.citeste_bloc, fisier, offset, size))
+    more = offset + len(data) < file_size
+
+    options = [
+        (OPT_ETAG, etag_fisier(st)),
+        (OPT_CONTENT_FORMAT, encode_uint(FORMAT_BINAR)),
+        (OPT_BLOCK2, encode_block(num, more, szx)),
+        (OPT_SIZE2, encode_uint(file_size)),
+    ]
+    #SHA-256 salvat la upload, doar in primul bloc (ca Size2, clientul il afla la inceputul transferului)
+    if num == 0:
+        digest = fisier.digest()
+        if digest is not None:
+            options.append((OPT_SHA256, bytes.fromhex(digest)))
+    build_response(sock, client_addr, msg_id, data, COAP["CONTENT"], resp_type, options)
+
+
+def handle_binary_download(file_path, fisier, st, sock, client_addr, msg_id, msg_type, comprimat=False):
+    #continutul este payload-ul CoAP, metadatele sunt in optiuni (Content-Format, Size2, Fragment,
+    #marimea originala a blocului daca e comprimat si SHA-256 salvat la upload)
+    file_size = st.st_size
+    total = frag.fragmente_fisier(file_size, frag.MAX_BINARY_PAYLOAD)
+    resp_type = 1 if msg_type == 1 else 2
+    first = executor_io.citire(frag.corp_fragment, fisier, file_path, 0, total, st, True, comprimat)
+    optiuni_extra = frag.optiuni_compresie(first, frag.marime_bloc_binar(0, file_size))
+    digest = fisier.digest()
+    if digest is not None:
+        optiuni_extra.append((OPT_SHA256, bytes.fromhex(digest)))
+
+    if total == 1:
+        options = [(OPT_CONTENT_FORMAT, encode_uint(FORMAT_BINAR)),
+                   (OPT_SIZE2, encode_uint(file_size))] + optiuni_extra
+        build_response(sock, client_addr, msg_id, first, COAP["CONTENT"], resp_type, options)
+        log.debug("Download binar: %s (%d bytes)", file_path, file_size)
+        return
+
+    log.debug("Download binar fragmentat: %d bytes → %d fragmente", file_size, total)
 
+    #primul fragment este chiar raspunsul (piggybacked), restul urmeaza ca CON;
+    #ETag-ul identifica versiunea pentru retransmisiile selective
+    etag = etag_fisier(st)
+    build_response(sock, client_addr, msg_id, first, COAP["CONTENT"], resp_type,
+                   [(OPT_ETAG, etag)] + frag.optiuni_fragment_binar(0, total, file_size) + optiuni_extra)
+    frag.handle_fragmented_binar(file_path, fisier, st, sock, client_addr, token_curent(), comprimat)
 
-def handle_fragmented_download(file_path, content_b64, file_size, sock, client_addr, msg_id, msg_type):
-    total = frag.fragmente_necesare(content_b64)
 
-    print(f"Download fragmentat: {file_size} bytes → {total} fragmente")
+def handle_fragmented_download(file_path, fisier, st, sock, client_addr, msg_id, msg_type, comprimat=False,
+                               fara_ack=False):
+    file_size = st.st_size
+    total = frag.fragmente_fisier(file_size)
+    etag = etag_fisier(st)
+
+    log.debug("Download fragmentat: %d bytes → %d fragmente", file_size, total)
 
     # Info inițial
     if msg_type == 0:
-        info = json.dumps({
+        info = {
             "name": os.path.basename(file_path),
             "size": file_size,
             "fragmented": True,
-            "total_fragments": total
-        }).encode("utf-8")
-        build_response(sock, client_addr, msg_id, info, COAP["CONTENT"])
+            "total_fragments": total,
+            "etag": etag.hex()
+        }
+        #SHA-256 salvat la upload, pentru verificarea fisierului reasamblat de client
+        digest = fisier.digest()
+        if digest is not None:
+            info["sha256"] = digest
+        #fiecare fragment spune daca e comprimat (encoding, raw_size, compressed_size)
+        if comprimat:
+            info["compression"] = compresie.DEFLATE
+        info_interval(info, fisier)
+        build_response(sock, client_addr, msg_id, json.dumps(info).encode("utf-8"), COAP["CONTENT"])
+
+    # Trimite fragmente (citite de pe disc pe masura ce sunt trimise)
+    frag.handle_fragmented(file_path, fisier, st, sock, client_addr, token_curent(), comprimat, fara_ack)
+
+
+def indici_lipsa(payload, total):
+    #"missing": [i, ...] sau "bitmap": base64, bitul i (LSB primul in fiecare octet) = fragment lipsa
+    if "missing" in payload:
+        indici = payload["missing"]
+        if not isinstance(indici, list) or not all(isinstance(i, int) for i in indici):
+            raise ValueError("missing trebuie sa fie o lista de indici")
+    else:
+        bitmap = base64.b64decode(payload["bitmap"])
+        indici = [i for i in range(min(total, len(bitmap) * 8)) if bitmap[i >> 3] & (1 << (i & 7))]
+
+    indici = sorted(set(indici))
+    if indici and (indici[0] < 0 or indici[-1] >= total):
+        raise ValueError(f"Indice de fragment invalid (total {total})")
+    return indici
+
+
+def handle_retransmisie(file_path, fisier, st, payload, sock, client_addr, msg_id, msg_type):
+    #retrimite doar fragmentele cerute, din aceeasi versiune a fisierului;
+    #fragmentele deja trimise sunt luate din cache-ul de continut, fara citire de pe disc
+    file_size = st.st_size
+    binar = bool(payload.get("binary"))
+    total = frag.fragmente_fisier(file_size, frag.MAX_BINARY_PAYLOAD if binar else frag.RAW_CHUNK)
+    etag = etag_fisier(st)
+    resp_type = 1 if msg_type == 1 else 2
+
+    versiune = payload.get("etag")
+    if versiune is not None and versiune != etag.hex():
+        #fisierul s-a schimbat intre timp: fragmentele vechi nu mai pot fi completate
+        error = json.dumps(
+            {
+                "status": "error",
+                "message": "File changed",
+                "etag": etag.hex()
+            }).encode("utf-8")
+        build_response(sock, client_addr, msg_id, error, COAP["PRECONDITION_FAILED"], resp_type,
+                       [(OPT_ETAG, etag)])
+        return
+
+    try:
+        indici = indici_lipsa(payload, total)
+    except (ValueError, TypeError) as e:
+        error = json.dumps(
+            {
+                "status": "error",
+                "message": str(e)
+            }).encode("utf-8")
+        build_response(sock, client_addr, msg_id, error, COAP["BAD_REQUEST"], resp_type)
+        return
+
+    resp = json.dumps(info_interval({
+        "name": os.path.basename(file_path),
+        "etag": etag.hex(),
+        "total_fragments": total,
+        "resent": len(indici)
+    }, fisier)).encode("utf-8")
+    build_response(sock, client_addr, msg_id, resp, COAP["CONTENT"], resp_type, [(OPT_ETAG, etag)])
 
-    # Trimite fragmente
-    frag.handle_fragmented(file_path, content_b64, sock, client_addr, msg_id)
+    if indici:
+        frag.trimite_fragmente(file_path, fisier, st, indici, binar, sock, client_addr, token_curent(),
+                               payload.get("compress") == compresie.DEFLATE, payload.get("ack") is False)
+    log.debug("Retransmisie: %s (%d/%d fragmente)", file_path, len(indici), total)
+
+
+def stare_resursa(path):
+    #reprezentarea trimisa observatorilor: metadatele fisierului sau prima pagina a listarii
+    try:
+        if path.endswith("/") or path == STORAGE:
+            if os.path.isdir(path):
+                return COAP["CONTENT"], json.dumps(pagina_director(path)).encode("utf-8"), []
+        else:
+            st = stocare.stat(path)
+            if not os.path.isdir(path):
+                etag = etag_fisier(st)
+                resp = json.dumps({
+                    "name": os.path.basename(path),
+                    "size": st.st_size,
+                    "etag": etag.hex()
+                }).encode("utf-8")
+                return COAP["CONTENT"], resp, [(OPT_ETAG, etag)]
+    except OSError:
+        pass
+
+    error = json.dumps(
+        {
+            "status": "error",
+            "message": "Not found"
+        }).encode("utf-8")
+    return COAP["NOT_FOUND"], error, []
 
 
 # ============================================================================
 # LISTARE
 # ============================================================================
 
+#numele dintr-o pagina de listare trebuie sa incapa intr-un singur datagram
+LIST_PAGE_BYTES = frag.MAX_PAYLOAD_SIZE - 200
+MAX_LIST_LIMIT = 10000
+
+
+def pagina_listare(payload):
+    #(inceput, limit): inceput e un offset sau cursorul "cursor" (ultimul nume din pagina anterioara)
+    limit = payload.get("limit", MAX_LIST_LIMIT)
+    if not isinstance(limit, int) or not 0 < limit <= MAX_LIST_LIMIT:
+        raise ValueError(f"limit trebuie sa fie intre 1 si {MAX_LIST_LIMIT}")
+
+    cursor = payload.get("cursor")
+    if cursor is not None:
+        if not isinstance(cursor, str):
+            raise ValueError("cursor invalid")
+        return cursor, limit
+
+    offset = payload.get("offset", 0)
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("offset invalid")
+    return offset, limit
+
+
+def pagina_director(dir_path, start=0, limit=MAX_LIST_LIMIT):
+    items = cache_director.intrari(dir_path)
+    if isinstance(start, str):
+        #cursor: continuarea dupa ultimul nume primit, stabila la adaugari/stergeri
+        start = bisect.bisect_right(items, start)
+
+    #pagina se opreste la limit sau cand raspunsul n-ar mai incapea intr-un datagram
+    page = []
+    marime = 0
+    for item in items[start:start + limit]:
+        marime += len(json.dumps(item)) + 2
+        if marime > LIST_PAGE_BYTES and page:
+            break
+        page.append(item)
+    urmator = page[-1] if start + len(page) < len(items) else None
+
+    return {
+        "name": os.path.basename(dir_path.rstrip("/")),
+        "type": "directory",
+        "items": page,
+        "total": len(items),
+        "offset": start,
+        "next": urmator
+    }
+
+
 def listare_director(payload, msg_type, msg_id, client_addr, sock):
     if not payload:
         if msg_type == 0:
@@ -344,26 +1044,32 @@ def listare_director(payload, msg_type, msg_id, client_addr, sock):
                 build_response(sock, client_addr, msg_id, error, COAP["NOT_FOUND"])
             return
 
-        items = []
-        for item in os.listdir(dir_path):
-            item_path = os.path.join(dir_path, item)
-            items.append(item + "/" if os.path.isdir(item_path) else item)
+        try:
+            start, limit = pagina_listare(payload)
+        except ValueError as e:
+            if msg_type == 0:
+                error = json.dumps(
+                    {
+                        "status": "error",
+                        "message": str(e)
+                    }).encode("utf-8")
+                build_response(sock, client_addr, msg_id, error, COAP["BAD_REQUEST"])
+            return
 
-        resp = json.dumps({
-            "name": os.path.basename(dir_path.rstrip("/")),
-            "type": "directory",
-            "items": items
-        }).encode("utf-8")
+        resp = json.dumps(executor_io.metadate(pagina_director, dir_path, start, limit)).encode("utf-8")
 
         if msg_type == 0:
             build_response(sock, client_addr, msg_id, resp, COAP["CONTENT"])
         elif msg_type == 1:
             build_response(sock, client_addr, msg_id, resp, COAP["CONTENT"], 1)
 
-        print(f"Listare: {dir_path}")
+        log.debug("Listare: %s", dir_path)
+
+    except executor_io.CoadaPlina as e:
+        raspuns_io_ocupat(sock, client_addr, msg_id, msg_type, e)
 
     except Exception as e:
-        print(f"Eroare listare: {e}")
+        log.error("Eroare listare: %s", e)
         if msg_type == 0:
             error = json.dumps(
                 {
@@ -421,12 +1127,15 @@ def delete_request(payload, msg_type, msg_id, client_addr, sock):
                 build_response(sock, client_addr, msg_id, error, COAP["NOT_FOUND"])
             return
 
+        #stocare.sterge elibereaza si chunk-urile manifestelor sterse
+        #un director poate contine multe fisiere (rmtree), deci merge pe executorul masiv
         if os.path.isfile(file_path):
-            os.remove(file_path)
-            print(f"Șters fișier: {file_path}")
+            executor_io.metadate(stocare.sterge, file_path)
+            log.debug("Șters fișier: %s", file_path)
         elif os.path.isdir(file_path):
-            shutil.rmtree(file_path)
-            print(f"Șters director: {file_path}")
+            executor_io.masiv(stocare.sterge, file_path)
+            log.debug("Șters director: %s", file_path)
+        path_modificat(file_path)
 
         if msg_type == 0:
             resp = json.dumps(
@@ -436,8 +1145,11 @@ def delete_request(payload, msg_type, msg_id, client_addr, sock):
                 }).encode("utf-8")
             build_response(sock, client_addr, msg_id, resp, COAP["DELETED"])
 
+    except executor_io.CoadaPlina as e:
+        raspuns_io_ocupat(sock, client_addr, msg_id, msg_type, e)
+
     except Exception as e:
-        print(f"Eroare delete: {e}")
+        log.error("Eroare delete: %s", e)
         if msg_type == 0:
             error = json.dumps(
                 {
@@ -496,8 +1208,9 @@ def move_request(payload, msg_type, msg_id, client_addr, sock):
                 build_response(sock, client_addr, msg_id, error, COAP["NOT_FOUND"])
             return
 
-        os.makedirs(os.path.dirname(destination), exist_ok=True)
-        shutil.move(source, destination)
+        executor_io.metadate(muta_resursa, source, destination)
+        path_modificat(source)
+        path_modificat(destination)
 
         if msg_type == 0:
             resp = json.dumps(
@@ -508,10 +1221,19 @@ def move_request(payload, msg_type, msg_id, client_addr, sock):
                 }).encode("utf-8")
             build_response(sock, client_addr, msg_id, resp, COAP["CHANGED"])
 
-        print(f"Mutat: {source} → {destination}")
+        log.debug("Mutat: %s → %s", source, destination)
+
+    except executor_io.CoadaPlina as e:
+        raspuns_io_ocupat(sock, client_addr, msg_id, msg_type, e)
 
     except Exception as e:
-        print(f"Eroare move: {e}")
+        log.error("Eroare move: %s", e)
         if msg_type == 0:
             error = json.dumps({"status": "error", "message": str(e)}).encode("utf-8")
-            build_response(sock, client_addr, msg_id, error, COAP["SERVER_ERROR"])
\ No newline at end of file
+            build_response(sock, client_addr, msg_id, error, COAP["SERVER_ERROR"])
+
+
+def muta_resursa(source, destination):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    #manifestele se muta ca fisiere obisnuite: doar metadate, continutul nu e copiat
+    stocare.muta(source, destination)
@@ -0,0 +1,91 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+#jurnalizare asincrona: threadurile serverului doar pun inregistrarea (neformatata) intr-o coada,
+#formatarea si scrierea la stdout au loc intr-un thread separat (QueueListener).
+#evenimentele per cerere/fragment sunt DEBUG; la nivelul de productie (INFO) ele se opresc la
+#verificarea nivelului, deci calea critica nu formateaza nimic.
+#mesajele folosesc argumente %-style (log.debug("... %s", x)), nu f-string, ca formatarea
+#sa aiba loc doar daca inregistrarea chiar e scrisa
+NIVEL_IMPLICIT = "INFO"
+#din evenimentele frecvente (progres per fragment) se scrie doar unul din ESANTION
+ESANTION = 100
+FORMAT = "%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s"
+
+_coada = None
+_listener = None
+_handler_coada = None
+_contoare = {}
+
+
+class HandlerCoada(logging.handlers.QueueHandler):
+    #QueueHandler.prepare formateaza mesajul in threadul apelant; aici inregistrarea pleaca
+    #neatinsa si e formatata de handlerul din threadul listener
+    def prepare(self, record):
+        return record
+
+
+def configureaza(nivel=NIVEL_IMPLICIT, esantion=ESANTION):
+    global _coada, _listener, _handler_coada, ESANTION
+    ESANTION = max(1, esantion)
+    radacina = logging.getLogger()
+    radacina.setLevel(nivel)
+    if _handler_coada is not None:
+        return
+
+    _coada = queue.SimpleQueue()
+    _handler_coada = HandlerCoada(_coada)
+    radacina.addHandler(_handler_coada)
+    _porneste_listener()
+    atexit.register(opreste)
+    #dupa fork (mod multi-proces) threadul listener nu exista in copil
+    os.register_at_fork(after_in_child=_dupa_fork)
+
+
+def _porneste_listener():
+    global _listener
+    iesire = logging.StreamHandler(sys.stdout)
+    iesire.setFormatter(logging.Formatter(FORMAT))
+    _listener = logging.handlers.QueueListener(_coada, iesire, respect_handler_level=False)
+    _listener.start()
+
+
+def _dupa_fork():
+    #coada mostenita poate contine inregistrari ale parintelui, care le scrie deja
+    global _coada
+    _coada = queue.SimpleQueue()
+    _handler_coada.queue = _coada
+    _porneste_listener()
+
+
+def opreste():
+    #goleste coada (inregistrarile deja puse sunt scrise) si opreste threadul listener
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def esantion(cheie):
+    #True pentru primul eveniment si apoi pentru fiecare al ESANTION-lea cu aceeasi cheie;
+    #next() pe itertools.count e atomic sub GIL, deci nu e nevoie de lock
+    contor = _contoare.get(cheie)
+    if contor is None:
+        contor = _contoare.setdefault(cheie, itertools.count())
+    return next(contor) % ESANTION == 0
+
+
+def esantionat(log, nivel, cheie, msg, *args):
+    #eveniment frecvent (ex. suprasarcina): doar unul din ESANTION ajunge in jurnal;
+    #verificarea nivelului vine prima, deci un nivel dezactivat costa doar un apel
+    if log.isEnabledFor(nivel) and esantion(cheie):
+        log.log(nivel, msg, *args)
+
+
+def debug_esantionat(log, cheie, msg, *args):
+    esantionat(log, logging.DEBUG, cheie, msg, *args)
@@ -1,18 +1,54 @@
+import argparse
+import logging
 import socket
 
-from Pachet import handle_request, parse_packet
+from Pachet import primeste_pachet
 from threading_manager import start_workers, stop_workers
+import sharding
+import cache_continut
+import durabilitate
+import fragmentare_pachet as frag
+import jurnal
+import metrici
+import stocare
+from functii import STORAGE
 
-SERVER_PORT = 5683
-
-# Socket server
-server_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-server_sock.bind(("0.0.0.0", SERVER_PORT))
+log = logging.getLogger("server")
 
-print(f"[*] Server CoAP pornit pe port {SERVER_PORT}")
+SERVER_PORT = 5683
 
-# Pornește worker
-start_workers()
+#modul serverului se alege la pornire: thread (implicit) sau async
+parser = argparse.ArgumentParser(description="Server CoAP - remote storage")
+parser.add_argument("--mod", choices=["thread", "async"], default="thread",
+                    help="thread: recvfrom blocant + threaduri, async: asyncio pe un singur event loop")
+parser.add_argument("--port", type=int, default=SERVER_PORT)
+parser.add_argument("--procese", type=int, default=1,
+                    help="numar de procese worker care impart portul prin SO_REUSEPORT")
+parser.add_argument("--cache-mb", type=int, default=cache_continut.CONTENT_CACHE_BYTES // (1024 * 1024),
+                    help="memorie maxima pentru cache-ul de continut al download-urilor (0 = dezactivat)")
+parser.add_argument("--upload-timeout", type=int, default=frag.FRAGMENT_TIMEOUT,
+                    help="secunde dupa care un upload fragmentat neterminat este sters (si nu mai poate fi reluat)")
+parser.add_argument("--metrici-fisier", default=None,
+                    help="fisier in care se scriu periodic metricile (JSON); implicit doar GET /.well-known/metrics")
+parser.add_argument("--metrici-interval", type=float, default=60.0,
+                    help="secunde intre doua scrieri ale fisierului de metrici")
+parser.add_argument("--log-nivel", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default=jurnal.NIVEL_IMPLICIT,
+                    help="DEBUG scrie fiecare cerere/transfer; INFO (productie) doar pornire, oprire si erori")
+parser.add_argument("--log-esantion", type=int, default=jurnal.ESANTION,
+                    help="din evenimentele per fragment se scrie unul din N (la nivel DEBUG)")
+parser.add_argument("--stocare", choices=["fisiere", "chunk"], default="fisiere",
+                    help="fisiere: fiecare upload e un fisier, chunk: chunk-uri SHA-256 deduplicate + manifeste")
+parser.add_argument("--fsync", choices=durabilitate.POLITICI, default=durabilitate.POLITICA,
+                    help="always: fsync inainte de fiecare ACK, group: fsync-urile concurente adunate in loturi, "
+                         "async: ACK dupa scriere, fsync in fundal")
+parser.add_argument("--fsync-fereastra-ms", type=float, default=durabilitate.FEREASTRA_GRUP * 1000,
+                    help="(group) cat se asteapta alte upload-uri inaintea fsync-ului comun")
+args = parser.parse_args()
+jurnal.configureaza(args.log_nivel, args.log_esantion)
+cache_continut.configureaza(args.cache_mb * 1024 * 1024)
+stocare.configureaza(args.stocare, STORAGE)
+frag.FRAGMENT_TIMEOUT = args.upload_timeout
+durabilitate.configureaza(args.fsync, args.fsync_fereastra_ms)
 
 #test automat la pornire
 # def test_client():
@@ -57,29 +93,64 @@ start_workers()
 # Test în thread separat
 #threading.Thread(target=test_client, daemon=True).start()
 
-# Loop principal
-try:
-    print("[*] Așteaptă cereri...\n")
-
-    while True:
-        try:
-            data, client_addr = server_sock.recvfrom(65535)
+# Loop principal (mod thread)
+def ruleaza_thread(server_sock):
+    # Pornește worker
+    start_workers()
+    try:
+        log.info("Așteaptă cereri")
 
-            header, payload = parse_packet(data)
+        while True:
+            try:
+                data, client_addr = server_sock.recvfrom(65535)
+                primeste_pachet(data, client_addr, server_sock)
 
-            # Ignoră ACK-uri goale
-            if header['type'] == 2 and header['code'] == 0 and not payload:
+            except Exception as e:
+                log.warning("Eroare recvfrom: %s", e)
                 continue
 
-            handle_request(header, payload, client_addr, server_sock)
+    except KeyboardInterrupt:
+        log.info("Oprire server")
+    finally:
+        stop_workers()
+
+
+#ruleaza serverul in modul ales pe un socket deja legat la port
+def ruleaza(server_sock, sock_intern=None):
+    if args.metrici_fisier:
+        #in modul multi-proces fiecare worker scrie propriul fisier (sufix = indexul workerului)
+        cale = args.metrici_fisier
+        if sharding.activ():
+            cale = f"{cale}.{sharding.index_worker()}"
+        metrici.porneste_dump(cale, args.metrici_interval)
+    try:
+        if args.mod == "async":
+            import async_server
+            async_server.ruleaza(server_sock, sock_intern)
+        else:
+            if sock_intern is not None:
+                sharding.asculta_intern(sock_intern, server_sock, primeste_pachet)
+            ruleaza_thread(server_sock)
+    finally:
+        stats = cache_continut.statistici()
+        log.info("Cache conținut: %d hits / %d misses (hit rate %.1f%%, %d bytes, %d evictări)",
+                 stats["hits"], stats["misses"], stats["hit_rate"] * 100, stats["bytes"], stats["evictari"])
+
+
+if args.procese > 1:
+    #launcher: fiecare worker isi leaga propriul socket pe acelasi port (SO_REUSEPORT)
+    log.info("Server CoAP pornit pe port %d (mod %s, %d procese)", args.port, args.mod, args.procese)
+    sharding.lanseaza(args.procese, args.port, ruleaza)
+    log.info("Server oprit")
+else:
+    # Socket server
+    server_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server_sock.bind(("0.0.0.0", args.port))
 
-        except Exception as e:
-            print(f"Eroare recvfrom: {e}")
-            continue
+    log.info("Server CoAP pornit pe port %d (mod %s)", args.port, args.mod)
 
-except KeyboardInterrupt:
-    print("\nOprire server.....................")
-finally:
-    stop_workers()
-    server_sock.close()
-    print("Server oprit")
\ No newline at end of file
+    try:
+        ruleaza(server_sock)
+    finally:
+        server_sock.close()
+        log.info("Server oprit")
@@ -0,0 +1,176 @@
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+#metricile serverului: contoare si histograme in memorie, actualizate pe calea cererilor.
+#inregistrarea e doar cateva adunari sub un lock, deci ramane activa si in productie;
+#restul valorilor (cozi, cache-uri, upload-uri) sunt citite abia cand se cere instantaneul
+PATH_METRICI = ".well-known/metrics"
+
+#limitele superioare ale intervalelor histogramei de latenta, in milisecunde (ultimul = restul)
+LIMITE_MS = (0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+_LIMITE_S = [l / 1000 for l in LIMITE_MS]
+
+METODE = {1: "GET", 2: "POST", 3: "PUT", 4: "DELETE", 5: "MOVE"}
+
+_lock = threading.Lock()
+_cereri = {}           # metoda -> {"total", "coduri", "histograma", "durata_totala", "durata_max"}
+_octeti = {"primiti": 0, "trimisi": 0, "pachete_primite": 0, "pachete_trimise": 0}
+_pornire = time.time()
+
+
+def _metoda_noua():
+    return {
+        "total": 0,
+        "coduri": {},
+        "histograma": [0] * (len(LIMITE_MS) + 1),
+        "durata_totala": 0.0,
+        "durata_max": 0.0,
+    }
+
+
+def cerere(code, cod_raspuns, durata):
+    #o cerere procesata: metoda (codul cererii), codul primului raspuns si durata in secunde
+    metoda = METODE.get(code, str(code))
+    interval = bisect.bisect_left(_LIMITE_S, durata)
+    with _lock:
+        m = _cereri.get(metoda)
+        if m is None:
+            m = _cereri[metoda] = _metoda_noua()
+        m["total"] += 1
+        m["coduri"][cod_raspuns] = m["coduri"].get(cod_raspuns, 0) + 1
+        m["histograma"][interval] += 1
+        m["durata_totala"] += durata
+        if durata > m["durata_max"]:
+            m["durata_max"] = durata
+
+
+def primit(n):
+    with _lock:
+        _octeti["primiti"] += n
+        _octeti["pachete_primite"] += 1
+
+
+def trimis(n):
+    with _lock:
+        _octeti["trimisi"] += n
+        _octeti["pachete_trimise"] += 1
+
+
+def cod_text(cod):
+    #2.05, 4.04 ... (None = cerere fara raspuns, ex. NON fara eroare)
+    if cod is None:
+        return "fara_raspuns"
+    return f"{cod >> 5}.{cod & 31:02d}"
+
+
+def _percentila(histograma, total, p):
+    #limita superioara a intervalului in care cade percentila (aproximare din histograma)
+    prag = total * p
+    cumulat = 0
+    for i, n in enumerate(histograma):
+        cumulat += n
+        if cumulat >= prag and n:
+            return LIMITE_MS[i] if i < len(LIMITE_MS) else None
+    return None
+
+
+def _cereri_instantaneu():
+    with _lock:
+        copie = {metoda: dict(m, coduri=dict(m["coduri"]), histograma=list(m["histograma"]))
+                 for metoda, m in _cereri.items()}
+        octeti = dict(_octeti)
+    cereri = {}
+    for metoda, m in copie.items():
+        total = m["total"]
+        cereri[metoda] = {
+            "total": total,
+            "coduri": {cod_text(c): n for c, n in m["coduri"].items()},
+            "erori": sum(n for c, n in m["coduri"].items() if c is not None and c >= 128),
+            "latenta_ms": {
+                "medie": round(m["durata_totala"] / total * 1000, 3) if total else 0.0,
+                "max": round(m["durata_max"] * 1000, 3),
+                "p50": _percentila(m["histograma"], total, 0.5),
+                "p99": _percentila(m["histograma"], total, 0.99),
+                "histograma": dict(zip([str(l) for l in LIMITE_MS] + ["inf"], m["histograma"])),
+            },
+        }
+    return cereri, octeti
+
+
+def instantaneu():
+    #toate metricile intr-un dict serializabil JSON; modulele sunt importate aici ca sa nu
+    #existe importuri circulare (ele importa metrici pentru contoare)
+    import cache_continut
+    import cache_director
+    import deduplicare
+    import durabilitate
+    import executor_io
+    import fragmentare_pachet
+    import observare
+    import stocare
+    import threading_manager
+    import transmisie
+
+    cereri, octeti = _cereri_instantaneu()
+    return {
+        "timestamp": time.time(),
+        "uptime": round(time.time() - _pornire, 1),
+        "pid": os.getpid(),
+        "cereri": cereri,
+        "octeti": octeti,
+        "coada_raspunsuri": threading_manager.response_queue.qsize(),
+        "pool_cereri": threading_manager.statistici_pool(),
+        "threaduri": threading.active_count(),
+        "uploaduri": fragmentare_pachet.assembler.statistici(),
+        "transferuri": transmisie.in_curs(),
+        "observare": observare.statistici(),
+        "cache_continut": cache_continut.statistici(),
+        "cache_director": cache_director.statistici(),
+        "deduplicare": deduplicare.statistici(),
+        "durabilitate": durabilitate.statistici(),
+        "executor_io": executor_io.statistici(),
+        "stocare": stocare.statistici(),
+    }
+
+
+def serializeaza():
+    return json.dumps(instantaneu(), separators=(",", ":")).encode("utf-8")
+
+
+def _scrie_dump(path):
+    #temporar + os.replace: un cititor (ex. un agent de monitorizare) vede mereu un fisier complet
+    director = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=director, prefix=".metrici-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(serializeaza())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _bucla_dump(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            _scrie_dump(path)
+        except Exception as e:
+            log.warning("Eroare dump metrici: %s", e)
+
+
+def porneste_dump(path, interval):
+    #scrie periodic instantaneul in path (in modul multi-proces fiecare worker are fisierul lui)
+    t = threading.Thread(target=_bucla_dump, args=(path, interval), name="metrici-dump", daemon=True)
+    t.start()
+    return t
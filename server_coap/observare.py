@@ -0,0 +1,225 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import metrici
+import transmisie
+from coap_codec import construieste_pachet, encode_uint, OPT_OBSERVE
+
+log = logging.getLogger(__name__)
+
+#Observe (RFC 7641): clientii inregistrati pe un fisier/director primesc o notificare
+#cand un upload, o stergere sau o mutare schimba resursa, in loc sa interogheze periodic
+MAX_OBSERVATORI = 1024
+MAX_PER_CLIENT = 32
+#modificarile din aceasta fereastra sunt comasate intr-o singura notificare per resursa
+COALESCE = 0.2  # secunde
+#notificarile sunt CON; un observator care nu confirma dupa MAX_RETRANSMIT e sters
+ACK_TIMEOUT = 2.0
+MAX_RETRANSMIT = 4
+
+
+class Observator:
+    def __init__(self, sock, client_addr, token, path):
+        self.sock = sock
+        self.client_addr = client_addr
+        self.token = token
+        self.path = path
+        self.seq = 0
+        #notificarea CON neconfirmata: [msg_id, packet, deadline, retransmisii, rto]
+        self.in_zbor = None
+
+
+_cond = threading.Condition()
+_observatori = {}      # (client_addr, token) -> Observator
+_pe_resursa = {}       # path normalizat -> set de chei
+_pe_client = {}        # client_addr -> numar de inregistrari
+_murdare = set()       # resurse modificate, inca nenotificate
+_prima_modificare = None
+_thread = None
+
+
+def _cheie_resursa(path):
+    return os.path.normpath(path)
+
+
+def inregistreaza(sock, client_addr, token, path):
+    #numarul de secventa pentru raspunsul initial sau None daca registrul e plin
+    token = bytes(token)
+    key = (client_addr, token)
+    with _cond:
+        if key in _observatori:
+            _sterge(key)
+        if len(_observatori) >= MAX_OBSERVATORI or _pe_client.get(client_addr, 0) >= MAX_PER_CLIENT:
+            return None
+
+        resursa = _cheie_resursa(path)
+        obs = Observator(sock, client_addr, token, path)
+        _observatori[key] = obs
+        _pe_resursa.setdefault(resursa, set()).add(key)
+        _pe_client[client_addr] = _pe_client.get(client_addr, 0) + 1
+
+        global _thread
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_bucla, name="observare", daemon=True)
+            _thread.start()
+        return obs.seq
+
+
+def anuleaza(client_addr, token):
+    with _cond:
+        return _sterge((client_addr, bytes(token)))
+
+
+def _sterge(key):
+    obs = _observatori.pop(key, None)
+    if obs is None:
+        return False
+    resursa = _cheie_resursa(obs.path)
+    chei = _pe_resursa.get(resursa)
+    if chei is not None:
+        chei.discard(key)
+        if not chei:
+            del _pe_resursa[resursa]
+    ramase = _pe_client.get(obs.client_addr, 1) - 1
+    if ramase:
+        _pe_client[obs.client_addr] = ramase
+    else:
+        _pe_client.pop(obs.client_addr, None)
+    return True
+
+
+def notifica(path):
+    #apelat dupa orice modificare: resursa, tot ce e sub ea si directoarele parinte;
+    #in modul multi-proces si pentru modificarile anuntate de ceilalti workeri (sharding.py)
+    p = _cheie_resursa(path)
+    prefix = p + os.sep
+    global _prima_modificare
+    with _cond:
+        if not _pe_resursa:
+            return
+        for resursa in _pe_resursa:
+            if resursa == p or resursa.startswith(prefix) or p.startswith(resursa + os.sep):
+                _murdare.add(resursa)
+        if _murdare and _prima_modificare is None:
+            _prima_modificare = time.monotonic()
+            _cond.notify()
+
+
+def confirmare(client_addr, msg_id, reset=False):
+    #ACK/RST gol pentru o notificare; RST inseamna ca clientul nu mai observa resursa
+    with _cond:
+        for key, obs in _observatori.items():
+            if obs.client_addr == client_addr and obs.in_zbor is not None and obs.in_zbor[0] == msg_id:
+                if reset:
+                    _sterge(key)
+                else:
+                    obs.in_zbor = None
+                return True
+        return False
+
+
+def _trimite(obs, code, payload, options, now):
+    obs.seq = (obs.seq + 1) & 0xFFFFFF
+    #acelasi contor per client ca fragmentele de download: un ACK nu poate fi confundat intre ele
+    msg_id = transmisie.aloca_msg_id(obs.client_addr)
+    packet = construieste_pachet(0, code, msg_id, payload, obs.token,
+                                 [(OPT_OBSERVE, encode_uint(obs.seq))] + options)
+    if obs.in_zbor is not None:
+        #notificarea mai veche inca neconfirmata e inlocuita, dar contorul de retransmisii ramane
+        _, _, deadline, retransmisii, rto = obs.in_zbor
+        obs.in_zbor = [msg_id, packet, deadline, retransmisii, rto]
+    else:
+        rto = ACK_TIMEOUT * random.uniform(1.0, 1.5)
+        obs.in_zbor = [msg_id, packet, now + rto, 0, rto]
+    obs.sock.sendto(packet, obs.client_addr)
+    metrici.trimis(len(packet))
+
+
+def _preia_murdare():
+    #sub _cond: resursele modificate care au observatori, cu path-ul din care se construieste
+    #reprezentarea; multimea e golita, modificarile de acum incolo intra in urmatoarea notificare
+    global _prima_modificare
+    resurse = []
+    for resursa in _murdare:
+        chei = _pe_resursa.get(resursa)
+        if chei:
+            resurse.append((resursa, _observatori[next(iter(chei))].path))
+    _murdare.clear()
+    _prima_modificare = None
+    return resurse
+
+
+def _reprezentari(resurse):
+    #fara _cond: listari de directoare si stat/citiri de fisiere; upload-urile (notifica) si
+    #confirmarile nu asteapta dupa disc
+    from functii import stare_resursa  # import la executie: functii importa acest modul
+    return [(resursa, stare_resursa(path)) for resursa, path in resurse]
+
+
+def _notificari(reprezentari, now):
+    #sub _cond: o singura reprezentare per resursa modificata, trimisa observatorilor ei de acum
+    for resursa, (code, payload, options) in reprezentari:
+        chei = list(_pe_resursa.get(resursa, ()))
+        for key in chei:
+            obs = _observatori[key]
+            try:
+                _trimite(obs, code, payload, options, now)
+            except OSError as e:
+                log.warning("Eroare notificare către %s: %s", obs.client_addr, e)
+                _sterge(key)
+                continue
+            #o notificare non-2.xx (ex. 4.04 dupa stergere) incheie observarea
+            if code >= 128:
+                _sterge(key)
+        log.debug("Notificare Observe: %s → %d observatori", resursa, len(chei))
+
+
+def _retransmisii(now):
+    for key, obs in list(_observatori.items()):
+        zbor = obs.in_zbor
+        if zbor is None or now < zbor[2]:
+            continue
+        if zbor[3] >= MAX_RETRANSMIT:
+            log.info("Observator eliminat (fără ACK): %s %s", obs.client_addr, obs.path)
+            _sterge(key)
+            continue
+        zbor[3] += 1
+        zbor[4] *= 2
+        zbor[2] = now + zbor[4]
+        try:
+            obs.sock.sendto(zbor[1], obs.client_addr)
+            metrici.trimis(len(zbor[1]))
+        except OSError:
+            _sterge(key)
+
+
+def _bucla():
+    while True:
+        resurse = None
+        with _cond:
+            now = time.monotonic()
+            if _prima_modificare is not None and now >= _prima_modificare + COALESCE:
+                resurse = _preia_murdare()
+            _retransmisii(now)
+
+            if resurse is None:
+                urmator = [o.in_zbor[2] for o in _observatori.values() if o.in_zbor is not None]
+                if _prima_modificare is not None:
+                    urmator.append(_prima_modificare + COALESCE)
+                _cond.wait(max(min(urmator) - now, 0) if urmator else None)
+        if resurse:
+            reprezentari = _reprezentari(resurse)
+            with _cond:
+                _notificari(reprezentari, time.monotonic())
+
+
+def statistici():
+    with _cond:
+        return {
+            "observatori": len(_observatori),
+            "resurse": len(_pe_resursa),
+            "neconfirmate": sum(1 for o in _observatori.values() if o.in_zbor is not None),
+        }
@@ -0,0 +1,194 @@
+import logging
+import os
+import signal
+import socket
+import struct
+import threading
+import zlib
+
+import durabilitate
+import jurnal
+import observare
+
+log = logging.getLogger(__name__)
+
+#porturile interne (loopback) pe care workerii primesc datagrame redirectionate;
+#workerul i asculta pe PORT_INTERN_BAZA + i
+PORT_INTERN_BAZA = 15683
+
+#antet intern pus in fata datagramului redirectionat: ip (4 bytes) + port client
+_ANTET_INTERN = struct.Struct("!4sH")
+#adresa din antet pentru o modificare anuntata de alt worker (nu poate fi a unui client);
+#dupa antet urmeaza path-ul modificat
+_ADRESA_MODIFICARE = ("0.0.0.0", 0)
+
+#indexul workerului curent si numarul total (1 = fara sharding)
+_index = 0
+_numar = 1
+
+#socket pentru trimiterea redirectionarilor (creat in fiecare worker)
+_sock_redirectionare = None
+
+
+def configureaza(index, numar):
+    global _index, _numar, _sock_redirectionare
+    _index = index
+    _numar = numar
+    _sock_redirectionare = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+
+def activ():
+    return _numar > 1
+
+
+def index_worker():
+    return _index
+
+
+def proprietar(path):
+    #crc32 e stabil intre procese (spre deosebire de hash() pe string)
+    return zlib.crc32(path.encode("utf-8")) % _numar
+
+
+def socket_public(port):
+    #fiecare worker leaga acelasi port, kernelul distribuie clientii intre ei
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("0.0.0.0", port))
+    return sock
+
+
+def socket_intern(index):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", PORT_INTERN_BAZA + index))
+    return sock
+
+
+def _stare_upload(payload):
+    #POST fara continut, cu "session": cererea starii unui upload in curs (functii.upload_request)
+    return "session" in payload and payload.get("content") is None
+
+
+def trebuie_redirectionat(header, payload):
+    #doar fragmentele/blocurile de upload si cererile de stare pentru reluare depind de starea
+    #locala (assembler, cheie = path), restul cererilor pot fi tratate de orice worker
+    if _numar <= 1 or header.get("code") != 2 or not isinstance(payload, dict):
+        return False
+    if "fragment" not in payload and "block1" not in payload and not _stare_upload(payload):
+        return False
+    path = payload.get("path")
+    return bool(path) and proprietar(path) != _index
+
+
+def redirectioneaza(data, client_addr, path):
+    ip, port = client_addr[0], client_addr[1]
+    antet = _ANTET_INTERN.pack(socket.inet_aton(ip), port)
+    _sock_redirectionare.sendto(antet + data, ("127.0.0.1", PORT_INTERN_BAZA + proprietar(path)))
+
+
+def anunta_modificare(path):
+    #observatorii sunt inregistrati in procesul care a primit GET-ul: ceilalti workeri afla
+    #de fiecare upload/stergere/mutare facuta aici si isi notifica observatorii
+    if _numar <= 1:
+        return
+    data = _ANTET_INTERN.pack(socket.inet_aton(_ADRESA_MODIFICARE[0]), _ADRESA_MODIFICARE[1]) + path.encode("utf-8")
+    for i in range(_numar):
+        if i == _index:
+            continue
+        try:
+            _sock_redirectionare.sendto(data, ("127.0.0.1", PORT_INTERN_BAZA + i))
+        except OSError as e:
+            log.warning("Modificare neanuntata workerului %d: %s", i, e)
+
+
+def decodeaza_redirectionat(data):
+    #(datagrama originala, adresa client); o modificare anuntata de alt worker e tratata aici
+    #(notificare Observe locala, fara a o anunta din nou) si intoarce (None, None)
+    ip, port = _ANTET_INTERN.unpack_from(data)
+    client_addr = (socket.inet_ntoa(ip), port)
+    if client_addr == _ADRESA_MODIFICARE:
+        observare.notifica(str(data[_ANTET_INTERN.size:], "utf-8"))
+        return None, None
+    return data[_ANTET_INTERN.size:], client_addr
+
+
+def asculta_intern(sock_intern, sock_public, primeste_pachet):
+    #thread (mod thread) care primeste datagramele redirectionate de ceilalti workeri;
+    #raspunsul pleaca prin socketul public, deci clientul il vede de pe portul serverului
+    def bucla():
+        while True:
+            try:
+                data, _ = sock_intern.recvfrom(70000)
+                original, client_addr = decodeaza_redirectionat(data)
+                if original is not None:
+                    primeste_pachet(original, client_addr, sock_public)
+            except OSError:
+                break
+            except Exception as e:
+                log.warning("Eroare redirectionare: %s", e)
+
+    thread = threading.Thread(target=bucla, name="sharding-intern", daemon=True)
+    thread.start()
+    return thread
+
+
+def _porneste_worker(index, numar, port, ruleaza_worker):
+    pid = os.fork()
+    if pid:
+        return pid
+
+    #proces copil
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    code = 0
+    try:
+        configureaza(index, numar)
+        sock_public = socket_public(port)
+        sock_intern = socket_intern(index)
+        log.info("Worker %d (pid %d) pe port %d", index, os.getpid(), port)
+        ruleaza_worker(sock_public, sock_intern)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        log.exception("Eroare worker %d: %s", index, e)
+        code = 1
+    finally:
+        #os._exit nu ruleaza atexit: fsync-urile in asteptare si jurnalul sunt golite explicit
+        durabilitate.goleste()
+        jurnal.opreste()
+        os._exit(code)
+
+
+def _sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+
+#porneste numar procese worker (fork) si le reporneste daca unul cade
+def lanseaza(numar, port, ruleaza_worker):
+    #SIGTERM pe launcher opreste si workerii, la fel ca Ctrl+C
+    signal.signal(signal.SIGTERM, _sigterm)
+    workeri = {}
+    for i in range(numar):
+        workeri[_porneste_worker(i, numar, port, ruleaza_worker)] = i
+
+    try:
+        while workeri:
+            pid, status = os.wait()
+            index = workeri.pop(pid, None)
+            #iesire normala (ex. Ctrl+C) - nu repornim
+            if index is None or status == 0:
+                continue
+            log.warning("Worker %d (pid %d) oprit, status %d - repornire", index, pid, status)
+            workeri[_porneste_worker(index, numar, port, ruleaza_worker)] = index
+    except KeyboardInterrupt:
+        log.info("Oprire workeri")
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for pid in workeri:
+            try:
+                os.kill(pid, signal.SIGINT)
+            except ProcessLookupError:
+                pass
+        for pid in list(workeri):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
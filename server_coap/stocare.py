@@ -0,0 +1,454 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import durabilitate
+import sharding
+
+log = logging.getLogger(__name__)
+
+#backend de stocare:
+#  "fisiere" (implicit) - fiecare upload este un fisier obisnuit in storage/
+#  "chunk" - continutul e impartit in bucati de CHUNK_SIZE adresate prin SHA-256, fiecare bucata
+#            unica e scrisa o singura data in CHUNK_DIR, iar in storage/ ramane un manifest mic.
+#listarea, existenta si mutarea lucreaza pe manifeste ca pe fisiere, deci un move ramane un rename.
+#un manifest e recunoscut doar in modul chunk si doar daca poarta atributul extins XATTR_MANIFEST,
+#pus de server la publicare: un client nu poate seta atribute extinse, deci un upload care incepe
+#cu MAGIC_MANIFEST ramane continut obisnuit. Fisierele obisnuite (fara atribut) pot coexista
+CHUNK_SIZE = 64 * 1024
+#in afara storage/ (nu apare la listare), pe acelasi sistem de fisiere (os.replace atomic)
+CHUNK_DIR = ".chunks"
+MAGIC_MANIFEST = b"COAPCHUNK1\n"
+#SHA-256 al continutului, calculat la upload: in manifest (modul chunk) sau ca atribut extins
+#al fisierului obisnuit, impreuna cu marimea si mtime-ul pentru care e valabil
+XATTR_DIGEST = "user.coap.sha256"
+XATTR_MANIFEST = "user.coap.manifest"
+#identificatorul unui chunk e SHA-256-ul lui in hex; orice altceva (ex. o cale) e respins
+_ID_CHUNK = re.compile(r"[0-9a-f]{64}")
+
+_mod = "fisiere"
+#numarul de referinte (manifeste + transferuri in curs) pentru fiecare chunk;
+#nu e salvat pe disc, se reconstruieste la pornire din manifeste
+_referinte = {}
+_lock = threading.Lock()
+#inlocuirea unui manifest (citire vechi + replace) e serializata
+_lock_publicare = threading.Lock()
+
+
+class Stat:
+    #subsetul de os.stat_result folosit la download (ETag, chei de cache, limite)
+    def __init__(self, st_size, st_mtime_ns, st_offset=0):
+        self.st_size = st_size
+        self.st_mtime_ns = st_mtime_ns
+        #inceputul intervalului in fisier (Interval), 0 pentru fisierul intreg
+        self.st_offset = st_offset
+
+
+class FisierSimplu:
+    def __init__(self, fd):
+        self.fd = fd
+        self.st = os.fstat(fd)
+
+    def pread(self, size, offset):
+        #pread citeste doar intervalul cerut si nu muta pozitia fisierului
+        return os.pread(self.fd, size, offset)
+
+    def dup(self):
+        #copie independenta, inchisa separat (ex. de threadul de transmisie)
+        return FisierSimplu(os.dup(self.fd))
+
+    def digest(self):
+        #digest-ul salvat la upload, ignorat daca fisierul a fost modificat de altcineva intre timp
+        try:
+            valoare = os.getxattr(self.fd, XATTR_DIGEST).decode("ascii")
+        except (OSError, AttributeError):
+            return None
+        digest, _, versiune = valoare.partition(":")
+        if versiune != f"{self.st.st_size}:{self.st.st_mtime_ns}":
+            return None
+        return digest
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FisierChunk:
+    def __init__(self, manifest, st, retinut=False):
+        self.manifest = manifest
+        self.chunks = manifest["chunks"]
+        self.chunk = manifest["chunk"]
+        self.st = st
+        self.retinut = retinut
+
+    def pread(self, size, offset):
+        end = min(offset + size, self.st.st_size)
+        parti = []
+        while offset < end:
+            i, inceput = divmod(offset, self.chunk)
+            n = min(self.chunk - inceput, end - offset)
+            fd = os.open(_cale_chunk(self.chunks[i]), os.O_RDONLY)
+            try:
+                parti.append(os.pread(fd, n, inceput))
+            finally:
+                os.close(fd)
+            offset += n
+        return b"".join(parti)
+
+    def dup(self):
+        #chunk-urile raman pe disc cat timp copia e deschisa, chiar daca fisierul e sters intre timp
+        _retine(self.chunks)
+        return FisierChunk(self.manifest, self.st, True)
+
+    def digest(self):
+        return self.manifest.get("sha256")
+
+    def close(self):
+        if self.retinut:
+            self.retinut = False
+            _elibereaza(self.chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Interval:
+    #o parte [offset, offset + length) dintr-un cititor, vazuta ca fisier de sine statator;
+    #download-ul pe interval refoloseste astfel fragmentarea, cache-ul si retransmisiile
+    def __init__(self, fisier, offset, length):
+        self.fisier = fisier
+        self.offset = offset
+        self.file_size = fisier.st.st_size
+        self.st = Stat(length, fisier.st.st_mtime_ns, offset)
+
+    def pread(self, size, offset):
+        size = max(0, min(size, self.st.st_size - offset))
+        return self.fisier.pread(size, self.offset + offset) if size else b""
+
+    def dup(self):
+        return Interval(self.fisier.dup(), self.offset, self.st.st_size)
+
+    def digest(self):
+        #digest-ul salvat este al fisierului intreg, nu al intervalului
+        return None
+
+    def close(self):
+        self.fisier.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def configureaza(mod, storage):
+    global _mod
+    _mod = mod
+    if mod == "chunk":
+        _verifica_xattr()
+        reconstruieste(storage)
+
+
+def _verifica_xattr():
+    #manifestele sunt marcate cu un atribut extins; fara suport pentru user.* modul chunk nu porneste
+    os.makedirs(CHUNK_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=CHUNK_DIR, prefix=".tmp-")
+    try:
+        os.setxattr(fd, XATTR_MANIFEST, b"1")
+    except (OSError, AttributeError) as e:
+        raise RuntimeError(f"Modul chunk necesită atribute extinse (user.*) în {CHUNK_DIR}: {e}")
+    finally:
+        os.close(fd)
+        os.remove(tmp)
+
+
+def activ():
+    return _mod == "chunk"
+
+
+def _cale_chunk(h):
+    if not isinstance(h, str) or not _ID_CHUNK.fullmatch(h):
+        raise ValueError("Identificator de chunk invalid")
+    return os.path.join(CHUNK_DIR, h[:2], h)
+
+
+def _gc_activ():
+    #in modul multi-proces fiecare worker are propriile contoare, deci nu sterge chunk-uri;
+    #cele nefolosite sunt colectate la urmatoarea pornire (reconstruieste)
+    return not sharding.activ()
+
+
+def _retine(hashes):
+    with _lock:
+        for h in hashes:
+            _referinte[h] = _referinte.get(h, 0) + 1
+
+
+def _elibereaza(hashes):
+    with _lock:
+        for h in hashes:
+            ramase = _referinte.get(h, 0) - 1
+            if ramase > 0:
+                _referinte[h] = ramase
+                continue
+            _referinte.pop(h, None)
+            if _gc_activ():
+                try:
+                    os.remove(_cale_chunk(h))
+                except FileNotFoundError:
+                    pass
+
+
+def _scrie_atomic(path, data, dir_tmp, manifest=False, sincron=True):
+    #fisier temporar + fsync (dupa politica de durabilitate) + os.replace: cititorii vad doar continut complet;
+    #marcajul de manifest e pus pe temporar, deci apare odata cu continutul (si supravietuieste os.replace).
+    #dupa os.replace e sincronizat si directorul, altfel o cadere poate pierde intrarea noua.
+    #cu sincron=False fsync-ul ramane in grija apelantului (chunk-urile unui upload, sincronizate impreuna)
+    os.makedirs(dir_tmp, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dir_tmp, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            if manifest:
+                os.setxattr(f.fileno(), XATTR_MANIFEST, b"1")
+            if sincron:
+                durabilitate.sincronizeaza(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    if sincron:
+        durabilitate.sincronizeaza_director(os.path.dirname(path))
+
+
+def seteaza_digest(fd, digest):
+    #fisier obisnuit: digest-ul e legat de marimea si mtime-ul de acum (si supravietuieste os.replace);
+    #un sistem de fisiere fara atribute extinse pur si simplu nu are digest la download
+    st = os.fstat(fd)
+    try:
+        os.setxattr(fd, XATTR_DIGEST, f"{digest}:{st.st_size}:{st.st_mtime_ns}".encode("ascii"))
+    except (OSError, AttributeError):
+        pass
+
+
+def _adauga_chunk(data, noi):
+    #referinta se ia inainte de verificarea existentei, ca un GC concurent sa nu stearga chunk-ul;
+    #chunk-ul nou e scris fara fsync si adaugat in noi, sincronizate toate inainte de manifest
+    h = hashlib.sha256(data).hexdigest()
+    _retine((h,))
+    path = _cale_chunk(h)
+    if not os.path.exists(path):
+        _scrie_atomic(path, data, os.path.dirname(path), sincron=False)
+        noi.append(path)
+    return h
+
+
+def _este_manifest(fd):
+    #doar in modul chunk si doar fisierele publicate de server (marcate cu XATTR_MANIFEST)
+    if _mod != "chunk":
+        return False
+    try:
+        os.getxattr(fd, XATTR_MANIFEST)
+    except (OSError, AttributeError):
+        return False
+    return os.pread(fd, len(MAGIC_MANIFEST), 0) == MAGIC_MANIFEST
+
+
+def _valideaza_manifest(manifest):
+    #structura asteptata; chunk-urile trebuie sa fie identificatori SHA-256, nu cai
+    if not isinstance(manifest, dict):
+        raise ValueError("Manifest invalid")
+    chunks = manifest.get("chunks")
+    chunk = manifest.get("chunk")
+    size = manifest.get("size")
+    if (not isinstance(chunks, list) or not isinstance(chunk, int) or not isinstance(size, int)
+            or chunk <= 0 or not 0 <= size <= len(chunks) * chunk
+            or not all(isinstance(h, str) and _ID_CHUNK.fullmatch(h) for h in chunks)):
+        raise ValueError("Manifest invalid")
+    return manifest
+
+
+def _manifest_din_fd(fd):
+    continut = os.pread(fd, os.fstat(fd).st_size, 0)
+    return _valideaza_manifest(json.loads(continut[len(MAGIC_MANIFEST):]))
+
+
+def citeste_manifest(path):
+    #manifestul de la path sau None daca acolo e un fisier obisnuit (sau un manifest corupt)
+    if _mod != "chunk":
+        return None
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+    try:
+        if not _este_manifest(fd):
+            return None
+        return _manifest_din_fd(fd)
+    except ValueError as e:
+        log.warning("Manifest ignorat %s: %s", path, e)
+        return None
+    finally:
+        os.close(fd)
+
+
+def _publica(file_path, chunks, size, digest=None):
+    manifest = {"size": size, "chunk": CHUNK_SIZE, "chunks": chunks}
+    if digest is not None:
+        manifest["sha256"] = digest
+    manifest = MAGIC_MANIFEST + json.dumps(manifest).encode("utf-8")
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with _lock_publicare:
+        vechi = citeste_manifest(file_path)
+        #temporarul in CHUNK_DIR, ca sa nu apara in listarea directorului
+        _scrie_atomic(file_path, manifest, CHUNK_DIR, manifest=True)
+    if vechi is not None:
+        _elibereaza(vechi["chunks"])
+
+
+def scrie_octeti(file_path, data, digest=None):
+    #upload dintr-un singur pachet: bucatile noi sunt scrise, cele existente doar referite
+    chunks = []
+    noi = []
+    try:
+        for offset in range(0, len(data), CHUNK_SIZE):
+            chunks.append(_adauga_chunk(bytes(data[offset:offset + CHUNK_SIZE]), noi))
+        durabilitate.sincronizeaza_cai(noi)
+        _publica(file_path, chunks, len(data), digest)
+    except BaseException:
+        _elibereaza(chunks)
+        raise
+    return len(data)
+
+
+def scrie_din_fisier(tmp_path, file_path, digest=None):
+    #upload asamblat intr-un fisier temporar: citit pe bucati (inca in page cache), apoi temporarul
+    #e sters. Temporarul nu e sincronizat la asamblare in modul chunk; doar chunk-urile noi ajung pe
+    #disc, cu o singura sincronizare pentru tot upload-ul, inainte de manifest
+    chunks = []
+    noi = []
+    size = 0
+    try:
+        with open(tmp_path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                chunks.append(_adauga_chunk(data, noi))
+                size += len(data)
+        durabilitate.sincronizeaza_cai(noi)
+        _publica(file_path, chunks, size, digest)
+    except BaseException:
+        _elibereaza(chunks)
+        raise
+    os.remove(tmp_path)
+    return size
+
+
+def deschide(path):
+    #cititor pentru download: FisierSimplu sau FisierChunk, ambele cu .st, pread, dup, digest si close
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if not _este_manifest(fd):
+            return FisierSimplu(fd)
+        st = os.fstat(fd)
+        manifest = _manifest_din_fd(fd)
+    except BaseException:
+        os.close(fd)
+        raise
+    os.close(fd)
+    return FisierChunk(manifest, Stat(manifest["size"], st.st_mtime_ns))
+
+
+def stat(path):
+    #marimea reala a fisierului (si pentru manifeste)
+    st = os.stat(path)
+    manifest = citeste_manifest(path) if os.path.isfile(path) else None
+    if manifest is None:
+        return st
+    return Stat(manifest["size"], st.st_mtime_ns)
+
+
+def _manifeste(path):
+    #(cale, manifest) pentru fisierul de la path sau pentru toate fisierele de sub director
+    if _mod != "chunk":
+        return []
+    if os.path.isfile(path):
+        manifest = citeste_manifest(path)
+        return [(path, manifest)] if manifest is not None else []
+    rezultat = []
+    for radacina, _, fisiere in os.walk(path):
+        for nume in fisiere:
+            cale = os.path.join(radacina, nume)
+            manifest = citeste_manifest(cale)
+            if manifest is not None:
+                rezultat.append((cale, manifest))
+    return rezultat
+
+
+def sterge(path):
+    #sterge fisierul/directorul si elibereaza chunk-urile referite de manifestele din el
+    manifeste = _manifeste(path)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+    for _, manifest in manifeste:
+        _elibereaza(manifest["chunks"])
+
+
+def muta(source, destination):
+    #manifestele se muta ca orice fisier (doar metadate); un manifest suprascris la destinatie
+    #isi elibereaza chunk-urile
+    final = os.path.join(destination, os.path.basename(source)) if os.path.isdir(destination) else destination
+    vechi = citeste_manifest(final) if os.path.isfile(final) else None
+    shutil.move(source, destination)
+    if vechi is not None:
+        _elibereaza(vechi["chunks"])
+
+
+def reconstruieste(storage):
+    #contoarele de referinte din manifestele existente; chunk-urile fara referinte
+    #(ramase dupa o oprire in timpul unei stergeri sau din modul multi-proces) sunt sterse
+    with _lock:
+        _referinte.clear()
+    manifeste = _manifeste(storage) if os.path.isdir(storage) else []
+    for _, manifest in manifeste:
+        _retine(manifest["chunks"])
+
+    orfane = 0
+    if os.path.isdir(CHUNK_DIR):
+        for radacina, _, fisiere in os.walk(CHUNK_DIR):
+            for nume in fisiere:
+                if nume not in _referinte:
+                    os.remove(os.path.join(radacina, nume))
+                    orfane += 1
+    log.info("Chunk store: %d chunk-uri, %d manifeste, %d orfane șterse", len(_referinte), len(manifeste), orfane)
+
+
+def statistici():
+    with _lock:
+        referinte = sum(_referinte.values())
+        return {
+            "mod": _mod,
+            "chunkuri": len(_referinte),
+            "referinte": referinte,
+        }
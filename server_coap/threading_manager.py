@@ -1,84 +1,190 @@
+import logging
 import threading
 import queue
+import time
 
-# Coadă pentru răspunsuri (FIFO)
+import metrici
+
+log = logging.getLogger(__name__)
+
+#dimensiunea pool-ului de workeri pentru cereri si a cozii lor de intrare
+NUM_REQUEST_WORKERS = 8
+REQUEST_QUEUE_SIZE = 256
+#sugestie de reincercare (Max-Age, secunde) trimisa clientului la 5.03
+RETRY_MAX_AGE = 2
+
+#numar de threaduri care trimit raspunsuri si cate pachete ia fiecare dintr-o data
+NUM_RESPONSE_WORKERS = 2
+RESPONSE_BATCH = 64
+
+# Coadă pentru răspunsuri (FIFO), elemente (sock, client_addr, packet)
 response_queue = queue.Queue()
 
+#marcaj de oprire pus in coada de raspunsuri dupa ultimul raspuns real
+_STOP = None
+
+# Coadă limitată pentru cereri, golită de pool-ul de workeri
+request_queue = queue.Queue(maxsize=REQUEST_QUEUE_SIZE)
+
 #Flag pentru controlul workerului
 _running = False
 
-#referinta la worker
-_worker_thread = None
+#referinte la workerii pentru raspunsuri
+_response_threads = []
+
+#referinte la workerii pentru cereri
+_request_threads = []
+
+#contoare pentru pool (protejate de lock)
+_stats_lock = threading.Lock()
+_stats = {
+    "acceptate": 0,
+    "respinse": 0,
+    "procesate": 0,
+    "asteptare_total": 0.0,
+    "asteptare_max": 0.0,
+}
+
+#in modul async raspunsurile se trimit direct prin event loop, fara coada
+_trimitere_directa = False
 
 
 #functia pentru a evita blocarea la sendto(in caz ca e facut in main)
 def response_worker():
-    #Thread simplu - trimite răspunsuri din coadă, se ocupa doar de trimitere
-    global _running
-    while _running:
+    #trimite raspunsurile din coada in loturi, fara log per pachet
+    while True:
+        #asteptare blocanta pentru primul element, restul lotului fara asteptare
+        batch = [response_queue.get()]
         try:
-            #extragem un item din coada
-            #arunca queue empty daca nu gaseste nimic
-            item = response_queue.get(timeout=1.0)
+            while len(batch) < RESPONSE_BATCH:
+                batch.append(response_queue.get_nowait())
+        except queue.Empty:
+            pass
 
-            #extragem informatiile din itme
-            sock = item['sock']
-            client_addr = item['client_addr']
-            packet = item['packet']
+        stop = False
+        for item in batch:
+            if item is _STOP:
+                stop = True
+                continue
+            sock, client_addr, packet = item
+            try:
+                sock.sendto(packet, client_addr)
+                metrici.trimis(len(packet))
+            except Exception as e:
+                log.warning("Eroare trimitere răspuns către %s: %s", client_addr, e)
 
-            #trimitem pachetul la client
-            sock.sendto(packet, client_addr)
-            print(f"Răspuns trimis către client {client_addr}")
+        if stop:
+            #marcajul ramane in coada pentru ceilalti workeri de raspuns
+            response_queue.put(_STOP)
+            return
 
-            #incheiem operatia
-            response_queue.task_done()
+#worker din pool - scoate cereri din coada si le proceseaza
+def request_worker():
+    while _running:
+        try:
+            item = request_queue.get(timeout=1.0)
         except queue.Empty:
             continue
+
+        handler_func, header, payload, client_addr, sock, enqueued_at = item
+
+        #timpul petrecut de cerere in coada
+        asteptare = time.monotonic() - enqueued_at
+        with _stats_lock:
+            _stats["procesate"] += 1
+            _stats["asteptare_total"] += asteptare
+            if asteptare > _stats["asteptare_max"]:
+                _stats["asteptare_max"] = asteptare
+
+        try:
+            #are loc procesarea efectiva
+            handler_func(header, payload, client_addr, sock)
         except Exception as e:
-            print(f"Eroare trimitere răspuns: {e}")
+            log.exception("Eroare procesare cerere: %s", e)
+        finally:
+            request_queue.task_done()
 
-#porneste threadul pentru raspunsuri
+#porneste threadurile pentru raspunsuri si pool-ul pentru cereri
 def start_workers():
-    global _running, _worker_thread
+    global _running
     if not _running:
         #setarea flagului global
         _running = True
-        #setez functia de executie, deamon true- thread pe fundal
-        _worker_thread = threading.Thread(target=response_worker, daemon=True)
-        #pornim threadul
-        _worker_thread.start()
-        print("ResponseWorker pornit")
 
-#opreste threadul pentru raspunsuri
+        #scoatem marcajul ramas de la o oprire anterioara
+        ramase = []
+        while not response_queue.empty():
+            item = response_queue.get_nowait()
+            if item is not _STOP:
+                ramase.append(item)
+        for item in ramase:
+            response_queue.put(item)
+
+        for i in range(NUM_RESPONSE_WORKERS):
+            #deamon true- thread pe fundal
+            t = threading.Thread(target=response_worker, name=f"response-worker-{i}", daemon=True)
+            t.start()
+            _response_threads.append(t)
+        log.info("ResponseWorker pornit (%d threaduri)", NUM_RESPONSE_WORKERS)
+
+        for i in range(NUM_REQUEST_WORKERS):
+            t = threading.Thread(target=request_worker, name=f"request-worker-{i}", daemon=True)
+            t.start()
+            _request_threads.append(t)
+        log.info("Pool cereri pornit (%d workeri, coada %d)", NUM_REQUEST_WORKERS, REQUEST_QUEUE_SIZE)
+
+#opreste threadurile pentru raspunsuri si cereri
 def stop_workers():
     global _running
     _running = False
-    if _worker_thread:
+    for t in _request_threads:
+        t.join(timeout=2.0)
+    _request_threads.clear()
+
+    #raspunsurile deja puse in coada se trimit inainte de oprire
+    response_queue.put(_STOP)
+    for t in _response_threads:
         #se asteapta pana threadul se termina
-        _worker_thread.join(timeout=2.0)
-    print("ResponseWorker oprit")
+        t.join(timeout=2.0)
+    _response_threads.clear()
+    log.info("ResponseWorker oprit")
+
+#activeaza/dezactiveaza trimiterea directa (folosit de async_server)
+def set_trimitere_directa(activ):
+    global _trimitere_directa
+    _trimitere_directa = activ
 
 #punem in coada un raspuns
 def submit_response(sock, client_addr, packet):
-    response_queue.put({
-        'sock': sock,
-        'client_addr': client_addr,
-        'packet': packet
-    })
-
-#creeaza un thread nou pentru procesare, se apeleaza din pachet.py de fiecare
-#data cand este primit un pachet
-def handle_request_in_thread(handler_func, header, payload, client_addr, sock):
-    #Creează thread nou pentru fiecare cerere
-
-    def worker():
-        try:
-            #are loc procesarea efectiva
-            handler_func(header, payload, client_addr, sock)
-        except Exception as e:
-            print(f"Eroare procesare cerere: {e}")
-            import traceback
-            traceback.print_exc()
-    #se adauga worker ca target
-    thread = threading.Thread(target=worker, daemon=True)
-    thread.start()
\ No newline at end of file
+    if _trimitere_directa:
+        sock.sendto(packet, client_addr)
+        metrici.trimis(len(packet))
+        return
+    response_queue.put((sock, client_addr, packet))
+
+#pune cererea in coada pool-ului, se apeleaza din pachet.py de fiecare
+#data cand este primit un pachet; intoarce False daca coada e plina
+def submit_request(handler_func, header, payload, client_addr, sock):
+    try:
+        request_queue.put_nowait((handler_func, header, payload, client_addr, sock, time.monotonic()))
+    except queue.Full:
+        with _stats_lock:
+            _stats["respinse"] += 1
+        return False
+
+    with _stats_lock:
+        _stats["acceptate"] += 1
+    return True
+
+#contoarele pool-ului de cereri
+def statistici_pool():
+    with _stats_lock:
+        procesate = _stats["procesate"]
+        return {
+            "adancime_coada": request_queue.qsize(),
+            "acceptate": _stats["acceptate"],
+            "respinse": _stats["respinse"],
+            "procesate": procesate,
+            "asteptare_medie": _stats["asteptare_total"] / procesate if procesate else 0.0,
+            "asteptare_max": _stats["asteptare_max"],
+        }
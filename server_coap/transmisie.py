@@ -0,0 +1,314 @@
+import logging
+import random
+import threading
+import time
+
+import metrici
+from cache import CacheLRU
+
+log = logging.getLogger(__name__)
+
+#parametri de transmisie (RFC 7252 4.8 si CoCoA, draft-ietf-core-cocoa)
+ACK_TIMEOUT = 2.0          # RTO initial, pana la primul esantion RTT
+MAX_RETRANSMIT = 4
+RTO_MIN = 0.05
+RTO_MAX = 60.0
+INITIAL_WINDOW = 4         # fragmente CON in zbor la inceputul unui transfer
+MAX_WINDOW = 64
+#clientii care nu confirma fragmentele (clienti vechi) primesc tot fisierul in bucla deschisa
+PACING_FARA_ACK = 0.001
+
+
+#estimator RTT per client in stilul CoCoA: estimator "tare" (ACK la prima transmisie, K=4)
+#si "slab" (ACK dupa retransmisie, K=1), combinate intr-un RTO global
+class EstimatorRTT:
+    def __init__(self):
+        self.tare = [None, None]  # [srtt, rttvar]
+        self.slab = [None, None]
+        self.rto = ACK_TIMEOUT
+        self.srtt = None
+
+    def esantion(self, rtt, slab):
+        est = self.slab if slab else self.tare
+        if est[0] is None:
+            est[0], est[1] = rtt, rtt / 2
+        else:
+            est[1] = 0.75 * est[1] + 0.25 * abs(est[0] - rtt)
+            est[0] = 0.875 * est[0] + 0.125 * rtt
+        rto_nou = est[0] + (1 if slab else 4) * est[1]
+        pondere = 0.25 if slab else 0.5
+        self.rto = min(max(pondere * rto_nou + (1 - pondere) * self.rto, RTO_MIN), RTO_MAX)
+        if not slab:
+            self.srtt = est[0]
+
+
+def factor_backoff(rto):
+    #CoCoA: backoff variabil - mai agresiv pentru RTO mic, mai bland pentru RTO mare
+    if rto < 1.0:
+        return 3.0
+    if rto > 3.0:
+        return 1.5
+    return 2.0
+
+
+#estimatorii si clientii fara ACK sunt retinuti intre transferuri
+_estimatori = CacheLRU(1024, ttl=600)
+_fara_ack = CacheLRU(1024, ttl=3600)
+
+#Message ID-urile mesajelor CON initiate de server (fragmente, notificari Observe): un contor per
+#client (adresa + port), pornit aleator, deci doua transferuri concurente catre acelasi socket
+#nu au MID-uri comune si ACK-ul unuia nu e atribuit celuilalt
+_contoare_mid = CacheLRU(4096, ttl=600)
+_lock_mid = threading.Lock()
+
+
+def aloca_msg_id(client_addr):
+    with _lock_mid:
+        msg_id = _contoare_mid.get(client_addr)
+        msg_id = random.randrange(0x10000) if msg_id is None else (msg_id + 1) & 0xFFFF
+        _contoare_mid.put(client_addr, msg_id)
+    return msg_id
+
+
+class Fragment:
+    def __init__(self, index, packet, now, rto):
+        self.index = index
+        self.packet = packet
+        self.prima = now
+        self.retransmisii = 0
+        self.rto = rto
+        self.deadline = now + rto
+
+
+#un download fragmentat in curs catre un client
+class Transmisie:
+    def __init__(self, sock, client_addr, total, construieste, fisier, estimator, fara_ack):
+        self.sock = sock
+        self.client_addr = client_addr
+        self.total = total
+        self.construieste = construieste   # construieste(i) -> (msg_id, packet)
+        self.fisier = fisier
+        self.estimator = estimator
+        self.fara_ack = fara_ack
+        self.urmatorul = 0
+        self.rezervate = 0                 # fragmente noi rezervate in pas, construite in afara lock-ului
+        self.in_zbor = {}                  # msg_id -> Fragment
+        self.confirmate = 0
+        self.cwnd = float(INITIAL_WINDOW)
+        self.ssthresh = float(MAX_WINDOW)
+        self.urmatoarea_trimitere = 0.0
+        self.ultima_reducere = 0.0
+        self.esuat = False
+        self.inceput = time.monotonic()
+
+    def terminat(self):
+        #un fragment inca in constructie citeste din fisier: transferul nu e incheiat pana nu e gata
+        if self.rezervate:
+            return False
+        return self.esuat or (self.urmatorul >= self.total and not self.in_zbor)
+
+    def _interval(self):
+        #pacing: fereastra e intinsa uniform pe un RTT
+        if self.fara_ack:
+            return PACING_FARA_ACK
+        if self.estimator.srtt is None:
+            return 0.0
+        return self.estimator.srtt / self.cwnd
+
+    def _pierdere(self, now):
+        #cel mult o reducere a ferestrei per RTT
+        srtt = self.estimator.srtt or self.estimator.rto
+        if now - self.ultima_reducere >= srtt:
+            self.ssthresh = max(self.cwnd / 2, 2.0)
+            self.cwnd = max(self.cwnd / 2, 1.0)
+            self.ultima_reducere = now
+
+    def confirmare(self, msg_id, now):
+        fragment = self.in_zbor.pop(msg_id, None)
+        if fragment is None:
+            return
+        self.confirmate += 1
+        #esantioane doar din ACK-uri neambigue (CoCoA: slab pana la 2 retransmisii)
+        if fragment.retransmisii == 0:
+            self.estimator.esantion(now - fragment.prima, False)
+        elif fragment.retransmisii <= 2:
+            self.estimator.esantion(now - fragment.prima, True)
+
+        if self.cwnd < self.ssthresh:
+            self.cwnd += 1.0
+        else:
+            self.cwnd += 1.0 / self.cwnd
+        self.cwnd = min(self.cwnd, float(MAX_WINDOW))
+
+    def pas(self, now, in_zbor_global):
+        #(momentul urmatorului eveniment, indicii fragmentelor noi de trimis); apelat sub _cond
+        if self.esuat:
+            return None, []
+
+        #retransmisii pentru fragmentele neconfirmate la timp
+        for msg_id, fragment in list(self.in_zbor.items()):
+            if now < fragment.deadline:
+                continue
+            if self.confirmate == 0:
+                #niciun ACK pana acum: client vechi, trecem pe bucla deschisa
+                self.fara_ack = True
+                _fara_ack.put(self.client_addr[0], True)
+                for mid in self.in_zbor:
+                    in_zbor_global.pop((self.client_addr, mid), None)
+                self.in_zbor.clear()
+                break
+            if fragment.retransmisii >= MAX_RETRANSMIT:
+                log.warning("Transfer abandonat către %s: fragmentul %d neconfirmat", self.client_addr, fragment.index)
+                self.esuat = True
+                return None, []
+            fragment.retransmisii += 1
+            fragment.rto = min(fragment.rto * factor_backoff(fragment.rto), RTO_MAX)
+            fragment.deadline = now + fragment.rto
+            self.sock.sendto(fragment.packet, self.client_addr)
+            metrici.trimis(len(fragment.packet))
+            self._pierdere(now)
+
+        #fragmente noi, cat permit fereastra si pacing-ul: aici doar li se rezerva indicele si locul
+        #in fereastra, pachetele sunt construite de _bucla fara lock si trimise prin trimite()
+        indici = []
+        while self.urmatorul < self.total and now >= self.urmatoarea_trimitere:
+            if not self.fara_ack and len(self.in_zbor) + self.rezervate >= int(self.cwnd):
+                break
+            indici.append(self.urmatorul)
+            self.rezervate += 1
+            self.urmatorul += 1
+            self.urmatoarea_trimitere = now + self._interval()
+
+        #momentul urmatorului eveniment
+        urmator = [f.deadline for f in self.in_zbor.values()]
+        if self.urmatorul < self.total and (self.fara_ack or len(self.in_zbor) + self.rezervate < int(self.cwnd)):
+            urmator.append(self.urmatoarea_trimitere)
+        return (min(urmator) if urmator else None), indici
+
+    def trimite(self, index, msg_id, packet, now, in_zbor_global):
+        #fragment rezervat in pas si construit intre timp; apelat sub _cond. E inregistrat inainte
+        #de trimitere, deci ACK-ul lui il gaseste oricat de repede ar veni
+        if not self.fara_ack:
+            self.in_zbor[msg_id] = Fragment(index, packet, now, self.estimator.rto)
+            in_zbor_global[(self.client_addr, msg_id)] = self
+        self.sock.sendto(packet, self.client_addr)
+        metrici.trimis(len(packet))
+
+
+#un singur thread planifica toate transferurile; threadurile de cereri nu asteapta
+_cond = threading.Condition()
+_transferuri = []
+_in_zbor = {}          # (client_addr, msg_id) -> Transmisie
+_thread = None
+
+
+def _bucla():
+    while True:
+        de_construit = []
+        with _cond:
+            while not _transferuri:
+                _cond.wait()
+            now = time.monotonic()
+            urmator = []
+            for t in list(_transferuri):
+                try:
+                    moment, indici = t.pas(now, _in_zbor)
+                except Exception as e:
+                    log.exception("Eroare transmisie către %s: %s", t.client_addr, e)
+                    t.esuat = True
+                    moment, indici = None, []
+                if indici:
+                    de_construit.append((t, indici))
+                if t.terminat():
+                    _incheie(t)
+                elif moment is not None:
+                    urmator.append(moment)
+            if urmator and not de_construit:
+                _cond.wait(max(min(urmator) - time.monotonic(), 0))
+        for t, indici in de_construit:
+            _construieste(t, indici)
+
+
+def _construieste(t, indici):
+    #citirea de pe disc si codarea fragmentelor noi au loc fara _cond: confirmarile (si bucla
+    #async care le primeste) si pornirea altor transferuri nu asteapta dupa ele
+    for i in indici:
+        pachet = None
+        eroare = False
+        if not t.esuat:
+            try:
+                pachet = t.construieste(i)
+            except Exception as e:
+                log.exception("Eroare transmisie către %s: %s", t.client_addr, e)
+                eroare = True
+        with _cond:
+            t.rezervate -= 1
+            if eroare:
+                t.esuat = True
+            elif pachet is not None and not t.esuat:
+                try:
+                    t.trimite(i, pachet[0], pachet[1], time.monotonic(), _in_zbor)
+                except OSError as e:
+                    log.warning("Eroare transmisie către %s: %s", t.client_addr, e)
+                    t.esuat = True
+
+
+def _incheie(t):
+    _transferuri.remove(t)
+    for msg_id in t.in_zbor:
+        _in_zbor.pop((t.client_addr, msg_id), None)
+    try:
+        t.fisier.close()
+    except OSError:
+        pass
+    if not t.esuat:
+        log.debug("%d fragmente trimise → %s (%.2fs, cwnd %.1f)",
+                  t.total, t.client_addr, time.monotonic() - t.inceput, t.cwnd)
+
+
+def _porneste_thread():
+    global _thread
+    _thread = threading.Thread(target=_bucla, name="transmisie", daemon=True)
+    _thread.start()
+
+
+def porneste(sock, client_addr, total, construieste, fisier, fara_ack=False):
+    #fisier (cititor din stocare) apartine transferului si e inchis la final;
+    #construieste(i) citeste fragmentul i la cerere. fara_ack: clientul a anuntat ca nu confirma
+    #fragmentele, deci transferul e in bucla deschisa de la inceput (altfel se afla abia dupa
+    #primul RTO fara niciun ACK, iar clientul e retinut ca atare pentru transferurile urmatoare)
+    estimator = _estimatori.get(client_addr[0])
+    if estimator is None:
+        estimator = EstimatorRTT()
+        _estimatori.put(client_addr[0], estimator)
+    fara_ack = fara_ack or _fara_ack.get(client_addr[0]) is not None
+
+    t = Transmisie(sock, client_addr, total, construieste, fisier, estimator, fara_ack)
+    with _cond:
+        if _thread is None or not _thread.is_alive():
+            _porneste_thread()
+        _transferuri.append(t)
+        _cond.notify()
+    return t
+
+
+def confirmare(client_addr, msg_id, reset=False):
+    #ACK/RST gol de la client pentru un fragment CON; False daca nu apartine niciunui transfer
+    with _cond:
+        t = _in_zbor.pop((client_addr, msg_id), None)
+        if t is None:
+            #clientul confirma totusi: iese din lista clientilor fara ACK
+            _fara_ack.pop(client_addr[0])
+            return False
+        if reset:
+            #RST: clientul refuza transferul
+            t.esuat = True
+        else:
+            t.confirmare(msg_id, time.monotonic())
+        _cond.notify()
+        return True
+
+
+def in_curs():
+    with _cond:
+        return len(_transferuri)